@@ -0,0 +1,135 @@
+"""处理流程规模基准测试
+
+对 10k/100k/1M/10M 行的合成结算报告分别运行完整流程（离线查找表代替Google Sheet），
+按阶段汇总耗时，输出对比表并保存JSON结果，用于衡量每次性能改动的效果。
+
+用法:
+    python benchmarks/bench_pipeline.py --sizes 10k,100k,1M --workdir bench_data --results results.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+
+from generate_settlement import generate_settlement, build_offline_lookups  # noqa: E402
+from processor.dates import parse_dates  # noqa: E402
+from processor.google_sheets import use_offline_lookups  # noqa: E402
+from processor.pipeline import run_pipeline  # noqa: E402
+
+DEFAULT_SIZES = "10k,100k,1M,10M"
+
+
+def parse_size(text):
+    """10k / 1M / 250000 → 行数"""
+    text = text.strip().lower()
+    factor = 1
+    if text.endswith("k"):
+        factor, text = 1_000, text[:-1]
+    elif text.endswith("m"):
+        factor, text = 1_000_000, text[:-1]
+    return int(float(text) * factor)
+
+
+def prepare_input(workdir, rows, n_skus, seed, marketplace):
+    """生成（或复用已生成的）合成报告"""
+    path = os.path.join(workdir, f"settlement_{marketplace}_{rows}_{seed}.txt")
+    if not os.path.exists(path):
+        print(f"[Bench] 生成 {rows} 行合成报告 → {path}")
+        started = time.perf_counter()
+        generate_settlement(path, rows=rows, n_skus=n_skus, seed=seed, marketplace=marketplace)
+        print(f"[Bench] 生成耗时 {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def stage_totals(report):
+    """按阶段族汇总（process_order_data:202401 与 :202402 计入同一阶段）"""
+    totals = OrderedDict()
+    for span in report.spans:
+        family = span.name.split(":", 1)[0]
+        entry = totals.setdefault(family, {"wall_s": 0.0, "cpu_s": 0.0})
+        entry["wall_s"] += span.wall_s or 0.0
+        entry["cpu_s"] += span.cpu_s or 0.0
+    totals["TOTAL"] = {"wall_s": report.wall_s, "cpu_s": report.cpu_s}
+    return totals
+
+
+def run_size(path, workdir, rows, keep_output, backend="pandas"):
+    out_path = os.path.join(workdir, f"bench_{rows}.xlsx")
+    report_path = os.path.join(workdir, f"bench_{rows}.run.json")
+    dates = pd.read_csv(path, sep="\t", usecols=["posted-date"]).iloc[1:]["posted-date"]
+    dates = parse_dates(dates).dropna()
+    start, end = dates.min().to_pydatetime(), dates.max().to_pydatetime()
+
+    result = {"rows": rows, "input": path, "backend": backend}
+    try:
+        report = run_pipeline(path, out_path, start, end, report_path=report_path, backend=backend)
+        result["stages"] = stage_totals(report)
+        result["peak_rss_mb"] = report.to_dict()["peak_rss_mb"]
+    except Exception as e:
+        # 例如超出Excel行数上限，记录失败后继续下一规模
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if not keep_output and os.path.exists(out_path):
+            os.remove(out_path)
+    return result
+
+
+def print_table(results):
+    families = []
+    for result in results:
+        for family in result.get("stages", {}):
+            if family not in families:
+                families.append(family)
+    header = f"{'stage':<22}" + "".join(f"{result['rows']:>14,}" for result in results)
+    print("\n" + header)
+    print("-" * len(header))
+    for family in families:
+        cells = []
+        for result in results:
+            wall = result.get("stages", {}).get(family, {}).get("wall_s")
+            cells.append(f"{wall:>13.3f}s" if wall is not None else f"{'-':>14}")
+        print(f"{family:<22}" + "".join(cells))
+    for result in results:
+        if "error" in result:
+            print(f"[{result['rows']:,} rows] FAILED: {result['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage at several input sizes")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma separated row counts (default: {DEFAULT_SIZES})")
+    parser.add_argument("--workdir", default=os.path.join(BENCH_DIR, "data"),
+                        help="where generated inputs and outputs are kept")
+    parser.add_argument("--skus", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--marketplace", default="US")
+    parser.add_argument("--backend", default="pandas", help="computation backend (pandas / polars)")
+    parser.add_argument("--results", help="write all results to this JSON file")
+    parser.add_argument("--keep-output", action="store_true", help="keep the generated workbooks")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    use_offline_lookups(build_offline_lookups(args.skus, args.seed))
+
+    results = []
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        path = prepare_input(args.workdir, rows, args.skus, args.seed, args.marketplace)
+        print(f"[Bench] 运行 {rows:,} 行")
+        results.append(run_size(path, args.workdir, rows, args.keep_output, args.backend))
+
+    print_table(results)
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""合成结算报告生成器（Amazon V2 flat file 格式，制表符分隔）
+
+生成与真实下载文件相同列集合的结算报告：首行为结算汇总行（total-amount 等于所有
+amount 之和），其后为订单/退款/其他交易明细。支持 US（2024-01-15）和
+CA（15.01.2024）两种日期格式，按块流式写出，可生成千万行以上的文件。
+
+用法:
+    python benchmarks/generate_settlement.py out.txt --rows 1000000 --marketplace US --skus 2000 \\
+        --lookups lookups.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    "settlement-id", "settlement-start-date", "settlement-end-date", "deposit-date",
+    "total-amount", "currency", "transaction-type", "order-id", "merchant-order-id",
+    "adjustment-id", "shipment-id", "marketplace-name", "amount-type", "amount-description",
+    "amount", "fulfillment-id", "posted-date", "posted-date-time", "order-item-code",
+    "merchant-order-item-id", "merchant-adjustment-item-id", "sku", "quantity-purchased",
+    "promotion-id",
+]
+
+MARKETPLACES = {
+    "US": {"marketplace-name": "Amazon.com", "currency": "USD", "date_format": "%Y-%m-%d"},
+    "CA": {"marketplace-name": "Amazon.ca", "currency": "CAD", "date_format": "%d.%m.%Y"},
+}
+
+DEFAULT_TRANSACTION_MIX = {
+    "Order": 0.88,
+    "Refund": 0.07,
+    "other-transaction": 0.04,
+    "ServiceFee": 0.01,
+}
+
+# 订单明细行模板：(amount-type, amount-description, 出现概率组, 金额计算方式, 是否带数量)
+ORDER_COMPONENTS = [
+    ("ItemPrice", "Principal", "always", "principal", True),
+    ("ItemPrice", "Tax", "tax", "tax", False),
+    ("ItemPrice", "Shipping", "shipping", "shipping", False),
+    ("ItemPrice", "ShippingTax", "shipping_tax", "shipping_tax", False),
+    ("ItemPrice", "GiftWrap", "giftwrap", "giftwrap", False),
+    ("ItemPrice", "GiftWrapTax", "giftwrap", "giftwrap_tax", False),
+    ("ItemWithheldTax", "MarketplaceFacilitatorTax-Principal", "tax", "neg_tax", True),
+    ("ItemWithheldTax", "MarketplaceFacilitatorTax-Shipping", "shipping_tax", "neg_shipping_tax", False),
+    ("ItemWithheldTax", "MarketplaceFacilitatorTax-Other", "giftwrap", "neg_giftwrap_tax", False),
+    ("Promotion", "Principal", "promotion", "promotion", False),
+    ("Promotion", "Shipping", "shipping_promotion", "shipping_promotion", False),
+    ("ItemFees", "Commission", "always", "commission", False),
+    ("ItemFees", "FBAPerUnitFulfillmentFee", "fba", "fba_fee", False),
+]
+
+REFUND_COMPONENTS = [
+    ("ItemPrice", "Principal", "always", "neg_principal", False),
+    ("ItemPrice", "Tax", "tax", "neg_tax", False),
+    ("ItemWithheldTax", "MarketplaceFacilitatorTax-Principal", "tax", "tax", False),
+    ("ItemFees", "Commission", "always", "neg_commission", False),
+    ("ItemFees", "RefundCommission", "always", "refund_commission", False),
+]
+
+# 各概率组的默认出现概率（可通过 --component-prob 覆盖）
+DEFAULT_COMPONENT_PROBS = {
+    "always": 1.0,
+    "tax": 0.75,
+    "shipping": 0.30,
+    "shipping_tax": 0.20,
+    "giftwrap": 0.02,
+    "promotion": 0.15,
+    "shipping_promotion": 0.10,
+    "fba": 0.85,
+}
+
+OTHER_DESCRIPTIONS = [
+    "Storage Fee", "Subscription Fee", "FBA Inbound Placement Service Fee",
+    "Shipping label purchase", "FBA Removal Order: Disposal Fee",
+]
+
+
+def _amounts(kind, principal, tax_rate, shipping, rng):
+    """按模板计算金额（向量化）"""
+    n = len(principal)
+    tax = principal * tax_rate
+    shipping_tax = shipping * tax_rate
+    giftwrap = np.full(n, 3.99)
+    table = {
+        "principal": principal,
+        "neg_principal": -principal,
+        "tax": tax,
+        "neg_tax": -tax,
+        "shipping": shipping,
+        "shipping_tax": shipping_tax,
+        "neg_shipping_tax": -shipping_tax,
+        "giftwrap": giftwrap,
+        "giftwrap_tax": giftwrap * tax_rate,
+        "neg_giftwrap_tax": -giftwrap * tax_rate,
+        "promotion": -principal * rng.choice([0.05, 0.1, 0.2], size=n),
+        "shipping_promotion": -shipping,
+        "commission": -principal * 0.15,
+        "neg_commission": principal * 0.15,
+        "refund_commission": -np.minimum(principal * 0.03, 5.0),
+        "fba_fee": -rng.choice([3.22, 3.86, 4.75, 5.40, 6.08], size=n),
+    }
+    return np.round(table[kind], 2)
+
+
+def _format_ids(prefix, values, width):
+    return prefix + pd.Series(values).astype(str).str.zfill(width)
+
+
+class SettlementGenerator:
+    """按块生成结算明细行"""
+
+    def __init__(self, rows, marketplace="US", n_skus=500, n_orders=None, start_date="2024-01-01",
+                 days=61, transaction_mix=None, component_probs=None, seed=0, settlement_id=None):
+        if marketplace not in MARKETPLACES:
+            raise ValueError(f"Unknown marketplace: {marketplace} (expected {', '.join(MARKETPLACES)})")
+        self.rows = rows
+        self.market = MARKETPLACES[marketplace]
+        self.n_skus = n_skus
+        self.start_date = pd.Timestamp(start_date)
+        self.days = days
+        self.rng = np.random.default_rng(seed)
+        self.settlement_id = settlement_id or str(10000000000 + seed)
+
+        mix = dict(transaction_mix or DEFAULT_TRANSACTION_MIX)
+        total = sum(mix.values())
+        self.mix_types = list(mix)
+        self.mix_probs = np.array([mix[t] / total for t in self.mix_types])
+
+        self.probs = dict(DEFAULT_COMPONENT_PROBS)
+        self.probs.update(component_probs or {})
+
+        # 按期望每个事件的行数估算事件数量
+        rows_per_type = {
+            "Order": sum(self.probs[group] for _, _, group, _, _ in ORDER_COMPONENTS),
+            "Refund": sum(self.probs[group] for _, _, group, _, _ in REFUND_COMPONENTS),
+            "other-transaction": 1.0,
+            "ServiceFee": 1.0,
+        }
+        avg_rows = sum(p * rows_per_type.get(t, 1.0) for t, p in zip(self.mix_types, self.mix_probs))
+        self.n_events = max(1, int(round(rows / avg_rows)))
+        self.n_orders = n_orders or max(1, int(self.n_events * mix.get("Order", 0) / total))
+
+        # 每个SKU固定单价，使 product_rate 有意义
+        self.sku_prices = np.round(self.rng.uniform(8, 180, size=n_skus), 2)
+
+    def sku_names(self):
+        return [f"SKU-{i:06d}" for i in range(self.n_skus)]
+
+    def chunks(self, events_per_chunk=200_000):
+        """逐块生成明细 DataFrame（列顺序同 COLUMNS）"""
+        for first in range(0, self.n_events, events_per_chunk):
+            n = min(events_per_chunk, self.n_events - first)
+            yield self._chunk(first, n)
+
+    def _chunk(self, first, n):
+        rng = self.rng
+        event_idx = np.arange(first, first + n)
+        types = np.array(self.mix_types)[rng.choice(len(self.mix_types), size=n, p=self.mix_probs)]
+
+        order_idx = (event_idx * self.n_orders) // self.n_events
+        sku_idx = rng.integers(0, self.n_skus, size=n)
+        qty = rng.choice([1, 1, 1, 1, 2, 2, 3], size=n)
+        principal = np.round(self.sku_prices[sku_idx] * qty, 2)
+        tax_rate = rng.choice([0.0, 0.05, 0.0725, 0.08, 0.13], size=n)
+        shipping = rng.choice([4.99, 5.99, 7.49], size=n)
+        day_offset = np.sort(rng.integers(0, self.days, size=n))
+        seconds = rng.integers(0, 86400, size=n)
+
+        group_masks = {group: rng.random(n) < p for group, p in self.probs.items()}
+
+        frames = []
+        for tx_type, components in (("Order", ORDER_COMPONENTS), ("Refund", REFUND_COMPONENTS)):
+            is_type = types == tx_type
+            for position, (amount_type, description, group, kind, with_qty) in enumerate(components):
+                sel = np.flatnonzero(is_type & group_masks[group])
+                if not len(sel):
+                    continue
+                frames.append(pd.DataFrame({
+                    "_event": sel,
+                    "_pos": position,
+                    "transaction-type": tx_type,
+                    "amount-type": amount_type,
+                    "amount-description": description,
+                    "amount": _amounts(kind, principal[sel], tax_rate[sel], shipping[sel], rng),
+                    "quantity-purchased": pd.array(qty[sel], dtype="Int64") if with_qty
+                    else pd.array([pd.NA] * len(sel), dtype="Int64"),
+                }))
+
+        sel = np.flatnonzero(types == "other-transaction")
+        if len(sel):
+            frames.append(pd.DataFrame({
+                "_event": sel, "_pos": 0,
+                "transaction-type": "other-transaction",
+                "amount-type": "other-transaction",
+                "amount-description": np.array(OTHER_DESCRIPTIONS)[rng.integers(0, len(OTHER_DESCRIPTIONS), len(sel))],
+                "amount": np.round(-rng.uniform(0.5, 250, size=len(sel)), 2),
+                "quantity-purchased": pd.array([pd.NA] * len(sel), dtype="Int64"),
+            }))
+        sel = np.flatnonzero(types == "ServiceFee")
+        if len(sel):
+            frames.append(pd.DataFrame({
+                "_event": sel, "_pos": 0,
+                "transaction-type": "ServiceFee",
+                "amount-type": "Cost of Advertising",
+                "amount-description": "TransactionTotalAmount",
+                "amount": np.round(-rng.uniform(10, 2000, size=len(sel)), 2),
+                "quantity-purchased": pd.array([pd.NA] * len(sel), dtype="Int64"),
+            }))
+
+        df = pd.concat(frames, ignore_index=True).sort_values(["_event", "_pos"], kind="stable")
+        ev = df["_event"].to_numpy()
+        has_order = np.isin(df["transaction-type"].to_numpy(), ["Order", "Refund"])
+
+        order_part = order_idx[ev]
+        order_ids = ("1" + pd.Series(10 + order_part % 90).astype(str) + "-"
+                     + _format_ids("", 1000000 + order_part // 90 % 9000000, 7) + "-"
+                     + _format_ids("", (order_part * 7919) % 10000000, 7))
+        posted = self.start_date + pd.to_timedelta(day_offset[ev], unit="D")
+        posted_time = posted + pd.to_timedelta(seconds[ev], unit="s")
+        date_format = self.market["date_format"]
+
+        out = pd.DataFrame(index=range(len(df)), columns=COLUMNS, dtype=object)
+        out[:] = ""
+        out["settlement-id"] = self.settlement_id
+        out["transaction-type"] = df["transaction-type"].to_numpy()
+        out["order-id"] = np.where(has_order, order_ids.to_numpy(), "")
+        out["shipment-id"] = np.where(has_order, _format_ids("D", order_part, 8).to_numpy(), "")
+        out["adjustment-id"] = np.where(
+            df["transaction-type"].to_numpy() == "Refund", _format_ids("A", ev + first, 9).to_numpy(), "")
+        out["marketplace-name"] = np.where(has_order, self.market["marketplace-name"], "")
+        out["amount-type"] = df["amount-type"].to_numpy()
+        out["amount-description"] = df["amount-description"].to_numpy()
+        out["amount"] = df["amount"].to_numpy()
+        out["fulfillment-id"] = np.where(has_order, "AFN", "")
+        out["posted-date"] = posted.strftime(date_format)
+        out["posted-date-time"] = posted_time.strftime(date_format + " %H:%M:%S UTC")
+        out["order-item-code"] = np.where(has_order, _format_ids("", ev + first, 14).to_numpy(), "")
+        out["sku"] = np.where(has_order, _format_ids("SKU-", sku_idx[ev], 6).to_numpy(), "")
+        out["quantity-purchased"] = df["quantity-purchased"].astype(object).where(
+            df["quantity-purchased"].notna(), "").to_numpy()
+        return out
+
+    def header_row(self, total_amount):
+        """结算汇总行（真实文件中的第一行数据）"""
+        date_format = self.market["date_format"] + " %H:%M:%S UTC"
+        end = self.start_date + pd.Timedelta(days=self.days)
+        row = dict.fromkeys(COLUMNS, "")
+        row.update({
+            "settlement-id": self.settlement_id,
+            "settlement-start-date": self.start_date.strftime(date_format),
+            "settlement-end-date": end.strftime(date_format),
+            "deposit-date": (end + pd.Timedelta(days=2)).strftime(date_format),
+            "total-amount": f"{total_amount:.2f}",
+            "currency": self.market["currency"],
+        })
+        return row
+
+
+def generate_settlement(path, rows=100_000, **options):
+    """生成结算报告文件，返回 (明细行数, total-amount)
+
+    先把明细写入临时文件并累计金额，再写出带汇总行的最终文件。
+    """
+    generator = SettlementGenerator(rows, **options)
+    total = 0.0
+    written = 0
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w+", suffix=".tmp", dir=directory, delete=False,
+                                     encoding="utf-8", newline="") as body:
+        body_path = body.name
+        for chunk in generator.chunks():
+            total += float(chunk["amount"].sum())
+            written += len(chunk)
+            chunk.to_csv(body, sep="\t", header=False, index=False, float_format="%.2f")
+    try:
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            out.write("\t".join(COLUMNS) + "\n")
+            header = generator.header_row(round(total, 2))
+            out.write("\t".join(header[c] for c in COLUMNS) + "\n")
+            with open(body_path, "r", encoding="utf-8", newline="") as body:
+                shutil.copyfileobj(body, out, 16 * 1024 * 1024)
+    finally:
+        os.remove(body_path)
+    return written, round(total, 2)
+
+
+def build_offline_lookups(n_skus, seed=0):
+    """生成与合成SKU对应的离线查找表（landed_cost / pdb_us / SKU Manual Mapping）"""
+    rng = np.random.default_rng(seed + 1)
+    skus = [f"SKU-{i:06d}" for i in range(n_skus)]
+    # 多个渠道SKU映射到同一master_sku，模拟真实映射表
+    masters = [f"M-{i // 3:05d}" for i in range(n_skus)]
+    costs = np.round(rng.uniform(3, 90, size=n_skus), 2)
+    landed = {m: float(c) for m, c in zip(masters, costs) if rng.random() < 0.8}
+    pdb = {m: float(c) for m, c in zip(masters, costs)}
+    return {
+        "landed_cost": landed,
+        "pdb_us": pdb,
+        "SKU Manual Mapping": dict(zip(skus, masters)),
+    }
+
+
+def _parse_mapping(text):
+    """解析 key=value,key=value 形式的参数"""
+    result = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, _, value = item.partition("=")
+        result[key.strip()] = float(value)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Amazon settlement report")
+    parser.add_argument("output", help="output .txt path")
+    parser.add_argument("--rows", type=int, default=100_000, help="approximate number of detail rows")
+    parser.add_argument("--marketplace", choices=sorted(MARKETPLACES), default="US")
+    parser.add_argument("--skus", type=int, default=500, help="number of distinct SKUs")
+    parser.add_argument("--orders", type=int, help="number of distinct order-ids (default: one per order line)")
+    parser.add_argument("--start", default="2024-01-01", help="first posted-date (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=61, help="number of days covered")
+    parser.add_argument("--mix", help="transaction-type mix, e.g. Order=0.9,Refund=0.05,other-transaction=0.05")
+    parser.add_argument("--component-prob", help="component probabilities, e.g. shipping=0.5,promotion=0.3")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lookups", help="also write matching offline lookup tables to this JSON file")
+    args = parser.parse_args(argv)
+
+    rows, total = generate_settlement(
+        args.output, rows=args.rows, marketplace=args.marketplace, n_skus=args.skus,
+        n_orders=args.orders, start_date=args.start, days=args.days,
+        transaction_mix=_parse_mapping(args.mix) if args.mix else None,
+        component_probs=_parse_mapping(args.component_prob) if args.component_prob else None,
+        seed=args.seed,
+    )
+    print(f"Wrote {rows} rows to {args.output} (total-amount {total:.2f})")
+
+    if args.lookups:
+        with open(args.lookups, "w", encoding="utf-8") as f:
+            json.dump(build_offline_lookups(args.skus, args.seed), f)
+        print(f"Wrote offline lookups to {args.lookups}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
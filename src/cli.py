@@ -0,0 +1,454 @@
+"""命令行入口（无界面运行，供计划任务/基准测试使用）
+
+用法:
+    python src/main.py run --input settlement.txt --out report.xlsx [--from 2024-01-01] [--to 2024-01-31]
+    python src/main.py run --engine duckdb --input "2024/*.txt" --out 2024.xlsx --memory-limit 2GB
+    python src/main.py store ingest --input "settlements/*.txt"
+    python src/main.py run --from-store --from 2024-01-01 --to 2024-12-31 --out 2024.xlsx
+    python src/main.py order 113-1234567-1234567
+    python src/main.py run --input settlement.txt --out report.xlsx --results-db
+    python src/main.py results "SELECT month, SUM(\"total QTY\") FROM order_import GROUP BY month"
+    python src/main.py costs import --sheet landed_cost --effective 2024-01-01 --json landed_2024-01.json
+    python src/main.py verify-backend --input settlement.txt --backend polars
+    python src/main.py watch --dir "G:/Shared drives/AR/settlements" [--interval 60] [--once] [--no-month-cache]
+
+退出码: 0 成功, 1 处理失败, 2 参数错误
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from processor.pipeline import run_pipeline, read_settlement, get_date_bounds, parse_date, PipelineError
+from processor.backends import BACKENDS, compare_backends
+from processor.google_sheets import load_offline_lookups
+from processor.cost_history import CostHistory, COST_SHEETS
+from processor.memo import MonthCache
+from processor.outputs import FORMATS, output_directory
+from processor.results_db import RESULTS_DB
+from processor.store import SettlementStore, STORE_DIR
+from processor.watcher import watch_folder, DEFAULT_INTERVAL
+from utils.auth_utils import load_environment
+
+logger = logging.getLogger("amazon_processor")
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def _file_bounds(inputs):
+    """多个报告中posted-date的整体最小/最大日期"""
+    bounds = [get_date_bounds(path) for path in inputs]
+    bounds = [(lo, hi) for lo, hi in bounds if lo is not None]
+    if not bounds:
+        return None, None
+    return min(lo for lo, _ in bounds), max(hi for _, hi in bounds)
+
+
+def _resolve_dates(args, bounds=None):
+    """解析 --from/--to；未指定时与GUI一致，默认使用数据的日期范围（bounds() 返回）。失败时返回退出码"""
+    try:
+        start_date = parse_date(args.date_from) if args.date_from else None
+        end_date = parse_date(args.date_to) if args.date_to else None
+    except ValueError as e:
+        logger.error("Invalid date (expected YYYY-MM-DD): %s", e)
+        return EXIT_USAGE
+
+    if start_date is None or end_date is None:
+        min_date, max_date = bounds() if bounds else _file_bounds([args.input])
+        if min_date is None:
+            logger.error("No valid date data found")
+            return EXIT_FAILED
+        start_date = start_date or min_date
+        end_date = end_date or max_date
+
+    if start_date > end_date:
+        logger.error("--from %s is after --to %s", start_date.date(), end_date.date())
+        return EXIT_USAGE
+    return start_date, end_date
+
+
+def _expand_inputs(patterns):
+    """展开 --input 中的通配符（Windows命令行不会自动展开），保持给定顺序并去重"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def _cost_history(args):
+    """有成本快照时按posted-date使用当时的成本；--no-dated-costs 或离线查找表时只用当前成本表"""
+    if args.no_dated_costs or args.lookups_json:
+        return None
+    history = CostHistory()
+    return history if history.has_snapshots() else None
+
+
+def _run_options(args):
+    """watch 模式每个文件的 run_pipeline 参数（与 run 相同的成本快照和分月缓存设置）"""
+    return {
+        "cost_history": _cost_history(args),
+        "month_cache": None if args.no_month_cache else MonthCache(),
+    }
+
+
+def _log_outputs(args):
+    if "xlsx" in args.format:
+        logger.info("Report generated: %s", args.out)
+    columnar = [fmt for fmt in args.format if fmt != "xlsx"]
+    if columnar:
+        logger.info("%s files written to %s", "/".join(columnar), output_directory(args.out))
+
+
+def cmd_run(args):
+    """执行完整处理流程"""
+    if args.from_store:
+        return _run_from_store(args)
+    if not args.input:
+        logger.error("--input is required unless --from-store is given")
+        return EXIT_USAGE
+
+    inputs = _expand_inputs(args.input)
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if not inputs or missing:
+        logger.error("Input file not found: %s", ", ".join(missing or args.input))
+        return EXIT_USAGE
+    if args.update and args.engine == "duckdb":
+        logger.error("--update is not supported with --engine duckdb")
+        return EXIT_USAGE
+    if len(inputs) > 1 and args.engine != "duckdb":
+        logger.error("Multiple input files require --engine duckdb")
+        return EXIT_USAGE
+
+    dates = _resolve_dates(args, lambda: _file_bounds(inputs))
+    if isinstance(dates, int):
+        return dates
+    start_date, end_date = dates
+
+    logger.info("Processing %s (%s to %s)", ", ".join(inputs), start_date.date(), end_date.date())
+    try:
+        qty_history = SettlementStore(args.store).qty_history() if args.qty_history else None
+        cost_history = _cost_history(args)
+        if args.engine == "duckdb":
+            from processor.sql_engine import run_sql_pipeline
+            run_sql_pipeline(inputs, args.out, start_date, end_date,
+                             memory_limit=args.memory_limit, temp_directory=args.temp_dir,
+                             report_path=args.report_json, run_stats_sheet=args.run_stats_sheet,
+                             qty_history=qty_history, cost_history=cost_history, formats=args.format,
+                             results_db=args.results_db)
+        else:
+            run_pipeline(inputs[0], args.out, start_date, end_date,
+                         report_path=args.report_json, run_stats_sheet=args.run_stats_sheet,
+                         backend=args.backend, workers=args.workers, qty_history=qty_history,
+                         cost_history=cost_history, month_cache=None if args.no_month_cache else MonthCache(),
+                         update=args.update, formats=args.format, results_db=args.results_db)
+    except PipelineError as e:
+        logger.error("%s", e)
+        return EXIT_FAILED
+    except Exception:
+        logger.exception("Data processing failed")
+        return EXIT_FAILED
+
+    _log_outputs(args)
+    return EXIT_OK
+
+
+def _run_from_store(args):
+    """从本地数据仓库读取日期范围内的数据并处理"""
+    store = SettlementStore(args.store)
+
+    dates = _resolve_dates(args, store.date_bounds)
+    if isinstance(dates, int):
+        return dates
+    start_date, end_date = dates
+
+    logger.info("Processing store %s (%s to %s)", store.root, start_date.date(), end_date.date())
+    try:
+        run_pipeline(None, args.out, start_date, end_date,
+                     report_path=args.report_json, run_stats_sheet=args.run_stats_sheet,
+                     backend=args.backend, workers=args.workers, store=store,
+                     qty_history=store.qty_history(), cost_history=_cost_history(args),
+                     month_cache=None if args.no_month_cache else MonthCache(), update=args.update,
+                     formats=args.format, results_db=args.results_db)
+    except PipelineError as e:
+        logger.error("%s", e)
+        return EXIT_FAILED
+    except Exception:
+        logger.exception("Data processing failed")
+        return EXIT_FAILED
+
+    _log_outputs(args)
+    return EXIT_OK
+
+
+def cmd_store(args):
+    """导入结算文件到本地数据仓库 / 查看仓库内容"""
+    store = SettlementStore(args.store)
+
+    if args.action == "info":
+        for sid, entry in store.info().items():
+            logger.info("settlement %s: %s rows, %s", sid, entry["rows"], ", ".join(entry["partitions"]))
+        return EXIT_OK
+
+    inputs = _expand_inputs(args.input or [])
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if not inputs or missing:
+        logger.error("Input file not found: %s", ", ".join(missing or args.input or ["(none)"]))
+        return EXIT_USAGE
+    try:
+        added = sum(store.ingest(path) for path in inputs)
+    except Exception:
+        logger.exception("Ingest failed")
+        return EXIT_FAILED
+    logger.info("Ingested %d file(s), %d new row(s)", len(inputs), added)
+    return EXIT_OK
+
+
+def cmd_order(args):
+    """在本地数据仓库中查询订单的结算明细行和 order_details 记录"""
+    if not args.order_id and not args.shipment_id:
+        logger.error("Give an order-id or --shipment-id")
+        return EXIT_USAGE
+
+    from processor.order_index import order_details
+    store = SettlementStore(args.store)
+    with store.order_index() as index:
+        rows = index.lookup(args.order_id, args.shipment_id)
+    if rows.empty:
+        logger.error("No settlement rows found for %s", args.order_id or args.shipment_id)
+        return EXIT_FAILED
+
+    columns = ['settlement-id', 'posted-date', 'transaction-type', 'order-id', 'shipment-id', 'sku',
+               'amount-type', 'amount-description', 'amount', 'quantity-purchased']
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(rows[columns].to_string(index=False))
+        # SKU映射表需从Google Sheet下载，只在 --master-sku 或使用离线查找表时解析
+        details = order_details(rows, store.qty_history(), master_sku=bool(args.master_sku or args.lookups_json))
+        if details is not None and not details.empty:
+            print("\norder_details:")
+            print(details.to_string(index=False))
+    return EXIT_OK
+
+
+def cmd_results(args):
+    """在SQLite结果库上执行查询并打印结果"""
+    if not os.path.exists(args.db):
+        logger.error("Results database not found: %s (run with --results-db first)", args.db)
+        return EXIT_USAGE
+    from processor.results_db import query
+    try:
+        result = query(args.sql, path=args.db)
+    except Exception as e:
+        logger.error("Query failed: %s", e)
+        return EXIT_FAILED
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_rows', 500):
+        print(result.to_string(index=False))
+    return EXIT_OK
+
+
+def cmd_costs(args):
+    """导入历史成本快照 / 列出已有快照"""
+    history = CostHistory()
+    if args.action == "list":
+        for sheet in COST_SHEETS:
+            for date in history.snapshot_dates(sheet):
+                logger.info("%s %s: %d SKUs", sheet, date, len(history.load_snapshot(sheet, date)))
+        return EXIT_OK
+
+    if not args.sheet or not args.effective or not args.json:
+        logger.error("costs import needs --sheet, --effective and --json")
+        return EXIT_USAGE
+    try:
+        effective = parse_date(args.effective)
+    except ValueError as e:
+        logger.error("Invalid date (expected YYYY-MM-DD): %s", e)
+        return EXIT_USAGE
+    try:
+        with open(args.json, 'r', encoding='utf-8') as f:
+            mapping = {str(sku).strip(): float(cost) for sku, cost in json.load(f).items()}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.error("Cannot read cost JSON %s: %s", args.json, e)
+        return EXIT_USAGE
+    if history.record(args.sheet, mapping, effective):
+        logger.info("Saved %s snapshot effective %s (%d SKUs)", args.sheet, effective.date(), len(mapping))
+    else:
+        logger.info("%s snapshot unchanged, nothing saved", args.sheet)
+    return EXIT_OK
+
+
+def cmd_verify_backend(args):
+    """用同一份报告比较指定后端与pandas后端的输出"""
+    if not os.path.exists(args.input):
+        logger.error("Input file not found: %s", args.input)
+        return EXIT_USAGE
+
+    dates = _resolve_dates(args)
+    if isinstance(dates, int):
+        return dates
+    start_date, end_date = dates
+
+    try:
+        mismatches = compare_backends(read_settlement(args.input), start_date, end_date, args.backend)
+    except Exception:
+        logger.exception("Backend comparison failed")
+        return EXIT_FAILED
+
+    if mismatches:
+        for mismatch in mismatches:
+            logger.error("Mismatch in %s", mismatch)
+        return EXIT_FAILED
+    logger.info("Backend '%s' output is identical to pandas", args.backend)
+    return EXIT_OK
+
+
+def cmd_watch(args):
+    """监听目录，自动处理新的结算文件"""
+    if not os.path.isdir(args.dir):
+        logger.error("Directory not found: %s", args.dir)
+        return EXIT_USAGE
+
+    try:
+        processed = watch_folder(args.dir, interval=args.interval, once=args.once,
+                                 run_options=lambda: _run_options(args))
+    except KeyboardInterrupt:
+        logger.info("Watcher stopped")
+        return EXIT_OK
+    except Exception:
+        logger.exception("Watcher failed")
+        return EXIT_FAILED
+
+    logger.info("Processed %d file(s)", processed)
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="amazon_processor",
+        description="Amazon settlement report processor (headless mode)"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="enable debug logging")
+    parser.add_argument("--lookups-json",
+                        help="use cost/SKU mapping tables from a local JSON file instead of Google Sheets")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="process a settlement report into an Excel workbook")
+    run_parser.add_argument("--input", nargs="+",
+                            help="settlement report(s) (.txt, tab separated; several files or a glob "
+                                 "pattern need --engine duckdb)")
+    run_parser.add_argument("--out", required=True,
+                            help="output workbook path (.xlsx); parquet/csv files go to the same path "
+                                 "without the extension")
+    run_parser.add_argument("--format", nargs="+", choices=FORMATS, default=["xlsx"],
+                            help="output format(s): xlsx workbook and/or one parquet/csv file per sheet "
+                                 "partitioned by month (default: xlsx)")
+    run_parser.add_argument("--from", dest="date_from", help="start date YYYY-MM-DD (default: first posted-date)")
+    run_parser.add_argument("--to", dest="date_to", help="end date YYYY-MM-DD (default: last posted-date)")
+    run_parser.add_argument("--report-json", help="write the per-stage run report to this JSON file "
+                                                   "(default: ~/.amazon-processor/runs/)")
+    run_parser.add_argument("--run-stats-sheet", action="store_true",
+                            help="also add a 'Run Stats' sheet to the workbook")
+    run_parser.add_argument("--backend", choices=sorted(BACKENDS), default="pandas",
+                            help="computation backend (default: pandas)")
+    run_parser.add_argument("--workers", type=int,
+                            help="processes for multi-month runs (default: CPU count for large reports; 1 = sequential)")
+    run_parser.add_argument("--engine", choices=["memory", "duckdb"], default="memory",
+                            help="memory: load the report into pandas/polars; duckdb: run the steps as SQL "
+                                 "in an embedded database that spills to disk (requires duckdb)")
+    run_parser.add_argument("--memory-limit", help="duckdb engine memory limit, e.g. 2GB")
+    run_parser.add_argument("--temp-dir", help="duckdb engine working/spill directory (default: system temp)")
+    run_parser.add_argument("--from-store", action="store_true",
+                            help="read the date range from the local settlement store instead of --input")
+    run_parser.add_argument("--qty-history", action="store_true",
+                            help="backfill missing QTY from all settlements in the local store "
+                                 "(always on with --from-store)")
+    run_parser.add_argument("--store", default=STORE_DIR, help=f"settlement store directory (default: {STORE_DIR})")
+    run_parser.add_argument("--no-dated-costs", action="store_true",
+                            help="use today's cost tables for every month instead of the cost snapshots "
+                                 "effective on each order's posted-date")
+    run_parser.add_argument("--no-month-cache", action="store_true",
+                            help="recompute every month instead of reusing results of months whose rows "
+                                 "and lookup tables did not change")
+    run_parser.add_argument("--update", action="store_true",
+                            help="update an existing --out workbook in place: rewrite Summary and the months "
+                                 "whose data changed, keep the other month sheets")
+    run_parser.add_argument("--results-db", nargs="?", const=RESULTS_DB,
+                            help="also upsert order_details, order_import and Summary by month into a SQLite "
+                                 f"results database (default path: {RESULTS_DB})")
+    run_parser.set_defaults(func=cmd_run)
+
+    store_parser = subparsers.add_parser("store", help="ingest settlement files into the local store / show its contents")
+    store_parser.add_argument("action", choices=["ingest", "info"])
+    store_parser.add_argument("--input", nargs="+", help="settlement report(s) to ingest (glob patterns allowed)")
+    store_parser.add_argument("--store", default=STORE_DIR, help=f"settlement store directory (default: {STORE_DIR})")
+    store_parser.set_defaults(func=cmd_store)
+
+    watch_parser = subparsers.add_parser("watch", help="watch a folder and process new settlement files")
+    watch_parser.add_argument("--dir", required=True, help="folder that receives settlement downloads")
+    watch_parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                              help=f"polling interval in seconds (default: {DEFAULT_INTERVAL})")
+    watch_parser.add_argument("--once", action="store_true",
+                              help="process new/changed files once and exit")
+    watch_parser.add_argument("--no-dated-costs", action="store_true",
+                              help="use today's cost tables instead of the cost snapshots effective on each "
+                                   "order's posted-date")
+    watch_parser.add_argument("--no-month-cache", action="store_true",
+                              help="recompute every month instead of reusing cached month results")
+    watch_parser.set_defaults(func=cmd_watch)
+
+    order_parser = subparsers.add_parser(
+        "order", help="show the settlement rows and order_details record of an order from the local store")
+    order_parser.add_argument("order_id", nargs="?", help="order-id, e.g. 113-1234567-1234567")
+    order_parser.add_argument("--shipment-id", help="look up by shipment-id instead")
+    order_parser.add_argument("--store", default=STORE_DIR, help=f"settlement store directory (default: {STORE_DIR})")
+    order_parser.add_argument("--master-sku", action="store_true",
+                              help="resolve master_sku from the Google Sheets SKU mapping (needs network)")
+    order_parser.set_defaults(func=cmd_order)
+
+    results_parser = subparsers.add_parser("results", help="run a SQL query on the SQLite results database")
+    results_parser.add_argument("sql", help='e.g. "SELECT month, master_sku, SUM(\\"total QTY\\") '
+                                            'FROM order_import GROUP BY 1, 2"')
+    results_parser.add_argument("--db", default=RESULTS_DB, help=f"results database (default: {RESULTS_DB})")
+    results_parser.set_defaults(func=cmd_results)
+
+    costs_parser = subparsers.add_parser(
+        "costs", help="import a dated cost snapshot / list the saved snapshots")
+    costs_parser.add_argument("action", choices=["import", "list"])
+    costs_parser.add_argument("--sheet", choices=COST_SHEETS, help="cost table the snapshot belongs to")
+    costs_parser.add_argument("--effective", help="date the costs took effect, YYYY-MM-DD")
+    costs_parser.add_argument("--json", help='JSON file of {"sku": cost}')
+    costs_parser.set_defaults(func=cmd_costs)
+
+    verify_parser = subparsers.add_parser(
+        "verify-backend", help="check that a backend produces exactly the same tables as pandas")
+    verify_parser.add_argument("--input", required=True, help="settlement report (.txt, tab separated)")
+    verify_parser.add_argument("--from", dest="date_from", help="start date YYYY-MM-DD (default: first posted-date)")
+    verify_parser.add_argument("--to", dest="date_to", help="end date YYYY-MM-DD (default: last posted-date)")
+    verify_parser.add_argument("--backend", choices=sorted(BACKENDS), default="polars")
+    verify_parser.set_defaults(func=cmd_verify_backend)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.lookups_json:
+        load_offline_lookups(args.lookups_json)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    load_environment()  # 加载环境变量
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
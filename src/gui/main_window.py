@@ -1,27 +1,58 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from tkcalendar import Calendar
-import pandas as pd
-import numpy as np
+import importlib
+import logging
 import os
+import queue
 import sys
+import threading
+import time
 from datetime import datetime
 
-from processor.data_processing import (
-    generate_summary,
-    split_data_by_month,
-    process_qty_data,
-    process_order_data,
-    merge_order_qty
-)
 from utils.file_utils import get_resource_path
 from utils.auth_utils import load_environment
-from processor.google_sheets import load_gsheet_data
+from utils import events
+
+logger = logging.getLogger("amazon_processor")
+
+# 窗口显示后在后台线程预先导入的模块（pandas、Google API等导入耗时较长，不在启动时导入）
+_WARM_UP_MODULES = (
+    "pandas",
+    "processor.pipeline",
+    "processor.cost_history",
+    "processor.memo",
+    "processor.results_db",
+    "gspread",
+    "google_auth_oauthlib.flow",
+)
+# 设置该环境变量时在日志中输出启动耗时（首次绘制时间、后台导入各模块耗时）
+PROFILE_STARTUP_ENV = "AMAZON_PROCESSOR_PROFILE_STARTUP"
+
+
+def _warm_up(timings):
+    """后台线程：依次导入耗时的模块，记录 {模块: 秒}"""
+    for name in _WARM_UP_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning("预加载 %s 失败: %s", name, e)
+        timings[name] = time.perf_counter() - start
+
 
 class AmazonProcessor(tk.Tk):
-    def __init__(self):
+    def __init__(self, started_at=None):
         super().__init__()
+        self.started_at = started_at or time.perf_counter()
         load_environment()  # 加载环境变量
+        events.subscribe(self.show_processing_event)  # 处理层事件以弹窗显示
+        # 后台线程交给主线程执行的界面操作（Tk只能在主线程调用）
+        self._ui_queue = queue.Queue()
+        self._auth_thread = None
+        self._lookup_prefetch = None
+        self._preview_cube = None  # (文件路径, DailyCube)
+        self._warm_up_timings = {}
         
         try:
             icon_path = get_resource_path("resources/icon/app.ico")
@@ -30,19 +61,55 @@ class AmazonProcessor(tk.Tk):
             messagebox.showwarning("图标加载失败", f"错误原因: {str(e)}")
 
         self.title("US Amazon Processor v3.1")
-        self.geometry("600x470")
+        self.geometry("600x730")
         self.configure(bg="#f0f0f0")
         self.file_path = tk.StringVar()
         self.save_path = tk.StringVar()
+        self.update_existing = tk.BooleanVar(value=False)
+        self.write_parquet = tk.BooleanVar(value=False)
+        self.write_csv = tk.BooleanVar(value=False)
+        self.save_results_db = tk.BooleanVar(value=False)
         self.true_min_date = datetime(2020,1,1)
         self.true_max_date = datetime.now()
         self.create_widgets()
-        
+
+        # 窗口绘制后再预加载模块、检查认证状态
+        self.after(10, self._after_first_paint)
+        self.after(100, self._drain_ui_queue)
+
+    def _after_first_paint(self):
+        self.update_idletasks()
+        first_paint = time.perf_counter() - self.started_at
+        warm_up = threading.Thread(target=_warm_up, args=(self._warm_up_timings,), daemon=True)
+        warm_up.start()
+        if os.environ.get(PROFILE_STARTUP_ENV):
+            heavy = [name for name in ("pandas", "numpy", "gspread", "google_auth_oauthlib") if name in sys.modules]
+            logger.info("[Startup] first paint %.0f ms (heavy modules loaded before paint: %s)",
+                        first_paint * 1000, ', '.join(heavy) or 'none')
+            self.after(100, self._report_warm_up, warm_up)
         # 首次运行时检查认证状态
         self.check_auth_status()
-    
+
+    def _report_warm_up(self, warm_up):
+        if warm_up.is_alive():
+            self.after(100, self._report_warm_up, warm_up)
+            return
+        for name, seconds in self._warm_up_timings.items():
+            logger.info("[Startup] warm-up import %-28s %7.0f ms", name, seconds * 1000)
+        logger.info("[Startup] ready %.0f ms after launch", (time.perf_counter() - self.started_at) * 1000)
+
+    def _drain_ui_queue(self):
+        """执行后台线程提交的界面操作"""
+        while True:
+            try:
+                callback = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            callback()
+        self.after(100, self._drain_ui_queue)
+
     def check_auth_status(self):
-        """首次运行时检查Google认证状态"""
+        """首次运行时检查Google认证状态（授权流程在后台线程进行，窗口保持响应）"""
         app_data_dir = os.path.join(os.path.expanduser("~"), ".amazon-processor")
         token_path = os.path.join(app_data_dir, "token.pickle")
         
@@ -53,17 +120,8 @@ class AmazonProcessor(tk.Tk):
                 icon='question'
             )
             if response:
-                try:
-                    # 从auth_utils导入get_google_creds
-                    from utils.auth_utils import get_google_creds
-                    get_google_creds()  
-                    messagebox.showinfo("Authorization Successful", "All features are now available!")
-                except Exception as e:
-                    messagebox.showerror(
-                        "Authorization Failed",
-                        f"Authorization could not be completed: {str(e)}\nPlease check your internet connection and try again."
-                    )
-                    self.destroy()  # 关闭应用
+                self._auth_thread = threading.Thread(target=self._authorize, daemon=True)
+                self._auth_thread.start()
             else:
                 messagebox.showwarning(
                     "Authorization Required",
@@ -71,6 +129,38 @@ class AmazonProcessor(tk.Tk):
                 )
                 self.destroy()
 
+    def _authorize(self):
+        """后台线程：完成浏览器授权，结果交回主线程提示"""
+        try:
+            from utils.auth_utils import get_google_creds
+            get_google_creds()
+        except Exception as e:
+            self._ui_queue.put(lambda: self._authorization_failed(e))
+        else:
+            self._ui_queue.put(lambda: messagebox.showinfo("Authorization Successful",
+                                                           "All features are now available!"))
+
+    def _authorization_failed(self, error):
+        messagebox.showerror(
+            "Authorization Failed",
+            f"Authorization could not be completed: {str(error)}\nPlease check your internet connection and try again."
+        )
+        self.destroy()  # 关闭应用
+
+    def show_processing_event(self, level, title, message):
+        """处理层事件订阅者：按级别弹出对应对话框（后台线程的事件交给主线程显示）"""
+        if threading.current_thread() is not threading.main_thread():
+            self._ui_queue.put(lambda: self.show_processing_event(level, title, message))
+            return
+        if level == events.ERROR:
+            messagebox.showerror(title, message)
+        elif level == events.WARNING:
+            messagebox.showwarning(title, message)
+
+    def destroy(self):
+        events.unsubscribe(self.show_processing_event)
+        super().destroy()
+
     def create_widgets(self):
         """Create UI components"""
         file_frame = tk.LabelFrame(
@@ -98,6 +188,16 @@ class AmazonProcessor(tk.Tk):
         tk.Label(save_frame, text="Output Path:", bg="#f0f0f0").grid(row=0, column=0)
         tk.Entry(save_frame, textvariable=self.save_path, width=55).grid(row=0, column=1)
         tk.Button(save_frame, text="Browse", command=self.save_file, width=10).grid(row=0, column=2)
+        tk.Checkbutton(save_frame, text="Update existing workbook (only rewrite changed months)",
+                       variable=self.update_existing, bg="#f0f0f0").grid(row=1, column=1, sticky="w")
+        format_frame = tk.Frame(save_frame, bg="#f0f0f0")
+        format_frame.grid(row=2, column=1, sticky="w")
+        tk.Checkbutton(format_frame, text="Also write Parquet files", variable=self.write_parquet,
+                       bg="#f0f0f0").pack(side="left")
+        tk.Checkbutton(format_frame, text="Also write CSV files", variable=self.write_csv,
+                       bg="#f0f0f0").pack(side="left")
+        tk.Checkbutton(save_frame, text="Save results to SQLite database (query across months)",
+                       variable=self.save_results_db, bg="#f0f0f0").grid(row=3, column=1, sticky="w")
         
         date_frame = tk.LabelFrame(
             self, 
@@ -122,283 +222,182 @@ class AmazonProcessor(tk.Tk):
         )
         self.start_cal.grid(row=1, column=0, padx=10)
         self.end_cal.grid(row=1, column=1, padx=10)
+        self.start_cal.bind("<<CalendarSelected>>", lambda event: self.update_preview())
+        self.end_cal.bind("<<CalendarSelected>>", lambda event: self.update_preview())
+
+        self.preview_frame = tk.LabelFrame(
+            self,
+            text="Preview",
+            font=('微软雅黑',10),
+            bg="#f0f0f0",
+            padx=10,
+            pady=5
+        )
+        self.preview_frame.pack(pady=(0, 5), padx=15, fill="x")
+        columns = ("month", "rows", "amount", "orders", "top_skus")
+        self.preview_tree = ttk.Treeview(self.preview_frame, columns=columns, show="headings", height=4)
+        for col, heading, width, anchor in [("month", "Month", 70, "center"), ("rows", "Rows", 70, "e"),
+                                            ("amount", "Amount", 100, "e"), ("orders", "Orders", 60, "e"),
+                                            ("top_skus", "Top SKUs", 240, "w")]:
+            self.preview_tree.heading(col, text=heading)
+            self.preview_tree.column(col, width=width, anchor=anchor)
+        self.preview_tree.pack(fill="x")
         
         tk.Button(self, text="Submit", command=self.process_data,
                  font=('Arial',12), bg="#2196F3", fg="white",
-                 width=20).pack(pady=20)
+                 width=20).pack(pady=(20, 5))
+        tk.Button(self, text="Order Lookup", command=self.open_order_lookup,
+                 width=20).pack()
+
+    def output_formats(self):
+        """工作簿之外勾选的Parquet/CSV输出（写入输出路径去掉扩展名的目录）"""
+        formats = ["xlsx"]
+        if self.write_parquet.get():
+            formats.append("parquet")
+        if self.write_csv.get():
+            formats.append("csv")
+        return formats
+
+    def open_order_lookup(self):
+        """打开订单查询窗口（需要先用 store ingest 导入结算文件）"""
+        try:
+            from gui.order_lookup import OrderLookupDialog
+            OrderLookupDialog(self)
+        except Exception as e:
+            messagebox.showerror("Order Lookup", f"Cannot open the settlement store:\n{str(e)}")
 
     def process_data(self):
         """Enhanced data processing logic with merging"""
         if not self.file_path.get() or not self.save_path.get():
             messagebox.showwarning("Input Error", "Please select source file and save path")
             return
+        if self._auth_thread is not None and self._auth_thread.is_alive():
+            messagebox.showwarning("Authorization", "Please finish the Google authorization in your browser first")
+            return
+        from processor.pipeline import run_pipeline, PipelineError
+        from processor.cost_history import CostHistory
+        from processor.memo import MonthCache
+        from processor.results_db import RESULTS_DB
+        if self._lookup_prefetch is not None:
+            self._lookup_prefetch.join()  # 等待预加载完成，避免重复拉取Google Sheet
         
         try:
-            # 读取原始数据副本用于QTY填充
-            raw_source_df = pd.read_csv(self.file_path.get(), delimiter='\t').iloc[1:]
-            raw_source_df['posted-date'] = pd.to_datetime(raw_source_df['posted-date'], errors='coerce')
-            
-
-            # ========== 加载成本表 ==========
-            print("\n[步骤1/4] 开始加载成本数据...")
-            landed_cost_data = load_gsheet_data("landed_cost")
-            pdb_us_data = load_gsheet_data("pdb_us")
-        
-            # 检查数据完整性
-            if not landed_cost_data or not pdb_us_data:
-                messagebox.showerror(
-                    "数据缺失", 
-                    "无法加载成本表，请检查控制台错误信息"
-                )
-                return
-            print("✅ 成本数据加载完成")
-
-            # 保持原有处理流程
-            raw_df = raw_source_df.copy()
-            raw_df = raw_df.dropna(subset=['posted-date'])
-            
             start_date = datetime.strptime(self.start_cal.get_date(), "%Y-%m-%d")
             end_date = datetime.strptime(self.end_cal.get_date(), "%Y-%m-%d")
-            
-            with pd.ExcelWriter(self.save_path.get()) as writer:
-                # Generate summary tables
-                pivot_tables = generate_summary(raw_df, start_date, end_date)
-                if pivot_tables:
-                    start_row = 0
-                    for month, pivot in pivot_tables:
-                        pivot.to_excel(
-                            writer,
-                            sheet_name='Summary',
-                            index=False,
-                            startrow=start_row,
-                            float_format="%.2f"
-                        )
-                        start_row += len(pivot) + 3
-                
-                # 初始化合并结果存储
-                all_merged = []
-                
-                # Monthly processing logic
-                if start_date.month != end_date.month or start_date.year != end_date.year:
-                    monthly_data = split_data_by_month(raw_df, start_date, end_date)
-                    for month_key, month_df in monthly_data.items():
-                        month_start = month_df['posted-date'].min().to_pydatetime()
-                        month_end = month_df['posted-date'].max().to_pydatetime()
-                        
-                        # 处理QTY和Order数据
-                        qty_df, _, _ = process_qty_data(month_df, month_start, month_end)
-                        order_df = process_order_data(month_df)
-                        
-                        # 写入原有sheet
-                        qty_df.to_excel(writer, sheet_name=f"{month_key}_qty", index=False)
-                        order_df.to_excel(writer, sheet_name=f"{month_key}_order", index=False)
-                        
-                        # 执行分月合并
-                        if qty_df is not None and order_df is not None:
-                            merged_month = merge_order_qty(order_df, qty_df, raw_source_df)
-                            if merged_month is not None:
-                                merged_month.to_excel(
-                                    writer,
-                                    sheet_name=f"{month_key}_order_details",
-                                    index=False
-                                )
-                                all_merged.append(merged_month)
-
-                                if not merged_month.empty:
-                                    required_cols = ['master_sku', 'QTY', 'Total_amount']
-                                    if all(col in merged_month.columns for col in required_cols):
-                                        grouped = merged_month.groupby('master_sku', as_index=False).agg({
-                                            'QTY': 'sum',                
-                                            'Total_amount': 'sum'        
-                                        }).rename(columns={
-                                            'QTY': 'total QTY',          
-                                            'Total_amount': 'total amount'
-                                        })
-
-                                        if not grouped.empty:
-                                            # 处理除零错误
-                                            grouped['product_rate'] = np.where(
-                                                grouped['total QTY'] > 0,
-                                                (grouped['total amount'] / grouped['total QTY']).round(2),
-                                                0.0  # QTY为0时设为0
-                                            )
-                                            
-                                        # 修复的lambda表达式 - 使用正确的三元运算符语法
-                                        grouped['product_cost'] = grouped['master_sku'].apply(
-                                            lambda sku: (0.0 if str(sku).strip().lower() == "shipping" 
-                                                        else landed_cost_data.get(
-                                                            str(sku).strip(), 
-                                                            pdb_us_data.get(str(sku).strip(), None))
-                                        )
-
-                                        # 计算total_cost
-                                        grouped['total_cost'] = grouped['product_cost'] * grouped['total QTY']
-
-                                        # 添加Shipping汇总行
-                                        try:
-                                            sum_total_shipping = merged_month['Total_shipping'].sum()
-        
-                                            if sum_total_shipping != 0:
-                                                new_row = pd.DataFrame([{
-                                                    'master_sku': 'Shipping',
-                                                    'total QTY': 1,
-                                                    'total amount': sum_total_shipping,
-                                                    'product_rate': sum_total_shipping,
-                                                    'product_cost': 0,
-                                                    'total_cost': 0
-
-                                            }])
-            
-                                            # 合并新行
-                                            grouped = pd.concat([grouped, new_row], ignore_index=True)
-            
-                                        except KeyError as e:
-                                            print(f"[Warning] {month_key}_order_details 缺少Total_shipping列: {str(e)}")
-                                        except Exception as e:
-                                            print(f"[Error] 添加Shipping行失败: {str(e)}")
-
-                                        grouped.to_excel(
-                                            writer,
-                                            sheet_name=f"{month_key}_order_import",
-                                            index=False
-                                        )
-                    
-
-                    
-                                    else:
-                                        print(f"[Warning] {month_key}_order_details 缺少必要列")
-
-                else:
-                    # 处理非分月情况
-                    qty_df, _, _ = process_qty_data(self.file_path.get(), start_date, end_date)
-                    order_df = process_order_data(raw_df)
-                    
-                    # 写入原有sheet
-                    qty_df.to_excel(writer, sheet_name='qty', index=False)
-                    order_df.to_excel(writer, sheet_name='order', index=False)
-                    
-                    # 执行整体合并
-                    if qty_df is not None and order_df is not None:
-                        merged_all = merge_order_qty(order_df, qty_df, raw_source_df)
-                        if merged_all is not None:
-                            merged_all.to_excel(
-                                writer,
-                                sheet_name='order_details',
-                                index=False
-                            )
-                            all_merged.append(merged_all)
-
-                            if not merged_all.empty:
-                                required_cols = ['master_sku', 'QTY', 'Total_amount']
-                                if all(col in merged_all.columns for col in required_cols):
-                                    grouped = merged_all.groupby('master_sku', as_index=False).agg({
-                                        'QTY': 'sum',               
-                                        'Total_amount': 'sum'        
-                                    }).rename(columns={
-                                        'QTY': 'total QTY',
-                                        'Total_amount': 'total amount'
-                                    })
-
-                                    try:
-                                        if 'total QTY' in grouped.columns and 'total amount' in grouped.columns:
-                                            grouped['product_rate'] = grouped['total amount'] / grouped['total QTY']
-                                            # 处理无效值
-                                            grouped['product_rate'] = grouped['product_rate'].replace([np.inf, -np.inf], 0).fillna(0).round(2)
-                                    except Exception as e:
-                                        print(f"[Error] 计算product_rate失败: {str(e)}")
-
-                                    # 修复的lambda表达式 - 使用正确的三元运算符语法
-                                    grouped['product_cost'] = grouped['master_sku'].apply(
-                                        lambda sku: (0.0 if str(sku).strip().lower() == "shipping" 
-                                                    else landed_cost_data.get(
-                                                        str(sku).strip(), 
-                                                        pdb_us_data.get(str(sku).strip(), None)))
-                                    )
-
-                                    # 计算total_cost
-                                    grouped['total_cost'] = grouped['product_cost'] * grouped['total QTY']
-                                    
-
-                                    # 添加Shipping行逻辑
-                                    try:
-                                        # 添加Shipping行逻辑    
-                                        sum_total_shipping = merged_all['Total_shipping'].sum()
-        
-                                        if sum_total_shipping != 0:
-                                            new_row = pd.DataFrame([{
-                                                'master_sku': 'Shipping',
-                                                'total QTY': 1,
-                                                'total amount': sum_total_shipping,
-                                                'product_rate': sum_total_shipping,
-                                                'product_cost': 0,
-                                                'total_cost': 0
-                                            }])
-            
-                                            # 确保列顺序匹配
-                                            new_row = new_row[grouped.columns]
-                                            grouped = pd.concat([grouped, new_row], ignore_index=True)
-            
-                                    except KeyError as e:
-                                        print(f"[Warning] order_details 缺少Total_shipping列: {str(e)}")
-                                    except Exception as e:
-                                        print(f"[Error] 添加Shipping行失败: {str(e)}")
-
-                                    # 列顺序调整
-                                    final_columns = [
-                                        'master_sku', 
-                                        'total QTY', 
-                                        'total amount', 
-                                        'product_rate',
-                                        'product_cost', 
-                                        'total_cost'
-                                    ]
-                                    grouped = grouped[final_columns]
-
-                                    grouped.to_excel(
-                                        writer,
-                                        sheet_name='order_import',
-                                        index=False
-                                    )
-                                else:
-                                    print("[Warning] order_details 缺少必要列")
 
+            cost_history = CostHistory()
+            run_pipeline(self.file_path.get(), self.save_path.get(), start_date, end_date,
+                         cost_history=cost_history if cost_history.has_snapshots() else None,
+                         month_cache=MonthCache(), update=self.update_existing.get(),
+                         formats=self.output_formats(),
+                         results_db=RESULTS_DB if self.save_results_db.get() else None)
 
             messagebox.showinfo(
                 "Processing Complete",
                 f"Report generated successfully!\nDate range: {start_date.date()} to {end_date.date()}"
             )
             
+        except PipelineError as e:
+            messagebox.showerror("数据缺失", str(e))
         except Exception as e:
             messagebox.showerror("Processing Error", f"Data processing failed:\n{str(e)}")
 
-    def calculate_amount_sum(self, file_path):
+    def prescan_file(self, file_path):
+        """一次读取得到总金额、日期范围、行数和各站点行数（见 processor.prescan）"""
         try:
-            df = pd.read_csv(file_path, delimiter='\t')
-            return df['amount'].sum() if 'amount' in df.columns else None
+            from processor.prescan import prescan_settlement
+            return prescan_settlement(file_path)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to calculate amount:\n{str(e)}")
             return None
 
+    def load_preview(self, path):
+        """后台构建所选文件的按天聚合数据（等待完整解析完成），完成后刷新预览"""
+        self._preview_cube = None
+        self.update_preview()
+
+        def build():
+            try:
+                from processor.pipeline import daily_cube
+                cube = daily_cube(path)
+            except Exception as e:
+                logger.warning("预览数据构建失败: %s", e)
+                return
+            self._ui_queue.put(lambda: self._set_preview_cube(path, cube))
+
+        threading.Thread(target=build, name="daily_cube", daemon=True).start()
+
+    def _set_preview_cube(self, path, cube):
+        if path == self.file_path.get():
+            self._preview_cube = (path, cube)
+            self.update_preview()
+
+    def update_preview(self):
+        """按日历选择的日期范围显示各月行数、金额、订单数和金额最高的SKU"""
+        self.preview_tree.delete(*self.preview_tree.get_children())
+        if self._preview_cube is None:
+            self.preview_frame.config(text="Preview (loading...)" if self.file_path.get() else "Preview")
+            return
+        started = time.perf_counter()
+        start_date = datetime.strptime(self.start_cal.get_date(), "%Y-%m-%d")
+        end_date = datetime.strptime(self.end_cal.get_date(), "%Y-%m-%d")
+        cube = self._preview_cube[1]
+        months = cube.preview(start_date, end_date)
+        for row in months.itertuples(index=False):
+            top_skus = ", ".join(f"{sku} {amount:,.0f}" for sku, amount in row.top_skus)
+            self.preview_tree.insert("", "end", values=(str(row.month), f"{row.rows:,}", f"{row.amount:,.2f}",
+                                                        f"{row.orders:,}", top_skus))
+        elapsed = (time.perf_counter() - started) * 1000
+        self.preview_frame.config(
+            text=f"Preview {start_date.date()} ~ {end_date.date()}: "
+                 + (f"total {cube.total(start_date, end_date):,.2f}" if len(months) else "no rows")
+                 + f" ({elapsed:.0f} ms)")
+
+    def prefetch_lookups(self):
+        """后台加载成本表和SKU映射到查找表缓存，Submit时直接使用（未完成授权时不加载）"""
+        if self._auth_thread is not None and self._auth_thread.is_alive():
+            return
+        if self._lookup_prefetch is not None and self._lookup_prefetch.is_alive():
+            return
+        token_path = os.path.join(os.path.expanduser("~"), ".amazon-processor", "token.pickle")
+        if not os.path.exists(token_path):
+            return
+        from processor.google_sheets import set_lookup_cache, prefetch_lookups, SESSION_CACHE_TTL
+        set_lookup_cache(SESSION_CACHE_TTL)
+        self._lookup_prefetch = threading.Thread(target=prefetch_lookups, name="prefetch_lookups", daemon=True)
+        self._lookup_prefetch.start()
+
     def load_file(self):
         path = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt")])
         if not path: return
         self.file_path.set(path)
     
         try:
-            total_amount = self.calculate_amount_sum(path)
+            scan = self.prescan_file(path)
+            if scan is None:
+                return
+
+            total_amount = scan["total"]
+            marketplaces = ", ".join(f"{name}: {count}" for name, count in scan["marketplaces"].items())
             if total_amount and not messagebox.askyesno("Confirmation", 
-                f"Total amount: {total_amount:.2f}\nContinue processing?"):
+                f"Total amount: {total_amount:.2f}\nRows: {scan['rows']}"
+                + (f" ({marketplaces})" if marketplaces else "") + "\nContinue processing?"):
                 return
 
-            df = pd.read_csv(path, delimiter='\t', usecols=['posted-date'], dtype={'posted-date': 'string'})
-            dates = pd.to_datetime(df['posted-date'], format='%Y-%m-%d', errors='coerce').dropna()
+            # 确认后，用户选择日期和输出路径期间在后台完成完整解析和查找表加载
+            from processor.pipeline import preload_settlement
+            preload_settlement(path)
+            self.prefetch_lookups()
+            self.load_preview(path)
+
+            min_date, max_date = scan["min_date"], scan["max_date"]
         
-            if dates.empty:
+            if min_date is None:
                 messagebox.showwarning("Warning", "No valid date data found")
                 return
             
-            self.true_min_date = dates.min().to_pydatetime()
-            self.true_max_date = dates.max().to_pydatetime()
+            self.true_min_date = min_date
+            self.true_max_date = max_date
         
             # 先配置日期范围限制
             self.start_cal.config(mindate=self.true_min_date, maxdate=self.true_max_date)
@@ -411,6 +410,7 @@ class AmazonProcessor(tk.Tk):
             # 强制刷新控件
             self.start_cal.update()
             self.end_cal.update()
+            self.update_preview()
 
         
         except Exception as e:
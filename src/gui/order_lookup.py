@@ -0,0 +1,75 @@
+import tkinter as tk
+from tkinter import messagebox
+
+import pandas as pd
+
+from processor.google_sheets import set_lookup_cache, SESSION_CACHE_TTL
+from processor.order_index import order_details
+from processor.store import SettlementStore
+
+ROW_COLUMNS = [
+    'settlement-id', 'posted-date', 'transaction-type', 'shipment-id', 'sku',
+    'amount-type', 'amount-description', 'amount', 'quantity-purchased'
+]
+
+
+class OrderLookupDialog(tk.Toplevel):
+    """按 order-id / shipment-id 查询本地数据仓库中的结算明细行和 order_details 记录"""
+
+    def __init__(self, master, store_root=None):
+        super().__init__(master)
+        self.title("Order Lookup")
+        self.geometry("900x520")
+        self.configure(bg="#f0f0f0")
+        self.store = SettlementStore(store_root) if store_root else SettlementStore()
+        self.index = self.store.order_index()
+        self.qty_history = None
+        set_lookup_cache(SESSION_CACHE_TTL)  # 同一会话中反复查询时复用SKU映射表
+
+        self.query = tk.StringVar()
+        self.by_shipment = tk.BooleanVar(value=False)
+
+        search_frame = tk.Frame(self, bg="#f0f0f0")
+        search_frame.pack(fill="x", padx=10, pady=8)
+        tk.Label(search_frame, text="Order ID:", bg="#f0f0f0").pack(side="left")
+        entry = tk.Entry(search_frame, textvariable=self.query, width=40)
+        entry.pack(side="left", padx=5)
+        entry.bind("<Return>", lambda event: self.search())
+        tk.Checkbutton(search_frame, text="shipment-id", variable=self.by_shipment,
+                       bg="#f0f0f0").pack(side="left")
+        tk.Button(search_frame, text="Search", command=self.search, width=10).pack(side="left", padx=5)
+
+        self.output = tk.Text(self, font=("Consolas", 9), wrap="none")
+        self.output.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        entry.focus_set()
+
+    def search(self):
+        value = self.query.get().strip()
+        if not value:
+            return
+        try:
+            if self.by_shipment.get():
+                rows = self.index.lookup(shipment_id=value)
+            else:
+                rows = self.index.lookup(order_id=value)
+        except Exception as e:
+            messagebox.showerror("Lookup Error", f"Order lookup failed:\n{str(e)}", parent=self)
+            return
+
+        self.output.delete("1.0", tk.END)
+        if rows.empty:
+            self.output.insert(tk.END, f"No settlement rows found for {value}")
+            return
+
+        if self.qty_history is None:
+            self.qty_history = self.store.qty_history()
+        details = order_details(rows, self.qty_history)
+        with pd.option_context('display.width', 250, 'display.max_columns', None):
+            text = rows[ROW_COLUMNS].to_string(index=False)
+            if details is not None and not details.empty:
+                text += "\n\norder_details:\n" + details.to_string(index=False)
+        self.output.insert(tk.END, text)
+
+    def destroy(self):
+        self.index.close()
+        super().destroy()
@@ -1,5 +1,24 @@
-from gui.main_window import AmazonProcessor
+import time
+
+_STARTED_AT = time.perf_counter()
+
+import logging
+import multiprocessing
+import os
+import sys
 
 if __name__ == "__main__":
-    app = AmazonProcessor()
-    app.mainloop()
\ No newline at end of file
+    # 打包后的exe中进程池子进程需要此调用
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        # 带参数时以命令行模式运行（不加载Tk）
+        from cli import main
+        sys.exit(main())
+
+    # 界面模块只导入tkinter等轻量模块，pandas和Google API在窗口显示后于后台线程导入
+    from gui.main_window import AmazonProcessor, PROFILE_STARTUP_ENV
+    if os.environ.get(PROFILE_STARTUP_ENV):
+        # 启动耗时以INFO日志输出
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    app = AmazonProcessor(started_at=_STARTED_AT)
+    app.mainloop()
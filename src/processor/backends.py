@@ -0,0 +1,299 @@
+"""可切换的计算后端
+
+pipeline 通过 get_backend(name) 获取后端对象，调用与 data_processing 同名的
+generate_summary / process_qty_data / process_order_data / merge_order_qty。
+
+- pandas: 默认实现，即 data_processing 中的函数
+- polars: 可选（pip install polars pyarrow），用 Polars 惰性查询融合过滤、des-type
+  拼接、分组和连接并多线程执行；订单金额的透视求和交回 pandas 按原行顺序完成
+  （浮点累加顺序不同会产生尾差），保证输出与 pandas 路径逐单元格一致（可用 compare_backends 校验）。
+"""
+import pandas as pd
+
+from utils import events
+from . import data_processing
+from .data_processing import (
+    generate_summary,
+    process_qty_data,
+    process_order_data,
+    merge_order_qty,
+    summary_pivot,
+    pivot_order_amounts,
+    finalize_order_pivot,
+)
+from .dates import parse_dates
+from .google_sheets import add_master_sku_from_gsheet
+
+ORDER_KEYS = ['order-id', 'shipment-id', 'sku']
+ORDER_AMOUNT_TYPES = ['ItemPrice', 'ItemWithheldTax', 'Promotion']
+US_MARKETPLACE = 'Amazon.com'
+
+
+class PandasBackend:
+    """默认后端：直接使用 data_processing 中的 pandas 实现"""
+
+    name = "pandas"
+
+    def generate_summary(self, raw_df, start_date, end_date):
+        return generate_summary(raw_df, start_date, end_date)
+
+    def process_qty_data(self, input_data, start_date, end_date):
+        return process_qty_data(input_data, start_date, end_date)
+
+    def process_order_data(self, raw_df):
+        return process_order_data(raw_df)
+
+    def merge_order_qty(self, order_df, qty_df, raw_source_df=None, qty_history=None):
+        return merge_order_qty(order_df, qty_df, raw_source_df, qty_history)
+
+
+def _cents_sum(pl, column):
+    """按分求和：两位小数金额转为整数累加，避免浮点累加顺序带来的尾差
+
+    结果为整数分，转回pandas后再用 _from_cents 除以100（与逐行浮点求和的正确舍入值一致）。
+    """
+    return (pl.col(column) * 100).round(0).cast(pl.Int64).sum().alias(column)
+
+
+def _from_cents(cells, column):
+    cells[column] = cells[column].astype('float64') / 100
+    return cells
+
+
+class PolarsBackend:
+    """Polars 惰性查询后端"""
+
+    name = "polars"
+
+    def __init__(self):
+        try:
+            import polars
+        except ImportError as e:
+            raise ImportError("Polars后端需要安装 polars 和 pyarrow: pip install polars pyarrow") from e
+        self.pl = polars
+
+    def _frame(self, df, columns):
+        """只转换需要的列，减少 pandas → Arrow 的拷贝"""
+        return self.pl.from_pandas(df[[c for c in columns if c in df.columns]]).lazy()
+
+    @staticmethod
+    def _restore_dtypes(result, source_df, columns):
+        """把键列类型恢复为源数据中的 pandas 类型"""
+        for col in columns:
+            if col in result.columns and col in source_df.columns:
+                result[col] = result[col].astype(source_df[col].dtype)
+        return result
+
+    def generate_summary(self, raw_df, start_date, end_date):
+        pl = self.pl
+        try:
+            required_cols = ['transaction-type', 'amount-type', 'amount', 'posted-date']
+            missing_cols = [col for col in required_cols if col not in raw_df.columns]
+            if missing_cols:
+                events.warning("列缺失", f"缺少必要列: {', '.join(missing_cols)}")
+                return None
+
+            raw_df['posted-date'] = parse_dates(raw_df['posted-date'])
+            lf = (
+                self._frame(raw_df, required_cols)
+                .with_row_index("_row")
+                .filter(pl.col('posted-date').is_between(start_date, end_date))
+                .with_columns(pl.col('posted-date').dt.strftime('%Y-%m').alias('month'))
+            )
+            cells = (
+                lf.group_by(['month', 'amount-type', 'transaction-type'])
+                .agg(_cents_sum(pl, 'amount'), pl.col('_row').min().alias('_first'))
+                .collect()
+                .to_pandas()
+            )
+            if cells.empty:
+                return []
+            cells = _from_cents(cells, 'amount')
+            cells = self._restore_dtypes(cells, raw_df, ['amount-type', 'transaction-type'])
+
+            # 月份顺序与pandas路径一致（按首次出现顺序）
+            month_order = cells.groupby('month')['_first'].min().sort_values().index
+            pivot_tables = []
+            for month in month_order:
+                month_cells = cells[cells['month'] == month]
+                pivot_tables.append((pd.Period(month, freq='M'), summary_pivot(month_cells)))
+            return pivot_tables
+
+        except Exception as e:
+            events.error("汇总错误", f"生成汇总表失败:\n{str(e)}")
+            return None
+
+    def process_qty_data(self, input_data, start_date, end_date):
+        pl = self.pl
+        try:
+            if isinstance(input_data, str):
+                df = pd.read_csv(input_data, delimiter='\t', encoding='utf-8')
+                df = df.iloc[1:].reset_index(drop=True)
+            else:
+                df = input_data
+            dates = parse_dates(df['posted-date'])
+
+            lf = (
+                self._frame(df.assign(**{'posted-date': dates}), ORDER_KEYS + [
+                    'posted-date', 'transaction-type', 'marketplace-name',
+                    'amount-description', 'amount-type', 'quantity-purchased'
+                ])
+                .filter(
+                    pl.col('posted-date').is_between(start_date, end_date)
+                    & (pl.col('transaction-type') == 'Order')
+                    & (pl.col('marketplace-name') == US_MARKETPLACE)
+                    & (pl.col('amount-description') == 'Principal')
+                    & (pl.col('amount-type') == 'ItemPrice')
+                    & pl.all_horizontal(pl.col(ORDER_KEYS).is_not_null())
+                )
+                .group_by(ORDER_KEYS)
+                .agg(pl.col('quantity-purchased').cast(pl.Int64).sum())
+                .sort(ORDER_KEYS)
+            )
+            result = lf.collect().to_pandas()
+            result = self._restore_dtypes(result, df, ORDER_KEYS)
+            result['quantity-purchased'] = result['quantity-purchased'].astype('Int64')
+            return result.sort_values("shipment-id"), start_date, end_date
+
+        except Exception as e:
+            events.error("处理错误", f"数量表处理失败:\n{str(e)}")
+            return None, None, None
+
+    def process_order_data(self, raw_df):
+        pl = self.pl
+        try:
+            lf = (
+                self._frame(raw_df, ORDER_KEYS + [
+                    'transaction-type', 'amount-type', 'marketplace-name',
+                    'amount-description', 'amount'
+                ])
+                .filter(
+                    (pl.col('transaction-type') == 'Order')
+                    & pl.col('amount-type').is_in(ORDER_AMOUNT_TYPES)
+                    & (pl.col('marketplace-name') == US_MARKETPLACE)
+                )
+                .with_columns(
+                    pl.concat_str([pl.col('amount-description'), pl.lit(':'), pl.col('amount-type')])
+                    .alias('des-type')
+                )
+                .filter(pl.all_horizontal(pl.col(ORDER_KEYS + ['des-type']).is_not_null()))
+                .select(ORDER_KEYS + ['des-type', 'amount'])
+            )
+            rows = lf.collect().to_pandas()
+            rows = self._restore_dtypes(rows, raw_df, ORDER_KEYS)
+            rows['des-type'] = rows['des-type'].astype(raw_df['amount-type'].dtype)
+            # 过滤后的行按原顺序交给pandas透视求和：浮点累加顺序与pandas路径相同，金额逐位一致
+            return finalize_order_pivot(pivot_order_amounts(rows))
+
+        except Exception as e:
+            events.error("处理错误", f"订单表处理失败:\n{str(e)}")
+            return None
+
+    def merge_order_qty(self, order_df, qty_df, raw_source_df=None, qty_history=None):
+        pl = self.pl
+        try:
+            for df, name in [(order_df, 'Order'), (qty_df, 'QTY')]:
+                missing = [col for col in ORDER_KEYS if col not in df.columns]
+                if missing:
+                    raise ValueError(f"{name}表缺少关键列: {', '.join(missing)}")
+
+            # 右表键不唯一时连接会扩展行数，交给pandas路径处理
+            if qty_df.duplicated(ORDER_KEYS).any():
+                return merge_order_qty(order_df, qty_df, raw_source_df, qty_history)
+
+            lf = self._frame(order_df, ORDER_KEYS).join(
+                self._frame(qty_df, ORDER_KEYS + ['quantity-purchased'])
+                .with_columns(pl.col('quantity-purchased').cast(pl.Int64).alias('QTY'))
+                .drop('quantity-purchased'),
+                on=ORDER_KEYS, how='left', maintain_order='left'
+            )
+            qty = lf.collect()
+
+            missing_qty = qty['QTY'].null_count()
+            if raw_source_df is not None and missing_qty > 0:
+                # 与 fill_missing_qty 相同：用 ItemWithheldTax 行的数量补充
+                lookup = (
+                    self._frame(raw_source_df, ORDER_KEYS + ['amount-type', 'transaction-type', 'quantity-purchased'])
+                    .filter(
+                        (pl.col('amount-type') == 'ItemWithheldTax')
+                        & (pl.col('transaction-type') == 'Order')
+                        & pl.all_horizontal(pl.col(ORDER_KEYS).is_not_null())
+                    )
+                    .group_by(ORDER_KEYS)
+                    .agg(
+                        pl.when(pl.col('quantity-purchased').count() > 0)
+                        .then(pl.col('quantity-purchased').sum())
+                        .alias('补充QTY')
+                    )
+                )
+                qty = (
+                    qty.lazy()
+                    .join(lookup, on=ORDER_KEYS, how='left', maintain_order='left')
+                    .with_columns(pl.coalesce('QTY', pl.col('补充QTY').cast(pl.Int64)).alias('QTY'))
+                    .collect()
+                )
+                data_processing.logger.debug("已填充 %d 行的缺失QTY（使用sku匹配）", missing_qty)
+
+            # 与 pd.merge 的结果保持一致：新的RangeIndex、列索引无名称
+            merged_df = order_df.reset_index(drop=True)
+            merged_df.columns = merged_df.columns.rename(None)
+            merged_df['QTY'] = pd.array(qty['QTY'].to_list(), dtype='Int64')
+            if raw_source_df is not None and missing_qty > 0:
+                if qty_history is not None:
+                    merged_df['QTY'] = qty_history.fill(merged_df, merged_df['QTY'])
+                merged_df['QTY'] = merged_df['QTY'].fillna(0)
+            merged_df = add_master_sku_from_gsheet(merged_df)
+
+            columns = [col for col in merged_df.columns if col != 'master_sku'] + ['master_sku']
+            return merged_df[columns]
+
+        except Exception as e:
+            events.error("合并错误", f"数据处理失败：\n{str(e)}")
+            return None
+
+
+BACKENDS = {
+    "pandas": PandasBackend,
+    "polars": PolarsBackend,
+}
+
+
+def get_backend(name="pandas"):
+    """按名称获取后端实例"""
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"未知计算后端: {name}（可选: {', '.join(BACKENDS)}）")
+    return backend_cls()
+
+
+def compare_backends(raw_source_df, start_date, end_date, candidate, reference="pandas"):
+    """用同一份数据分别运行两个后端，返回不一致的结果名称列表（空列表表示完全一致）"""
+    backends = [get_backend(reference), get_backend(candidate)]
+    raw_df = raw_source_df.dropna(subset=['posted-date'])
+    results = []
+    for backend in backends:
+        summary = backend.generate_summary(raw_df.copy(), start_date, end_date) or []
+        qty_df, _, _ = backend.process_qty_data(raw_df, start_date, end_date)
+        order_df = backend.process_order_data(raw_df)
+        merged = backend.merge_order_qty(order_df, qty_df, raw_source_df)
+        results.append({
+            'summary': summary,
+            'qty': qty_df,
+            'order': order_df,
+            'order_details': merged,
+        })
+
+    mismatches = []
+    expected, actual = results
+    for name in expected:
+        try:
+            if name == 'summary':
+                assert [str(m) for m, _ in expected[name]] == [str(m) for m, _ in actual[name]]
+                for (_, a), (_, b) in zip(expected[name], actual[name]):
+                    pd.testing.assert_frame_equal(a, b, check_exact=True)
+            else:
+                pd.testing.assert_frame_equal(expected[name], actual[name], check_exact=True)
+        except AssertionError as e:
+            mismatches.append(f"{name}: {e}")
+    return mismatches
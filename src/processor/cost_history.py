@@ -0,0 +1,145 @@
+"""按生效日期保存的成本快照（landed_cost / pdb_us）
+
+每次从Google Sheet加载成本表时，如果内容与最近一次快照不同，就以当天为生效日期保存一份：
+
+    ~/.amazon-processor/cost_snapshots/<表名>/<YYYY-MM-DD>.json    {sku: cost}
+
+也可以用 `costs import` 导入历史成本。生成order_import时按每个订单行的posted-date
+对 master_sku 做 as-of 连接（merge_asof，取生效日期不晚于posted-date的最近快照），
+重跑历史月份时使用当时的成本而不是今天的成本。早于第一份快照的订单使用最早的快照。
+"""
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("amazon_processor")
+
+COST_DIR = os.path.join(os.path.expanduser("~"), ".amazon-processor", "cost_snapshots")
+COST_SHEETS = ("landed_cost", "pdb_us")
+
+_SNAPSHOT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.json$")
+
+
+class CostHistory:
+    """成本快照目录"""
+
+    def __init__(self, root=COST_DIR):
+        self.root = root
+        self._frames = {}
+
+    def _sheet_dir(self, sheet_name):
+        return os.path.join(self.root, sheet_name)
+
+    def snapshot_dates(self, sheet_name):
+        directory = self._sheet_dir(sheet_name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(m.group(1) for m in map(_SNAPSHOT_RE.match, os.listdir(directory)) if m)
+
+    def version(self):
+        """全部快照文件的 (表名, 日期, 修改时间, 大小)，用作缓存键的一部分"""
+        version = []
+        for sheet in COST_SHEETS:
+            for date in self.snapshot_dates(sheet):
+                stat = os.stat(os.path.join(self._sheet_dir(sheet), f"{date}.json"))
+                version.append((sheet, date, stat.st_mtime_ns, stat.st_size))
+        return version
+
+    def has_snapshots(self):
+        return any(self.snapshot_dates(sheet) for sheet in COST_SHEETS)
+
+    def load_snapshot(self, sheet_name, date):
+        with open(os.path.join(self._sheet_dir(sheet_name), f"{date}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def record(self, sheet_name, mapping, effective_date=None):
+        """保存成本快照；与生效日期之前最近的快照内容相同时不保存。返回是否保存"""
+        if not mapping:
+            return False
+        date = (effective_date or datetime.now()).strftime("%Y-%m-%d")
+        directory = self._sheet_dir(sheet_name)
+        path = os.path.join(directory, f"{date}.json")
+        dates = self.snapshot_dates(sheet_name)
+        earlier = [d for d in dates if d < date]
+        if earlier and self.load_snapshot(sheet_name, earlier[-1]) == mapping:
+            # 当天改动后又改回：删除当天的快照
+            if date in dates:
+                os.remove(path)
+                self._frames.pop(sheet_name, None)
+            return False
+        if date in dates and self.load_snapshot(sheet_name, date) == mapping:
+            return False
+
+        os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(mapping, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        self._frames.pop(sheet_name, None)
+        return True
+
+    def frame(self, sheet_name):
+        """全部快照的长表 [effective_date, sku, cost]（按生效日期排序）"""
+        if sheet_name not in self._frames:
+            rows = [
+                pd.DataFrame({'sku': list(mapping), 'cost': list(mapping.values())}).assign(
+                    effective_date=pd.Timestamp(date))
+                for date in self.snapshot_dates(sheet_name)
+                for mapping in [self.load_snapshot(sheet_name, date)]
+            ]
+            frame = (pd.concat(rows, ignore_index=True) if rows
+                     else pd.DataFrame({'sku': [], 'cost': [], 'effective_date': pd.to_datetime([])}))
+            frame['sku'] = frame['sku'].astype(str)
+            frame['cost'] = frame['cost'].astype('float64')
+            frame['effective_date'] = frame['effective_date'].astype('datetime64[ns]')
+            self._frames[sheet_name] = frame.sort_values('effective_date', kind='stable')
+        return self._frames[sheet_name]
+
+    def _asof(self, sheet_name, lines, direction='backward'):
+        snapshots = self.frame(sheet_name)
+        if snapshots.empty:
+            return pd.Series(np.nan, index=lines.index)
+        matched = pd.merge_asof(lines, snapshots, left_on='posted-date', right_on='effective_date',
+                                by='sku', direction=direction)
+        return pd.Series(matched['cost'].to_numpy(), index=lines.index)
+
+    def cost_asof(self, skus, dates):
+        """每行 (master_sku, posted-date) 生效的成本：landed_cost 优先，其次 pdb_us，Shipping为0，找不到为NaN"""
+        lines = pd.DataFrame({
+            'sku': skus.astype(str).str.strip().to_numpy(),
+            'posted-date': pd.to_datetime(dates).to_numpy(),
+        })
+        lines['posted-date'] = lines['posted-date'].astype('datetime64[ns]')
+        # 没有日期的行按最新成本计算
+        lines['posted-date'] = lines['posted-date'].fillna(pd.Timestamp.max.normalize())
+        lines = lines.sort_values('posted-date', kind='stable')
+
+        # 先在两张表中取posted-date当时生效的成本；两张表都没有更早的快照时才用最早的快照
+        cost = self._asof('landed_cost', lines)
+        cost = cost.fillna(self._asof('pdb_us', lines))
+        if cost.isna().any():
+            cost = cost.fillna(self._asof('landed_cost', lines, 'forward'))
+            cost = cost.fillna(self._asof('pdb_us', lines, 'forward'))
+        cost[lines['sku'].str.lower() == 'shipping'] = 0.0
+        return cost.sort_index().to_numpy()
+
+
+def record_cost_snapshot(sheet_name, mapping):
+    """从Google Sheet加载成本表后调用：内容有变化时保存当天的快照（失败不影响处理）"""
+    if sheet_name not in COST_SHEETS:
+        return
+    try:
+        CostHistory().record(sheet_name, mapping)
+    except OSError as e:
+        logger.warning("成本快照保存失败: %s", e)
+
+
+def order_line_dates(df):
+    """订单行 (order-id, shipment-id, sku) 的posted-date（取 Order 交易中最早的日期）"""
+    keys = ['order-id', 'shipment-id', 'sku']
+    orders = df.loc[df['transaction-type'] == 'Order', keys + ['posted-date']]
+    return orders.groupby(keys, as_index=False)['posted-date'].min()
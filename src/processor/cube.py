@@ -0,0 +1,117 @@
+"""按天预聚合的结算数据：加载报告后构建一次，任意日期范围的统计只需汇总少量单元格
+
+    cells   (posted-date, marketplace-name, transaction-type, amount-type, amount-description)
+            → amount（按分求和）、rows、first_row（首次出现的行号，用于保持月份顺序）
+    orders  Order 交易的 (posted-date, order-id) 去重对，用于统计订单数
+    skus    Order 交易的 (posted-date, sku) → amount，用于统计金额最高的SKU
+
+posted-date 是不含时间的日期，按天筛选与逐行按日期筛选的结果相同。Summary透视表、
+日期范围的金额合计和GUI预览都从这里汇总，不再逐行扫描原始数据。
+"""
+import numpy as np
+import pandas as pd
+
+from .data_processing import summary_pivot
+
+CUBE_KEYS = ['posted-date', 'marketplace-name', 'transaction-type', 'amount-type', 'amount-description']
+
+
+def _cents(amount):
+    """两位小数金额转为整数分（与 polars 后端的按分求和一致，累加不产生浮点尾差）"""
+    return (pd.to_numeric(amount, errors='coerce').fillna(0) * 100).round().astype('int64')
+
+
+class DailyCube:
+    """按天聚合的结算数据立方体"""
+
+    def __init__(self, cells, orders, skus):
+        self.cells = cells
+        self.orders = orders
+        self.skus = skus
+
+    @classmethod
+    def build(cls, raw_df):
+        """从 read_settlement 的结果构建（没有的维度列按空值处理）"""
+        df = pd.DataFrame({
+            col: raw_df[col] if col in raw_df.columns else pd.Series(np.nan, index=raw_df.index, dtype=object)
+            for col in CUBE_KEYS
+        })
+        df['amount'] = _cents(raw_df['amount'])
+        df['rows'] = 1
+        df['first_row'] = np.arange(len(df))
+        cells = (
+            df.groupby(CUBE_KEYS, dropna=False, sort=False)
+            .agg(amount=('amount', 'sum'), rows=('rows', 'sum'), first_row=('first_row', 'min'))
+            .reset_index()
+        )
+        cells['month'] = cells['posted-date'].dt.to_period('M')
+
+        is_order = raw_df['transaction-type'] == 'Order'
+        order_rows = raw_df.loc[is_order & raw_df['posted-date'].notna()]
+        orders = order_rows[['posted-date', 'order-id']].dropna().drop_duplicates()
+        orders = pd.DataFrame({
+            'posted-date': orders['posted-date'].to_numpy(),
+            'month': orders['posted-date'].dt.to_period('M').to_numpy(),
+            'order': pd.factorize(orders['order-id'])[0],
+        })
+        skus = (
+            pd.DataFrame({
+                'posted-date': order_rows['posted-date'],
+                'sku': order_rows['sku'],
+                'amount': _cents(order_rows['amount']),
+            })
+            .dropna(subset=['sku'])
+            .groupby(['posted-date', 'sku'], sort=False)['amount'].sum()
+            .reset_index()
+        )
+        skus['month'] = skus['posted-date'].dt.to_period('M')
+        return cls(cells, orders, skus)
+
+    # ========== 查询 ==========
+    @staticmethod
+    def _in_range(dates, start_date, end_date):
+        return (dates >= start_date) & (dates <= end_date)
+
+    def total(self, start_date=None, end_date=None):
+        """amount合计；给出日期范围时只计该范围（否则包括没有posted-date的行）"""
+        cells = self.cells
+        if start_date is not None:
+            cells = cells[self._in_range(cells['posted-date'], start_date, end_date)]
+        return int(cells['amount'].sum()) / 100
+
+    def summary(self, start_date, end_date):
+        """与 generate_summary 相同的各月 amount-type × transaction-type 透视表 [(月份, 透视表), ...]
+
+        月份按在报告中首次出现的顺序排列。
+        """
+        cells = self.cells[self._in_range(self.cells['posted-date'], start_date, end_date)]
+        if cells.empty:
+            return []
+        cells = cells.assign(amount=cells['amount'] / 100)
+        month_order = cells.groupby('month')['first_row'].min().sort_values().index
+        return [(month, summary_pivot(cells[cells['month'] == month])) for month in month_order]
+
+    def preview(self, start_date, end_date, top=3):
+        """日期范围内各月的行数、金额、订单数和金额最高的SKU
+
+        返回 DataFrame（month, rows, amount, orders, top_skus），月份按时间排序；
+        top_skus 为 [(sku, 金额), ...]。
+        """
+        cells = self.cells[self._in_range(self.cells['posted-date'], start_date, end_date)]
+        if cells.empty:
+            return pd.DataFrame(columns=['month', 'rows', 'amount', 'orders', 'top_skus'])
+        months = cells.groupby('month', sort=True).agg(rows=('rows', 'sum'), amount=('amount', 'sum'))
+        months['amount'] = months['amount'] / 100
+
+        orders = self.orders[self._in_range(self.orders['posted-date'], start_date, end_date)]
+        months['orders'] = orders.groupby('month')['order'].nunique()
+
+        skus = self.skus[self._in_range(self.skus['posted-date'], start_date, end_date)]
+        sku_totals = skus.groupby(['month', 'sku'])['amount'].sum()
+        top_skus = {}
+        for month, group in sku_totals.groupby(level=0):
+            best = group.nlargest(top)
+            top_skus[month] = [(sku, amount / 100) for (_, sku), amount in best.items()]
+        months['top_skus'] = [top_skus.get(month, []) for month in months.index]
+        months['orders'] = months['orders'].fillna(0).astype('int64')
+        return months.reset_index()
@@ -1,12 +1,19 @@
+import logging
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from tkinter import messagebox
 
+from utils import events
+from .dates import parse_dates
 from .google_sheets import add_master_sku_from_gsheet
 
-def fill_missing_qty(merged_df, raw_source_df):
-    """填充缺失的QTY值（新增sku匹配条件）"""
+logger = logging.getLogger("amazon_processor")
+
+def fill_missing_qty(merged_df, raw_source_df, qty_history=None):
+    """填充缺失的QTY值（新增sku匹配条件）
+
+    本文件中找不到时，再查询 qty_history（已导入历史结算的数量索引，见 processor.store.QtyHistory）。
+    """
     try:
         # 仅处理QTY为空的情况
         mask = merged_df['QTY'].isna()
@@ -24,9 +31,10 @@ def fill_missing_qty(merged_df, raw_source_df):
         ]
         
         # 计算补充数量（新增sku分组）
+        # 没有数量的行求和结果保持为空（而不是0），以便继续查询历史数量
         qty_lookup = source_data.groupby(
             ['order-id', 'shipment-id', 'sku']  # 新增sku分组
-        )['quantity-purchased'].sum().reset_index()
+        )['quantity-purchased'].sum(min_count=1).reset_index()
         qty_lookup.rename(columns={'quantity-purchased': '补充QTY'}, inplace=True)
         
         # 合并补充数据（新增sku匹配）
@@ -38,18 +46,21 @@ def fill_missing_qty(merged_df, raw_source_df):
         )
         
         # 填充逻辑保持不变
-        filled_df['QTY'] = filled_df['QTY'].fillna(filled_df['补充QTY']).fillna(0)
+        filled_df['QTY'] = filled_df['QTY'].fillna(filled_df['补充QTY'])
+        if qty_history is not None:
+            filled_df['QTY'] = qty_history.fill(filled_df, filled_df['QTY'])
+        filled_df['QTY'] = filled_df['QTY'].fillna(0)
         filled_df.drop(columns=['补充QTY'], inplace=True)
         
-        print(f"[Debug] 已填充 {len(fill_rows)} 行的缺失QTY（使用sku匹配）")
+        logger.debug("已填充 %d 行的缺失QTY（使用sku匹配）", len(fill_rows))
         return filled_df
         
     except Exception as e:
-        messagebox.showwarning("QTY填充错误", f"填充缺失数量失败:\n{str(e)}")
+        events.warning("QTY填充错误", f"填充缺失数量失败:\n{str(e)}")
         return merged_df
 
-def merge_order_qty(order_df, qty_df, raw_source_df=None):
-    """合并 Order 和 QTY 数据（新增master_sku列）"""
+def merge_order_qty(order_df, qty_df, raw_source_df=None, qty_history=None, master_sku=True):
+    """合并 Order 和 QTY 数据（新增master_sku列；master_sku=False 时不查询SKU映射表，该列为空）"""
     try:
         merge_keys = ['order-id', 'shipment-id', 'sku']
         
@@ -73,31 +84,47 @@ def merge_order_qty(order_df, qty_df, raw_source_df=None):
         
         # 数量填充
         if raw_source_df is not None:
-            merged_df = fill_missing_qty(merged_df, raw_source_df)
+            merged_df = fill_missing_qty(merged_df, raw_source_df, qty_history)
         
         # 添加master_sku列
-        merged_df = add_master_sku_from_gsheet(merged_df)
+        if master_sku:
+            merged_df = add_master_sku_from_gsheet(merged_df)
+        else:
+            merged_df['master_sku'] = None
         
         # 列顺序调整（确保master_sku在第一列）
         columns = [col for col in merged_df.columns if col != 'master_sku'] + ['master_sku']
-        print(f"[Debug] 最终列顺序：{columns}")
+        logger.debug("最终列顺序：%s", columns)
         
         return merged_df[columns]
         
     except Exception as e:
-        messagebox.showerror("合并错误", f"数据处理失败：\n{str(e)}")
+        events.error("合并错误", f"数据处理失败：\n{str(e)}")
         return None
 
+def summary_pivot(month_df):
+    """单月 amount-type × transaction-type 金额透视表（含Grand Total）"""
+    pivot = month_df.pivot_table(
+        index=['amount-type'],
+        columns=['transaction-type'],
+        values='amount',
+        aggfunc='sum',
+        fill_value=0,
+        margins=True,
+        margins_name='Grand Total'
+    )
+    return pivot.round(2).reset_index()
+
 def generate_summary(raw_df, start_date, end_date):
     """生成交易类型汇总表"""
     try:
         required_cols = ['transaction-type', 'amount-type', 'amount', 'posted-date']
         missing_cols = [col for col in required_cols if col not in raw_df.columns]
         if missing_cols:
-            messagebox.showwarning("列缺失", f"缺少必要列: {', '.join(missing_cols)}")
+            events.warning("列缺失", f"缺少必要列: {', '.join(missing_cols)}")
             return None
         
-        raw_df['posted-date'] = pd.to_datetime(raw_df['posted-date'], errors='coerce')
+        raw_df['posted-date'] = parse_dates(raw_df['posted-date'])
         raw_df = raw_df.dropna(subset=['posted-date'])
         
         mask = (raw_df['posted-date'] >= start_date) & (raw_df['posted-date'] <= end_date)
@@ -109,26 +136,16 @@ def generate_summary(raw_df, start_date, end_date):
         pivot_tables = []
         for month in months:
             month_df = df[df['month'] == month]
-            pivot = month_df.pivot_table(
-                index=['amount-type'],
-                columns=['transaction-type'],
-                values='amount',
-                aggfunc='sum',
-                fill_value=0,
-                margins=True,
-                margins_name='Grand Total'
-            )
-            pivot_tables.append((month, pivot.round(2).reset_index()))
+            pivot_tables.append((month, summary_pivot(month_df)))
         
         return pivot_tables
         
     except Exception as e:
-        messagebox.showerror("汇总错误", f"生成汇总表失败:\n{str(e)}")
+        events.error("汇总错误", f"生成汇总表失败:\n{str(e)}")
         return None
 
-def split_data_by_month(df, start_date, end_date):
-    """智能分月处理函数"""
-    monthly_data = {}
+def iter_month_ranges(start_date, end_date):
+    """按自然月切分日期范围，依次返回 (YYYYMM, 月内起始日, 月内结束日)"""
     current_date = start_date
     while current_date <= end_date:
         month_start = datetime(current_date.year, current_date.month, 1)
@@ -137,13 +154,16 @@ def split_data_by_month(df, start_date, end_date):
         effective_start = max(current_date, month_start)
         effective_end = min(end_date, month_end)
         
-        mask = (df['posted-date'] >= effective_start) & (df['posted-date'] <= effective_end)
-        month_df = df[mask].copy()
-        
-        month_key = effective_start.strftime("%Y%m")
-        monthly_data[month_key] = month_df
+        yield effective_start.strftime("%Y%m"), effective_start, effective_end
         
         current_date = effective_end + pd.DateOffset(days=1)
+
+def split_data_by_month(df, start_date, end_date):
+    """智能分月处理函数"""
+    monthly_data = {}
+    for month_key, effective_start, effective_end in iter_month_ranges(start_date, end_date):
+        mask = (df['posted-date'] >= effective_start) & (df['posted-date'] <= effective_end)
+        monthly_data[month_key] = df[mask].copy()
     
     return monthly_data
 
@@ -156,11 +176,7 @@ def process_qty_data(input_data, start_date, end_date):
         else:
             df = input_data.copy()
 
-        df['posted-date'] = pd.to_datetime(
-            df['posted-date'], 
-            format='%Y-%m-%d',
-            errors='coerce'
-        )
+        df['posted-date'] = parse_dates(df['posted-date'])
         df = df.dropna(subset=['posted-date'])
         
         mask = (df['posted-date'] >= start_date) & (df['posted-date'] <= end_date)
@@ -195,7 +211,7 @@ def process_qty_data(input_data, start_date, end_date):
         )["quantity-purchased"].sum().sort_values("shipment-id"), start_date, end_date
 
     except Exception as e:
-        messagebox.showerror("处理错误", f"数量表处理失败:\n{str(e)}")
+        events.error("处理错误", f"数量表处理失败:\n{str(e)}")
         return None, None, None
 
 def process_order_data(raw_df):
@@ -219,76 +235,82 @@ def process_order_data(raw_df):
         df = df.drop(columns=[c for c in cols_to_drop if c in df.columns])
         
         df['des-type'] = df['amount-description'] + ":" + df['amount-type']
-        pivot_df = df.pivot_table(
-            index=['order-id', 'shipment-id', 'sku'],
-            columns='des-type',
-            values='amount',
-            aggfunc='sum',
-            fill_value=0
-        ).reset_index()
+        return finalize_order_pivot(pivot_order_amounts(df))
 
-        required_columns = [
-            "Principal:ItemPrice", "Principal:Promotion",
-            "Tax:ItemPrice", "MarketplaceFacilitatorTax-Principal:ItemWithheldTax",
-            "MarketplaceFacilitatorVAT-Principal:ItemWithheldTax",
-            "LowValueGoodsTax-Principal:ItemWithheldTax",
-            "Shipping:ItemPrice", "Shipping:Promotion",
-            "GiftWrap:ItemPrice", "GiftWrap:Promotion",
-            "GiftWrapTax:ItemPrice", "MarketplaceFacilitatorTax-Other:ItemWithheldTax"
-        ]
+    except Exception as e:
+        events.error("处理错误", f"订单表处理失败:\n{str(e)}")
+        return None
 
-        existing_columns = pivot_df.columns.tolist()
-        for col in required_columns:
-            if col not in existing_columns:
-                pivot_df[col] = 0
+def pivot_order_amounts(df):
+    """按订单键透视 des-type 金额"""
+    return df.pivot_table(
+        index=['order-id', 'shipment-id', 'sku'],
+        columns='des-type',
+        values='amount',
+        aggfunc='sum',
+        fill_value=0
+    ).reset_index()
 
-        pivot_df['Product Amount'] = pivot_df['Principal:ItemPrice'] + pivot_df['Principal:Promotion']
-        pivot_df = pivot_df.drop(['Principal:ItemPrice', 'Principal:Promotion'], axis=1, errors='ignore')
+def finalize_order_pivot(pivot_df):
+    """由透视结果计算商品/税/运费/礼品包装金额列"""
+    required_columns = [
+        "Principal:ItemPrice", "Principal:Promotion",
+        "Tax:ItemPrice", "MarketplaceFacilitatorTax-Principal:ItemWithheldTax",
+        "MarketplaceFacilitatorVAT-Principal:ItemWithheldTax",
+        "LowValueGoodsTax-Principal:ItemWithheldTax",
+        "Shipping:ItemPrice", "Shipping:Promotion",
+        "GiftWrap:ItemPrice", "GiftWrap:Promotion",
+        "GiftWrapTax:ItemPrice", "MarketplaceFacilitatorTax-Other:ItemWithheldTax"
+    ]
 
-        product_tax_cols = [
-            'Tax:ItemPrice',
-            'MarketplaceFacilitatorTax-Principal:ItemWithheldTax',
-            'MarketplaceFacilitatorVAT-Principal:ItemWithheldTax',
-            'LowValueGoodsTax-Principal:ItemWithheldTax'
-        ]
-        pivot_df['Product Tax'] = pivot_df[product_tax_cols].sum(axis=1)
-        pivot_df = pivot_df.drop(product_tax_cols, axis=1, errors='ignore')
+    existing_columns = pivot_df.columns.tolist()
+    for col in required_columns:
+        if col not in existing_columns:
+            pivot_df[col] = 0
 
-        pivot_df['Shipping'] = pivot_df['Shipping:ItemPrice'] + pivot_df['Shipping:Promotion']
-        pivot_df = pivot_df.drop(['Shipping:ItemPrice', 'Shipping:Promotion'], axis=1, errors='ignore')
+    pivot_df['Product Amount'] = pivot_df['Principal:ItemPrice'] + pivot_df['Principal:Promotion']
+    pivot_df = pivot_df.drop(['Principal:ItemPrice', 'Principal:Promotion'], axis=1, errors='ignore')
 
-        pivot_df['Giftwrap'] = pivot_df['GiftWrap:ItemPrice'] + pivot_df['GiftWrap:Promotion']
-        pivot_df = pivot_df.drop(['GiftWrap:ItemPrice', 'GiftWrap:Promotion'], axis=1, errors='ignore')
+    product_tax_cols = [
+        'Tax:ItemPrice',
+        'MarketplaceFacilitatorTax-Principal:ItemWithheldTax',
+        'MarketplaceFacilitatorVAT-Principal:ItemWithheldTax',
+        'LowValueGoodsTax-Principal:ItemWithheldTax'
+    ]
+    pivot_df['Product Tax'] = pivot_df[product_tax_cols].sum(axis=1)
+    pivot_df = pivot_df.drop(product_tax_cols, axis=1, errors='ignore')
 
-        giftwrap_tax_cols = [
-            'GiftWrapTax:ItemPrice',
-            'MarketplaceFacilitatorTax-Other:ItemWithheldTax'
-        ]
-        pivot_df['Giftwrap Tax'] = pivot_df[giftwrap_tax_cols].sum(axis=1)
-        pivot_df = pivot_df.drop(giftwrap_tax_cols, axis=1, errors='ignore')
+    pivot_df['Shipping'] = pivot_df['Shipping:ItemPrice'] + pivot_df['Shipping:Promotion']
+    pivot_df = pivot_df.drop(['Shipping:ItemPrice', 'Shipping:Promotion'], axis=1, errors='ignore')
 
-        pivot_df['Total_amount'] = pivot_df[['Product Tax', 'Product Amount', 'Giftwrap', 'Giftwrap Tax']].sum(axis=1)
-        
-        if 'Shipping Tax' not in pivot_df.columns:
-            pivot_df['Shipping Tax'] = 0
-        pivot_df['Total_shipping'] = pivot_df['Shipping'] + pivot_df['Shipping Tax']
+    pivot_df['Giftwrap'] = pivot_df['GiftWrap:ItemPrice'] + pivot_df['GiftWrap:Promotion']
+    pivot_df = pivot_df.drop(['GiftWrap:ItemPrice', 'GiftWrap:Promotion'], axis=1, errors='ignore')
 
-        pivot_df['tax_rate'] = np.where(
-            pivot_df['Product Amount'] != 0,
-            (pivot_df['Product Tax'] / pivot_df['Product Amount']).round(2),
-            0
-        )
-        pivot_df['tax_rate'] = pivot_df['tax_rate'].apply(lambda x: f"{x:.0%}")
+    giftwrap_tax_cols = [
+        'GiftWrapTax:ItemPrice',
+        'MarketplaceFacilitatorTax-Other:ItemWithheldTax'
+    ]
+    pivot_df['Giftwrap Tax'] = pivot_df[giftwrap_tax_cols].sum(axis=1)
+    pivot_df = pivot_df.drop(giftwrap_tax_cols, axis=1, errors='ignore')
 
-        final_columns = [
-            'order-id', 'shipment-id', 'sku',
-            'Product Amount', 'Product Tax', 'tax_rate',
-            'Shipping', 'Shipping Tax', 'Total_shipping',
-            'Giftwrap', 'Giftwrap Tax', 'Total_amount'
-        ]
-        
-        return pivot_df[final_columns].sort_values("shipment-id")
+    pivot_df['Total_amount'] = pivot_df[['Product Tax', 'Product Amount', 'Giftwrap', 'Giftwrap Tax']].sum(axis=1)
+    
+    if 'Shipping Tax' not in pivot_df.columns:
+        pivot_df['Shipping Tax'] = 0
+    pivot_df['Total_shipping'] = pivot_df['Shipping'] + pivot_df['Shipping Tax']
 
-    except Exception as e:
-        messagebox.showerror("处理错误", f"订单表处理失败:\n{str(e)}")
-        return None
\ No newline at end of file
+    pivot_df['tax_rate'] = np.where(
+        pivot_df['Product Amount'] != 0,
+        (pivot_df['Product Tax'] / pivot_df['Product Amount']).round(2),
+        0
+    )
+    pivot_df['tax_rate'] = pivot_df['tax_rate'].apply(lambda x: f"{x:.0%}")
+
+    final_columns = [
+        'order-id', 'shipment-id', 'sku',
+        'Product Amount', 'Product Tax', 'tax_rate',
+        'Shipping', 'Shipping Tax', 'Total_shipping',
+        'Giftwrap', 'Giftwrap Tax', 'Total_amount'
+    ]
+    
+    return pivot_df[final_columns].sort_values("shipment-id")
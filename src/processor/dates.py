@@ -0,0 +1,60 @@
+"""结算报告的日期解析：从样本检测一次日期格式，按固定格式解析去重后的日期
+
+各站点报告的 posted-date 格式不同（US: 2024-01-15，CA: 15.01.2024）。不指定格式的
+pd.to_datetime 会按首个值推断格式，遇到 CA 的日.月.年 会把日大于12的日期解析为空值，
+逐值推断也很慢。一个文件只有几十个不同的日期，因此先去重，再按检测到的格式解析，
+最后按行映射回去；检测到的格式解析不了的值再依次尝试其他格式。
+"""
+import numpy as np
+import pandas as pd
+
+# posted-date 可能的格式（US: 2024-01-15，CA: 15.01.2024）
+DATE_FORMATS = ['%Y-%m-%d', '%d.%m.%Y']
+_SAMPLE_SIZE = 100
+
+
+def detect_date_format(values, formats=DATE_FORMATS):
+    """从去重后的前若干个非空值检测日期格式：返回能解析最多样本的格式，都解析不了时返回None"""
+    sample = pd.Series(values, dtype=object).dropna().astype(str).str.strip()
+    sample = sample[sample != ''].drop_duplicates().head(_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+    best, best_count = None, 0
+    for fmt in formats:
+        count = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if count > best_count:
+            best, best_count = fmt, count
+        if count == len(sample):
+            break
+    return best
+
+
+def parse_dates(values, fmt=None):
+    """解析日期列，无法解析的值为NaT；已是日期类型时原样返回
+
+    fmt 为空时从数据中检测（detect_date_format）。只解析去重后的值，结果与原列的索引相同。
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    codes, uniques = pd.factorize(series)
+    text = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    if fmt is None:
+        fmt = detect_date_format(text)
+
+    formats = [fmt] + [other for other in DATE_FORMATS if other != fmt] if fmt else list(DATE_FORMATS)
+    parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[us]')
+    for candidate in formats:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], format=candidate, errors='coerce')
+    missing = parsed.isna() & (text != '')
+    if missing.any():
+        # 其他格式（如带时间的值）逐值推断
+        inferred = pd.to_datetime(text[missing], format='mixed', errors='coerce', utc=True)
+        parsed[missing] = inferred.dt.tz_localize(None)
+
+    # codes 中的 -1（空值）取到末尾追加的 NaT
+    lookup = np.append(parsed.to_numpy(), np.datetime64('NaT', 'us'))
+    return pd.Series(lookup[codes], index=series.index, name=series.name)
@@ -1,22 +1,109 @@
-import gspread
-import pickle
-import os
-import webbrowser
-from tkinter import messagebox
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
+import json
+import logging
+import sys
+import time
 
+from utils import events
 from utils.auth_utils import get_google_creds
+from .cost_history import record_cost_snapshot
+
+logger = logging.getLogger("amazon_processor")
+
+def import_gspread():
+    """导入gspread（连同Google认证库导入较慢，首次从Google Sheet加载时才导入）"""
+    import gspread
+    return gspread
+
+
+def _is_api_error(error):
+    # 未导入gspread时不可能是它的异常，不为判断而导入
+    gspread = sys.modules.get("gspread")
+    return gspread is not None and isinstance(error, gspread.exceptions.APIError)
+
+
+# ========== 查找表缓存（监听模式等长驻进程复用，避免每次运行重新拉取） ==========
+_lookup_cache = {}
+_cache_ttl = None  # None 表示不缓存
+# GUI会话中复用查找表的有效期（秒）：订单查询、选择文件后的预加载
+SESSION_CACHE_TTL = 30 * 60
+
+
+def set_lookup_cache(ttl_seconds):
+    """启用查找表缓存，ttl_seconds 为有效期（秒）；传 None 关闭缓存"""
+    global _cache_ttl
+    _cache_ttl = ttl_seconds
+    if ttl_seconds is None:
+        _lookup_cache.clear()
+
+
+def clear_lookup_cache():
+    """清空查找表缓存"""
+    _lookup_cache.clear()
+
+
+def _get_cached(key):
+    if _cache_ttl is None or key not in _lookup_cache:
+        return None
+    loaded_at, value = _lookup_cache[key]
+    if time.monotonic() - loaded_at > _cache_ttl:
+        del _lookup_cache[key]
+        return None
+    logger.debug("使用缓存的 %s 数据", key)
+    return value
+
+
+def _set_cached(key, value):
+    # 空结果通常意味着加载失败，不缓存
+    if _cache_ttl is not None and value:
+        _lookup_cache[key] = (time.monotonic(), value)
+
+
+def prefetch_lookups():
+    """预先加载成本表和SKU映射放入查找表缓存（需先用 set_lookup_cache 启用缓存）
+
+    在后台线程中调用：失败时不上报、不抛出，正式处理时重新加载并提示错误。
+    """
+    with events.capture():
+        load_gsheet_data("landed_cost")
+        load_gsheet_data("pdb_us")
+        try:
+            load_sku_mapping()
+        except Exception as e:
+            logger.warning("SKU映射预加载失败: %s", e)
+
+
+# ========== 离线查找表（基准测试/无网络环境下代替Google Sheet） ==========
+_offline_lookups = None
+
+
+def use_offline_lookups(lookups):
+    """使用本地查找表代替Google Sheet：{表名: {key: value}}；传 None 恢复在线模式"""
+    global _offline_lookups
+    _offline_lookups = lookups
+
+
+def load_offline_lookups(path):
+    """从JSON文件加载离线查找表（格式同 use_offline_lookups）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        lookups = json.load(f)
+    use_offline_lookups(lookups)
+    return lookups
+
 
 def load_gsheet_data(sheet_name):
     """加载指定Google Sheet并返回SKU到cost的字典"""
+    if _offline_lookups is not None:
+        return {k: float(v) for k, v in _offline_lookups.get(sheet_name, {}).items()}
+
+    cached = _get_cached(sheet_name)
+    if cached is not None:
+        return cached
     try:
-        print(f"\n[Google Sheet] 开始加载 {sheet_name} 数据")
+        logger.info("开始加载Google Sheet %s 数据", sheet_name)
         
         # 复用现有认证流程
         creds = get_google_creds()
-        client = gspread.authorize(creds)
+        client = import_gspread().authorize(creds)
         
         # 打开指定名称的工作表
         spreadsheet = client.open(sheet_name)
@@ -25,7 +112,7 @@ def load_gsheet_data(sheet_name):
         # 获取全部数据（包含标题）
         rows = sheet.get_all_values()
         if not rows:
-            print(f"[警告] {sheet_name} 表中无数据")
+            logger.warning("%s 表中无数据", sheet_name)
             return {}
         
         # 验证列结构
@@ -34,6 +121,7 @@ def load_gsheet_data(sheet_name):
         
         # 构建SKU-Cost映射
         cost_mapping = {}
+        invalid = []
         for row in rows[1:]:  # 跳过标题行
             sku = row[0].strip()  # A列
             cost_str = row[10].strip()  # K列（第11列）
@@ -44,89 +132,110 @@ def load_gsheet_data(sheet_name):
             try:
                 cost = float(cost_str) if cost_str else 0.0
             except ValueError:
-                print(f"[警告] {sheet_name} 表中无效数值：SKU={sku}, 值='{cost_str}'")
+                logger.debug("%s 表中无效数值：SKU=%s, 值='%s'", sheet_name, sku, cost_str)
+                invalid.append(sku)
                 cost = 0.0
                 
             cost_mapping[sku] = cost
         
-        print(f"成功加载 {len(cost_mapping)} 条 {sheet_name} 数据")
+        if invalid:
+            events.warning("成本数据警告",
+                           f"{sheet_name} 表中 {len(invalid)} 个SKU的成本不是有效数值，按0计算："
+                           f"{', '.join(invalid[:10])}{' ...' if len(invalid) > 10 else ''}")
+        logger.info("成功加载 %d 条 %s 数据", len(cost_mapping), sheet_name)
+        _set_cached(sheet_name, cost_mapping)
+        record_cost_snapshot(sheet_name, cost_mapping)
         return cost_mapping
         
     except Exception as e:
         error_msg = f"加载 {sheet_name} 失败：{str(e)}\n"
         error_msg += "请检查：\n- 表格名称是否正确\n- 表格是否已分享给您的账号\n- 网络连接是否正常"
-        messagebox.showerror("Google Sheet错误", error_msg)
+        events.error("Google Sheet错误", error_msg)
         return {}
 
+
+def load_sku_mapping():
+    """加载SKU Manual Mapping表，返回 channel_sku → master_sku 字典（失败时抛出异常）"""
+    if _offline_lookups is not None:
+        return dict(_offline_lookups.get("SKU Manual Mapping", {}))
+
+    cached = _get_cached("SKU Manual Mapping")
+    if cached is not None:
+        return cached
+
+    logger.info("开始加载Google Sheet SKU映射表")
+
+    # 获取用户凭据
+    creds = get_google_creds()
+    client = import_gspread().authorize(creds)
+    
+    # ==== 修改点1：移除服务账号相关提示 ====
+    spreadsheet = client.open("SKU Manual Mapping")
+    sheet = spreadsheet.sheet1
+    
+    # ==== 修改点2：增强列名验证 ====
+    headers = sheet.row_values(1)
+    required_columns = ['channel_sku', 'sku_backup']
+    
+    # 严格检查列名（忽略大小写和空格）
+    header_clean = [h.strip().lower() for h in headers]
+    missing = [
+        col for col in required_columns 
+        if col not in header_clean
+    ]
+    
+    if missing:
+        # 生成友好的列名建议
+        suggestions = [
+            f"现有列：{headers}\n"
+            f"需要列：{required_columns}\n"
+            f"可能原因：\n"
+            f"- 列名拼写错误（检查大小写和空格）\n"
+            f"- 表格未使用标准模板"
+        ]
+        raise ValueError("\n".join(suggestions))
+    
+    # ==== 修改点3：优化数据加载 ====
+    records = sheet.get_all_records()
+    sku_mapping = {}
+    
+    for idx, row in enumerate(records, start=2):
+        # 统一处理空值和类型
+        channel_sku = str(row.get('channel_sku', '')).strip()
+        sku_backup = str(row.get('sku_backup', '')).strip()
+        
+        if not channel_sku:
+            logger.debug("跳过第%d行：channel_sku为空", idx)
+            continue
+            
+        # 重复检查
+        if channel_sku in sku_mapping:
+            logger.warning("重复channel_sku：%s → 将覆盖前值", channel_sku)
+            
+        sku_mapping[channel_sku] = sku_backup
+    
+    logger.info("成功加载 %d 条SKU映射", len(sku_mapping))
+    _set_cached("SKU Manual Mapping", sku_mapping)
+    return sku_mapping
+
+
 def add_master_sku_from_gsheet(df):
     """从Google Sheet获取SKU映射（OAuth修正版）"""
     try:
-        print("\n[Google Sheet] 开始加载SKU映射表")
-        
-        # 获取用户凭据
-        creds = get_google_creds()
-        client = gspread.authorize(creds)
-        
-        # ==== 修改点1：移除服务账号相关提示 ====
-        spreadsheet = client.open("SKU Manual Mapping")
-        sheet = spreadsheet.sheet1
-        
-        # ==== 修改点2：增强列名验证 ====
-        headers = sheet.row_values(1)
-        required_columns = ['channel_sku', 'sku_backup']
-        
-        # 严格检查列名（忽略大小写和空格）
-        header_clean = [h.strip().lower() for h in headers]
-        missing = [
-            col for col in required_columns 
-            if col not in header_clean
-        ]
-        
-        if missing:
-            # 生成友好的列名建议
-            suggestions = [
-                f"现有列：{headers}\n"
-                f"需要列：{required_columns}\n"
-                f"可能原因：\n"
-                f"- 列名拼写错误（检查大小写和空格）\n"
-                f"- 表格未使用标准模板"
-            ]
-            raise ValueError("\n".join(suggestions))
-        
-        # ==== 修改点3：优化数据加载 ====
-        records = sheet.get_all_records()
-        sku_mapping = {}
-        
-        for idx, row in enumerate(records, start=2):
-            # 统一处理空值和类型
-            channel_sku = str(row.get('channel_sku', '')).strip()
-            sku_backup = str(row.get('sku_backup', '')).strip()
-            
-            if not channel_sku:
-                print(f"[跳过] 第{idx}行：channel_sku为空")
-                continue
-                
-            # 重复检查
-            if channel_sku in sku_mapping:
-                print(f"[警告] 重复channel_sku：{channel_sku} → 将覆盖前值")
-                
-            sku_mapping[channel_sku] = sku_backup
-        
-        print(f"成功加载 {len(sku_mapping)} 条映射")
+        sku_mapping = load_sku_mapping()
         df['master_sku'] = df['sku'].map(sku_mapping)
         
         return df
 
-    except gspread.exceptions.APIError as e:
-        # ==== 修改点4：精准识别权限问题 ====
-        error_msg = f"访问Google Sheet失败：{e.response.text}"
-        if "PERMISSION_DENIED" in str(e):
-            error_msg += "\n请确认：\n1. 已把表格分享给您的Google账号\n2. 表格ID正确"
-        messagebox.showerror("权限错误", error_msg)
-        return df
-        
     except Exception as e:
-        messagebox.showwarning("数据处理错误",
+        if _is_api_error(e):
+            # ==== 修改点4：精准识别权限问题 ====
+            error_msg = f"访问Google Sheet失败：{e.response.text}"
+            if "PERMISSION_DENIED" in str(e):
+                error_msg += "\n请确认：\n1. 已把表格分享给您的Google账号\n2. 表格ID正确"
+            events.error("权限错误", error_msg)
+            return df
+        events.warning("数据处理错误",
             f"SKU匹配异常：{str(e)}\n"
             "将继续使用原始SKU数据")
         return df
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""分月结果缓存：数据和查找表都没有变化的月份直接复用上次的计算结果
+
+缓存键由三部分组成：
+    - 该月的数据切片（明细行内容、日期范围，以及QTY补充会用到的同订单 ItemWithheldTax 行）
+    - 查找表版本（成本表、SKU映射、成本快照、历史数量索引、计算后端）
+    - 代码版本（计算相关模块源文件的哈希）
+任一部分变化都会得到新的键，旧结果不会被误用。结果（该月的 qty/order/order_details/order_import 表）
+以pickle保存在 ~/.amazon-processor/month_cache，只保留最近使用的 MAX_ENTRIES 份。
+root=None 时只计算缓存键（工作簿增量更新用），不读写磁盘缓存。
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+import pandas as pd
+
+from utils.events import ERROR
+from .backends import ORDER_KEYS
+from .google_sheets import load_sku_mapping
+
+logger = logging.getLogger("amazon_processor")
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".amazon-processor", "month_cache")
+MAX_ENTRIES = 200
+
+# 影响分月结果的模块，内容变化时全部缓存失效
+_CODE_MODULES = ("data_processing.py", "backends.py", "pipeline.py", "cost_history.py", "store.py")
+_code_version = None
+
+
+def code_version():
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha1()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _CODE_MODULES:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _hash_mapping(mapping):
+    return hashlib.sha1(json.dumps(mapping, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def frame_digest(df):
+    """DataFrame内容（列名+逐行哈希）的摘要，与索引无关"""
+    digest = hashlib.sha1(json.dumps([str(col) for col in df.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class MonthCache:
+    """分月结果的磁盘缓存"""
+
+    def __init__(self, root=CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+        self.context = None
+        self._qty_history = None
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, backend_name, landed_cost_data, pdb_us_data, cost_history=None, qty_history=None):
+        """记录本次运行的查找表版本；SKU映射加载失败时返回False（本次不使用缓存）"""
+        try:
+            sku_mapping = load_sku_mapping()
+        except Exception as e:
+            logger.warning("SKU映射加载失败，本次不使用分月缓存: %s", e)
+            self.context = None
+            return False
+        self.context = {
+            "code": code_version(),
+            "backend": backend_name,
+            "landed_cost": _hash_mapping(landed_cost_data),
+            "pdb_us": _hash_mapping(pdb_us_data),
+            "sku_mapping": _hash_mapping(sku_mapping),
+            "cost_history": None if cost_history is None else cost_history.version(),
+        }
+        self._qty_history = qty_history
+        return True
+
+    def key(self, prefix, period_df, start, end, raw_source_df):
+        """单个周期的缓存键（未调用 prepare 或 prepare 失败时返回None）"""
+        if self.context is None:
+            return None
+
+        orders = period_df.loc[period_df['transaction-type'] == 'Order', ORDER_KEYS]
+        order_keys = pd.MultiIndex.from_frame(orders.astype(object)).unique()
+        fill = raw_source_df.loc[
+            (raw_source_df['amount-type'] == 'ItemWithheldTax') & (raw_source_df['transaction-type'] == 'Order'),
+            ORDER_KEYS + ['quantity-purchased']
+        ]
+        fill = fill[pd.MultiIndex.from_frame(fill[ORDER_KEYS].astype(object)).isin(order_keys)]
+
+        parts = dict(self.context, prefix=prefix, start=str(start), end=str(end),
+                     rows=frame_digest(period_df), fill=frame_digest(fill))
+        if self._qty_history is not None:
+            found = self._qty_history.lookup(order_keys.to_frame(index=False))
+            parts["qty_history"] = frame_digest(found.to_frame())
+        return _hash_mapping(parts)
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.pkl")
+
+    def get(self, key):
+        """读取缓存的 {"sheets": {表名: DataFrame}, "events": 事件列表}，不存在或无法读取时返回None"""
+        if key is None or self.root is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning("分月缓存读取失败 %s: %s", path, e)
+            self.misses += 1
+            return None
+        os.utime(path)  # 记录最近使用时间
+        self.hits += 1
+        return entry
+
+    def put(self, key, sheets, captured=()):
+        """保存该周期的结果和处理中上报的事件（有表计算失败时不保存），失败不影响处理"""
+        if key is None or self.root is None or any(df is None for df in sheets.values()):
+            return
+        if any(level == ERROR for level, _, _ in captured):
+            return
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(key)
+            with open(path + ".tmp", 'wb') as f:
+                pickle.dump({"sheets": sheets, "events": list(captured)}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+            self._prune()
+        except OSError as e:
+            logger.warning("分月缓存保存失败: %s", e)
+
+    def _prune(self):
+        entries = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith(".pkl")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            os.remove(path)
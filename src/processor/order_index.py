@@ -0,0 +1,103 @@
+"""订单查询索引：order-id / shipment-id → 结算明细行
+
+索引是数据仓库目录下的SQLite文件，保存所有带 order-id 的明细行，在 order-id 和
+shipment-id 上建B树索引，单个订单的查询只需几毫秒，不必打开原始TSV。
+随 SettlementStore.ingest 增量追加（导入已去重），缺失时可从全部分区重建。
+order_details 记录由查到的明细行即时推算（与流水线相同的透视和QTY合并逻辑）。
+"""
+import os
+import sqlite3
+
+import pandas as pd
+
+from .data_processing import process_qty_data, process_order_data, merge_order_qty
+
+INDEX_FILE = "order_index.sqlite"
+TABLE = "order_rows"
+
+# 结算报告的全部列（posted-date 以 YYYY-MM-DD 文本保存，其余保持原值类型）
+INDEX_COLUMNS = [
+    'settlement-id', 'settlement-start-date', 'settlement-end-date', 'deposit-date',
+    'total-amount', 'currency', 'transaction-type', 'order-id', 'merchant-order-id',
+    'adjustment-id', 'shipment-id', 'marketplace-name', 'amount-type', 'amount-description',
+    'amount', 'fulfillment-id', 'posted-date', 'posted-date-time', 'order-item-code',
+    'merchant-order-item-id', 'merchant-adjustment-item-id', 'sku', 'quantity-purchased',
+    'promotion-id',
+]
+
+
+class OrderIndex:
+    """按订单号/货件号查询结算明细行"""
+
+    def __init__(self, path):
+        self.path = path
+        self.con = sqlite3.connect(path)
+        columns = ', '.join(f'"{col}"' for col in INDEX_COLUMNS)
+        self.con.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} ({columns})')
+        self.con.execute(f'CREATE INDEX IF NOT EXISTS idx_order_id ON {TABLE} ("order-id")')
+        self.con.execute(f'CREATE INDEX IF NOT EXISTS idx_shipment_id ON {TABLE} ("shipment-id")')
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.con.execute(f'SELECT COUNT(*) FROM {TABLE}').fetchone()[0]
+
+    def add(self, df):
+        """追加带 order-id 的明细行，返回追加行数"""
+        rows = df[df['order-id'].notna()]
+        if rows.empty:
+            return 0
+        rows = rows.reindex(columns=INDEX_COLUMNS).copy()
+        rows['posted-date'] = pd.to_datetime(rows['posted-date']).dt.strftime('%Y-%m-%d')
+        rows.to_sql(TABLE, self.con, if_exists='append', index=False, chunksize=50_000)
+        self.con.commit()
+        return len(rows)
+
+    def lookup(self, order_id=None, shipment_id=None):
+        """查询订单的全部结算明细行（按posted-date排序），结构与 read_settlement 的结果相同"""
+        if not order_id and not shipment_id:
+            raise ValueError("order_id 或 shipment_id 至少指定一个")
+        conditions, params = [], []
+        if order_id:
+            conditions.append('"order-id" = ?')
+            params.append(str(order_id).strip())
+        if shipment_id:
+            conditions.append('"shipment-id" = ?')
+            params.append(str(shipment_id).strip())
+        rows = pd.read_sql_query(
+            f'SELECT * FROM {TABLE} WHERE {" OR ".join(conditions)} ORDER BY "posted-date", rowid',
+            self.con, params=params
+        )
+        rows['posted-date'] = pd.to_datetime(rows['posted-date'], errors='coerce')
+        for col in ['amount', 'quantity-purchased']:
+            rows[col] = pd.to_numeric(rows[col], errors='coerce')
+        return rows
+
+
+def order_details(rows, qty_history=None, master_sku=True):
+    """由订单的明细行推算 order_details 记录（没有 Order 交易时返回空表）
+
+    master_sku=False 时不从Google Sheet加载SKU映射表（离线、不等待网络），master_sku 列为空。
+    """
+    orders = rows[rows['transaction-type'] == 'Order'].dropna(subset=['posted-date'])
+    if orders.empty:
+        return pd.DataFrame()
+    start, end = orders['posted-date'].min(), orders['posted-date'].max()
+    qty_df, _, _ = process_qty_data(orders, start, end)
+    order_df = process_order_data(orders)
+    if qty_df is None or order_df is None:
+        return pd.DataFrame()
+    return merge_order_qty(order_df, qty_df, rows, qty_history, master_sku=master_sku)
+
+
+def open_index(root):
+    """打开数据仓库目录下的订单索引"""
+    return OrderIndex(os.path.join(root, INDEX_FILE))
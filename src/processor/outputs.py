@@ -0,0 +1,178 @@
+"""输出目标：Excel工作簿、Parquet、CSV（每次运行可选择一种或多种）
+
+列式/CSV输出供BI等程序读取，每张表一个文件，按月份分区：
+
+    <目录>/<表>/month=YYYY-MM/<表>.parquet      （不分月的运行为 month=all）
+    <目录>/Summary/month=YYYY-MM/Summary.csv
+
+目录默认为输出工作簿路径去掉扩展名（report.xlsx → report/）。每个输出目标实现相同的方法：
+prepare(monthly, start_date) / unchanged() / discrepancies() / write_summary() / write_period() /
+write_run_stats() / write_discrepancies() / close() / abort()。
+"""
+import json
+import os
+
+from utils.instrumentation import stage
+from .results_db import ResultsDatabase
+from .workbook import WorkbookOutput
+
+FORMATS = ("xlsx", "parquet", "csv")
+
+# 列式输出的表类型（周期表名去掉月份前缀）；Summary 按汇总月份写入，不随周期重写删除
+_PERIOD_TABLES = ("qty", "order", "order_details", "order_import")
+_TABLES = ("Summary",) + _PERIOD_TABLES
+_KEYS_FILE = "_period_keys.json"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Parquet输出需要安装 pyarrow: pip install pyarrow") from e
+
+
+def _partition(prefix):
+    """周期前缀 → 分区值（202401_ → 2024-01，整体周期 → all）"""
+    month = prefix.rstrip('_')
+    return f"{month[:4]}-{month[4:]}" if month else "all"
+
+
+class ColumnarOutput:
+    """按月份分区的 Parquet / CSV 文件"""
+
+    def __init__(self, directory, fmt, update=False):
+        self.directory = directory
+        self.fmt = fmt
+        self.update = update
+        self.keys = {}
+        self._saved_keys = {}
+        keys_path = os.path.join(directory, _KEYS_FILE)
+        if update and os.path.exists(keys_path):
+            with open(keys_path, 'r', encoding='utf-8') as f:
+                self._saved_keys = json.load(f).get(fmt, {})
+
+    def _path(self, table, partition):
+        return os.path.join(self.directory, table, f"month={partition}", f"{table}.{self.fmt}")
+
+    def _remove_partition(self, partition):
+        for table in _PERIOD_TABLES:
+            path = self._path(table, partition)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _write(self, df, table, partition):
+        path = self._path(table, partition)
+        with stage(f"to_{self.fmt}:{table}:{partition}", rows_in=len(df)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.fmt == "parquet":
+                df.to_parquet(path, index=False)
+            else:
+                df.to_csv(path, index=False, encoding='utf-8')
+
+    def unchanged(self):
+        return {prefix: key for prefix, key in self._saved_keys.items()
+                if os.path.exists(self._path("qty", _partition(prefix)))}
+
+    def prepare(self, monthly, start_date=None):
+        """新建输出时删除上次运行的同格式文件；分月运行删除原有的 month=all 分区"""
+        if not self.update:
+            for table in _TABLES:
+                table_dir = os.path.join(self.directory, table)
+                if not os.path.isdir(table_dir):
+                    continue
+                for partition in os.listdir(table_dir):
+                    path = os.path.join(table_dir, partition, f"{table}.{self.fmt}")
+                    if os.path.exists(path):
+                        os.remove(path)
+        elif monthly:
+            self._remove_partition("all")
+            self.keys[""] = None
+
+    def write_summary(self, pivot_tables):
+        for month, pivot in pivot_tables:
+            self._write(pivot, "Summary", str(month))
+
+    def write_period(self, prefix, key, sheets):
+        self.keys[prefix] = key
+        if sheets is None:
+            return
+        partition = _partition(prefix)
+        self._remove_partition(partition)
+        for sheet_name, df in sheets.items():
+            if df is not None:
+                self._write(df, sheet_name[len(prefix):], partition)
+
+    def write_run_stats(self, stats_df):
+        pass  # 运行统计只写入工作簿和JSON报告
+
+    def discrepancies(self):
+        return None  # 对账差异只写入工作簿
+
+    def write_discrepancies(self, discrepancies_df):
+        pass  # 对账差异只写入工作簿（JSON报告记录差异数）
+
+    def close(self):
+        keys_path = os.path.join(self.directory, _KEYS_FILE)
+        saved = {}
+        if os.path.exists(keys_path):
+            with open(keys_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        fmt_keys = dict(self._saved_keys) if self.update else {}
+        for prefix, key in self.keys.items():
+            if key is None:
+                fmt_keys.pop(prefix, None)
+            else:
+                fmt_keys[prefix] = key
+        saved[self.fmt] = fmt_keys
+        os.makedirs(self.directory, exist_ok=True)
+        with open(keys_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(saved, f, indent=2)
+        os.replace(keys_path + ".tmp", keys_path)
+
+    def abort(self):
+        pass  # 已写入的文件保留，缓存键不更新（下次更新时重新写入）
+
+
+def output_directory(save_path):
+    """列式输出目录：输出路径去掉扩展名"""
+    return os.path.splitext(save_path)[0]
+
+
+def open_outputs(save_path, formats=("xlsx",), update=False, results_db=None, workers=None):
+    """按所选格式创建输出目标列表；results_db 为SQLite结果库路径时同时写入结果库
+
+    workers 为新建工作簿时并行序列化各表的进程数（None 自动，1 逐表写入）。
+    """
+    formats = list(dict.fromkeys(formats or ("xlsx",)))
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        raise ValueError(f"未知的输出格式: {', '.join(unknown)}")
+    if "parquet" in formats:
+        _require_pyarrow()
+    outputs = []
+    for fmt in formats:
+        if fmt == "xlsx":
+            outputs.append(WorkbookOutput(save_path, update, workers))
+        else:
+            outputs.append(ColumnarOutput(output_directory(save_path), fmt, update))
+    if results_db:
+        outputs.append(ResultsDatabase(results_db))
+    return outputs
+
+
+def common_unchanged(outputs):
+    """所有输出目标都记录了相同缓存键的周期（这些周期不需计算和写入）"""
+    first, *rest = [output.unchanged() for output in outputs]
+    return {prefix: key for prefix, key in first.items() if all(keys.get(prefix) == key for keys in rest)}
+
+
+def kept_discrepancies(outputs, prefixes):
+    """未变化周期（增量更新中不重新核对）在现有输出中的订单表差异行；没有记录时为None"""
+    if not prefixes:
+        return None
+    scopes = {prefix.rstrip('_') or 'all' for prefix in prefixes}
+    for output in outputs:
+        previous = output.discrepancies()
+        if previous is not None:
+            return previous[(previous['check'] != 'settlement') & previous['scope'].isin(scopes)]
+    return None
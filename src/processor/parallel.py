@@ -0,0 +1,107 @@
+"""跨月处理的进程池并行
+
+各月的 qty/order/order_details/order_import 计算互不依赖：主进程加载好成本表和
+SKU映射后，在子进程初始化时作为只读查找表交给每个进程（Linux下fork直接继承），
+各月数据分发到进程池计算，结果按月份顺序交回主进程写入工作簿。
+子进程中的事件和阶段统计随结果一起返回，由主进程转发给订阅者并记入运行报告。
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import events
+from utils.instrumentation import start_run, end_run, current_run
+from .backends import get_backend, ORDER_KEYS
+from .google_sheets import use_offline_lookups, load_sku_mapping
+
+logger = logging.getLogger("amazon_processor")
+
+# 低于该行数时进程启动和数据传输的开销大于收益，自动模式下顺序处理
+PARALLEL_MIN_ROWS = 200_000
+
+# 子进程内的只读状态（由 _init_worker 设置）
+_worker_state = {}
+
+
+def resolve_workers(workers, n_periods, n_rows):
+    """确定实际进程数：workers=None 时数据量足够大才按CPU核数并行；返回1表示顺序处理"""
+    if workers is None:
+        if n_rows < PARALLEL_MIN_ROWS:
+            return 1
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, n_periods))
+
+
+def shared_lookups(landed_cost_data, pdb_us_data):
+    """打包交给子进程的查找表（格式同离线查找表）；SKU映射加载失败时返回None（改为顺序处理）"""
+    try:
+        sku_mapping = load_sku_mapping()
+    except Exception as e:
+        logger.warning("SKU映射预加载失败，改为顺序处理: %s", e)
+        return None
+    return {
+        "landed_cost": landed_cost_data,
+        "pdb_us": pdb_us_data,
+        "SKU Manual Mapping": sku_mapping,
+    }
+
+
+def fill_source(raw_source_df):
+    """QTY补充只用到 ItemWithheldTax 订单行，预先筛选以减少传给子进程的数据"""
+    mask = (raw_source_df['amount-type'] == 'ItemWithheldTax') & (raw_source_df['transaction-type'] == 'Order')
+    return raw_source_df.loc[mask, ORDER_KEYS + ['amount-type', 'transaction-type', 'quantity-purchased']]
+
+
+def _init_worker(backend_name, lookups, fill_df, qty_history, cost_history):
+    use_offline_lookups(lookups)
+    _worker_state.update(
+        backend=get_backend(backend_name),
+        landed_cost=lookups["landed_cost"],
+        pdb_us=lookups["pdb_us"],
+        fill_df=fill_df,
+        qty_history=qty_history,
+        cost_history=cost_history,
+    )
+
+
+def _process_period(prefix, period_df, start, end):
+    from .pipeline import _build_period
+
+    report = start_run("worker")
+    try:
+        with events.capture() as captured:
+            sheets = _build_period(
+                _worker_state["backend"], prefix, period_df, start, end, _worker_state["fill_df"],
+                _worker_state["landed_cost"], _worker_state["pdb_us"],
+                qty_history=_worker_state["qty_history"], cost_history=_worker_state["cost_history"]
+            )
+    finally:
+        end_run()
+    pid = os.getpid()
+    for span in report.spans:
+        span.extra["worker_pid"] = pid
+    return sheets, report.spans, captured
+
+
+def process_periods(backend_name, periods, raw_source_df, lookups, workers, qty_history=None,
+                    cost_history=None):
+    """在进程池中处理 [(prefix, period_df, start, end), ...]，按给定顺序逐个产出 ({表名: DataFrame}, 事件列表)
+
+    结果按顺序产出，主进程可以在后续月份仍在计算时写入已完成的月份。
+    子进程的事件产出前已转发给订阅者，随结果返回供分月缓存保存。
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(backend_name, lookups, fill_source(raw_source_df), qty_history, cost_history),
+    ) as pool:
+        futures = [pool.submit(_process_period, *period) for period in periods]
+        for future in futures:
+            sheets, spans, captured = future.result()
+            for event in captured:
+                events.report(*event)
+            report = current_run()
+            if report is not None:
+                for span in spans:
+                    report.add(span)
+            yield sheets, captured
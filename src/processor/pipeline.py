@@ -0,0 +1,636 @@
+import logging
+import os
+import threading
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+from .data_processing import split_data_by_month
+from .dates import parse_dates
+from .backends import get_backend, ORDER_KEYS
+from .cost_history import order_line_dates
+from .cube import DailyCube
+from .google_sheets import load_gsheet_data
+from .parallel import resolve_workers, shared_lookups, process_periods
+from .reconcile import Reconciliation, settlement_headers
+from .memo import MonthCache
+from .outputs import open_outputs, common_unchanged, kept_discrepancies
+from .workbook import sheet_count, EXCEL_MAX_ROWS
+from utils import events
+from utils.instrumentation import start_run, end_run, current_run, stage
+
+logger = logging.getLogger("amazon_processor")
+
+
+class PipelineError(Exception):
+    """流水线无法继续时抛出（由GUI/CLI负责展示）"""
+
+
+# 只有首行汇总行有值的列按文本读取（大文件分块推断类型时各块不一致会产生 DtypeWarning）
+HEADER_TEXT_COLUMNS = {col: 'str' for col in ('settlement-start-date', 'settlement-end-date', 'deposit-date', 'currency')}
+# 汇总和分月处理必需的列
+REQUIRED_COLUMNS = ['transaction-type', 'amount-type', 'amount', 'posted-date']
+
+# 已解析报告缓存：(绝对路径, mtime, 大小) → DataFrame，文件变化后自动失效
+_report_cache = OrderedDict()
+REPORT_CACHE_SIZE = 2
+# 后台预解析中的报告：文件签名 → Future
+_preloading = {}
+# 按天预聚合的数据（见 processor.cube）：文件签名 → DailyCube
+_cube_cache = {}
+# 报告首行的汇总金额（见 processor.reconcile）：文件签名 → DataFrame(settlement-id, total-amount)
+_header_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _file_signature(file_path):
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def read_settlement(file_path):
+    """读取结算报告（跳过首行汇总行）
+
+    同一文件未变化时直接返回缓存结果，调用方不应原地修改返回的DataFrame。
+    该文件正在后台预解析（preload_settlement）时等待其结果，不重复解析。
+    """
+    key = _file_signature(file_path)
+    with _cache_lock:
+        if key in _report_cache:
+            _report_cache.move_to_end(key)
+            return _report_cache[key]
+        future = _preloading.get(key)
+    if future is not None:
+        try:
+            return future.result()
+        except Exception:
+            pass  # 后台解析失败时重新解析，错误交给调用方处理
+    return _parse_settlement(file_path, key)
+
+
+def _parse_settlement(file_path, key):
+    source_df = pd.read_csv(file_path, delimiter='\t', dtype=HEADER_TEXT_COLUMNS)
+    missing = [col for col in REQUIRED_COLUMNS if col not in source_df.columns]
+    if missing:
+        raise PipelineError(f"报告缺少必需的列: {', '.join(missing)}")
+    headers = settlement_headers(source_df)
+    raw_source_df = source_df.iloc[1:]
+    raw_source_df['posted-date'] = parse_dates(raw_source_df['posted-date'])
+
+    with _cache_lock:
+        # 同一路径的旧版本不再需要
+        for old_key in [k for k in _report_cache if k[0] == key[0]]:
+            del _report_cache[old_key]
+        _report_cache[key] = raw_source_df
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+        for old_key in [k for k in _header_cache if k not in _report_cache]:
+            del _header_cache[old_key]
+        _header_cache[key] = headers
+    return raw_source_df
+
+
+def preload_settlement(file_path):
+    """在后台线程预先解析报告并放入缓存（GUI选择文件后调用），返回Future；已缓存时返回None"""
+    key = _file_signature(file_path)
+    with _cache_lock:
+        if key in _report_cache:
+            return None
+        if key in _preloading:
+            return _preloading[key]
+        future = _preloading[key] = Future()
+
+    def preload():
+        try:
+            future.set_result(_parse_settlement(file_path, key))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with _cache_lock:
+                _preloading.pop(key, None)
+
+    threading.Thread(target=preload, name="preload_settlement", daemon=True).start()
+    return future
+
+
+def settlement_totals(file_path):
+    """报告汇总行中各 settlement-id 的 total-amount（read_settlement 解析时记录）；没有汇总列时返回None"""
+    key = _file_signature(file_path)
+    with _cache_lock:
+        if key in _header_cache:
+            return _header_cache[key]
+    read_settlement(file_path)
+    with _cache_lock:
+        return _header_cache.get(key)
+
+
+def daily_cube(file_path):
+    """报告的按天聚合立方体（由 read_settlement 的结果构建，同一文件未变化时复用）"""
+    key = _file_signature(file_path)
+    with _cache_lock:
+        cube = _cube_cache.get(key)
+    if cube is not None:
+        return cube
+    raw_source_df = read_settlement(file_path)
+    with stage("build_cube", rows_in=len(raw_source_df)):
+        cube = DailyCube.build(raw_source_df)
+    with _cache_lock:
+        for old_key in [k for k in _cube_cache if k[0] == key[0] or k not in _report_cache]:
+            del _cube_cache[old_key]
+        _cube_cache[key] = cube
+    return cube
+
+
+def summary_cube(file_path, store, raw_source_df):
+    """本次运行的按天聚合数据；缺少汇总所需的列时返回None（改由后端汇总并提示缺列）"""
+    if any(col not in raw_source_df.columns for col in ('transaction-type', 'amount-type', 'amount', 'posted-date')):
+        return None
+    if store is None:
+        return daily_cube(file_path)
+    with stage("build_cube", rows_in=len(raw_source_df)):
+        return DailyCube.build(raw_source_df)
+
+
+def get_date_bounds(file_path):
+    """返回报告中posted-date的最小/最大日期（日期格式从数据中检测，见 processor.dates）"""
+    df = pd.read_csv(file_path, delimiter='\t', usecols=['posted-date'], dtype={'posted-date': 'string'})
+    dates = parse_dates(df['posted-date']).dropna()
+    if dates.empty:
+        return None, None
+    return dates.min().to_pydatetime(), dates.max().to_pydatetime()
+
+
+def build_order_import(merged_df, landed_cost_data, pdb_us_data, sheet_label="order_details",
+                       cost_history=None, order_dates=None):
+    """按master_sku汇总order_details，生成order_import表
+
+    提供 cost_history（成本快照）和 order_dates（订单行posted-date）时，成本按各订单行
+    posted-date 当时生效的快照计算（见 processor.cost_history）。
+    """
+    required_cols = ['master_sku', 'QTY', 'Total_amount']
+    if not all(col in merged_df.columns for col in required_cols):
+        logger.warning("%s 缺少必要列", sheet_label)
+        return None
+
+    grouped = merged_df.groupby('master_sku', as_index=False).agg({
+        'QTY': 'sum',
+        'Total_amount': 'sum'
+    }).rename(columns={
+        'QTY': 'total QTY',
+        'Total_amount': 'total amount'
+    })
+
+    # 处理除零错误（QTY为0时设为0）
+    grouped['product_rate'] = np.where(
+        grouped['total QTY'] > 0,
+        (grouped['total amount'] / grouped['total QTY']).round(2),
+        0.0
+    )
+
+    grouped['product_cost'] = grouped['master_sku'].apply(
+        lambda sku: (0.0 if str(sku).strip().lower() == "shipping"
+                     else landed_cost_data.get(
+                         str(sku).strip(),
+                         pdb_us_data.get(str(sku).strip(), None)))
+    )
+    grouped['total_cost'] = grouped['product_cost'] * grouped['total QTY']
+
+    if cost_history is not None and order_dates is not None:
+        dated = _dated_costs(merged_df, cost_history, order_dates)
+        grouped = grouped.merge(dated, on='master_sku', how='left')
+        # 期间内成本不变的SKU与按当前成本计算的方式一致；成本有变化时按订单行加权
+        changed = grouped['cost_versions'] > 1
+        grouped['product_cost'] = np.where(changed, grouped['weighted_cost'],
+                                           grouped['dated_cost'].fillna(grouped['product_cost']))
+        grouped['total_cost'] = np.where(changed, grouped['line_cost'],
+                                         grouped['product_cost'] * grouped['total QTY'])
+        grouped = grouped.drop(columns=['dated_cost', 'weighted_cost', 'line_cost', 'cost_versions'])
+
+    # 添加Shipping汇总行
+    try:
+        sum_total_shipping = merged_df['Total_shipping'].sum()
+        if sum_total_shipping != 0:
+            new_row = pd.DataFrame([{
+                'master_sku': 'Shipping',
+                'total QTY': 1,
+                'total amount': sum_total_shipping,
+                'product_rate': sum_total_shipping,
+                'product_cost': 0,
+                'total_cost': 0
+            }])
+            new_row = new_row[grouped.columns]
+            grouped = pd.concat([grouped, new_row], ignore_index=True)
+    except KeyError as e:
+        logger.warning("%s 缺少Total_shipping列: %s", sheet_label, e)
+    except Exception as e:
+        logger.error("添加Shipping行失败: %s", e)
+
+    final_columns = [
+        'master_sku',
+        'total QTY',
+        'total amount',
+        'product_rate',
+        'product_cost',
+        'total_cost'
+    ]
+    return grouped[final_columns]
+
+
+def _dated_costs(merged_df, cost_history, order_dates):
+    """按订单行posted-date做as-of连接，得到每个master_sku的期间成本"""
+    lines = merged_df[ORDER_KEYS + ['master_sku', 'QTY']].merge(order_dates, on=ORDER_KEYS, how='left')
+    lines = lines[lines['master_sku'].notna()]
+    lines['unit_cost'] = cost_history.cost_asof(lines['master_sku'], lines['posted-date'])
+    lines['QTY'] = lines['QTY'].astype('float64')
+    lines['line_cost'] = lines['unit_cost'] * lines['QTY']
+    by_sku = lines.groupby('master_sku')
+    per_sku = pd.DataFrame({
+        'dated_cost': by_sku['unit_cost'].last(),
+        'cost_versions': by_sku['unit_cost'].nunique(),
+        'line_cost': by_sku['line_cost'].sum(min_count=1),
+        'qty': by_sku['QTY'].sum(),
+    })
+    per_sku['weighted_cost'] = np.where(per_sku['qty'] > 0,
+                                        (per_sku['line_cost'] / per_sku['qty']).round(4),
+                                        per_sku['dated_cost'])
+    return per_sku.drop(columns=['qty']).reset_index()
+
+
+def _build_period(backend, prefix, period_df, start, end,
+                  raw_source_df, landed_cost_data, pdb_us_data, order_source_df=None, qty_history=None,
+                  cost_history=None):
+    """处理单个周期（整体或单月），返回 {表名: DataFrame}（qty/order/order_details/order_import，按写入顺序）"""
+    if order_source_df is None:
+        order_source_df = period_df
+    label = prefix.rstrip('_') or 'all'
+
+    with stage(f"process_qty_data:{label}", rows_in=len(period_df)) as span:
+        qty_df, _, _ = backend.process_qty_data(period_df, start, end)
+        span.rows_out = None if qty_df is None else len(qty_df)
+    with stage(f"process_order_data:{label}", rows_in=len(order_source_df)) as span:
+        order_df = backend.process_order_data(order_source_df)
+        span.rows_out = None if order_df is None else len(order_df)
+
+    order_dates = order_line_dates(order_source_df) if cost_history is not None else None
+    return _period_sheets(
+        prefix, qty_df, order_df,
+        lambda: backend.merge_order_qty(order_df, qty_df, raw_source_df, qty_history),
+        landed_cost_data, pdb_us_data, cost_history, order_dates
+    )
+
+
+def _period_sheets(prefix, qty_df, order_df, merge, landed_cost_data, pdb_us_data,
+                   cost_history=None, order_dates=None):
+    """由qty/order表经 merge() 得到order_details并生成order_import；前一步失败时只返回已有的表"""
+    label = prefix.rstrip('_') or 'all'
+    sheets = OrderedDict([(f"{prefix}qty", qty_df), (f"{prefix}order", order_df)])
+    if qty_df is None or order_df is None:
+        return sheets
+
+    with stage(f"merge_order_qty:{label}", rows_in=len(order_df)) as span:
+        merged = merge()
+        span.rows_out = None if merged is None else len(merged)
+    if merged is None:
+        return sheets
+    sheets[f"{prefix}order_details"] = merged
+
+    if not merged.empty:
+        with stage(f"order_import:{label}", rows_in=len(merged)) as span:
+            grouped = build_order_import(merged, landed_cost_data, pdb_us_data, f"{prefix}order_details",
+                                         cost_history, order_dates)
+            span.rows_out = None if grouped is None else len(grouped)
+        if grouped is not None:
+            sheets[f"{prefix}order_import"] = grouped
+    return sheets
+
+
+def load_cost_tables():
+    """加载landed_cost与pdb_us成本表，任一为空时抛出PipelineError"""
+    logger.info("开始加载成本数据...")
+    with stage("load_gsheet_data:landed_cost") as span:
+        landed_cost_data = load_gsheet_data("landed_cost")
+        span.rows_out = len(landed_cost_data)
+    with stage("load_gsheet_data:pdb_us") as span:
+        pdb_us_data = load_gsheet_data("pdb_us")
+        span.rows_out = len(pdb_us_data)
+
+    # 检查数据完整性
+    if not landed_cost_data or not pdb_us_data:
+        raise PipelineError("无法加载成本表，请检查控制台错误信息")
+    logger.info("成本数据加载完成")
+    return landed_cost_data, pdb_us_data
+
+
+def finish_run(report, report_path=None):
+    """结束当前运行：输出阶段耗时并保存JSON运行报告"""
+    end_run()
+    report.log_summary()
+    try:
+        report.save_json(report_path)
+    except OSError as e:
+        logger.warning("运行报告保存失败: %s", e)
+
+
+def write_run_stats(outputs):
+    """把当前运行统计写入 Run Stats 表（保存工作簿本身的耗时只记录在JSON报告中）"""
+    current_run().finish()
+    stats_df = current_run().to_frame()
+    for output in outputs:
+        output.write_run_stats(stats_df)
+
+
+def open_run_outputs(save_path, formats, update, results_db=None, workers=None):
+    """创建本次运行的输出目标；格式或依赖不满足时抛出PipelineError"""
+    try:
+        return open_outputs(save_path, formats, update, results_db, workers)
+    except (ValueError, ImportError) as e:
+        raise PipelineError(str(e)) from e
+
+
+def check_results_month(results_db, monthly, start_date, data_start, data_end):
+    """结果库按月份保存：不分月的运行中订单表使用全部数据，数据超出所选月份时无法确定月份，提前报错"""
+    if not results_db or monthly or data_start is None or pd.isna(data_start):
+        return
+    month = (start_date.year, start_date.month)
+    if (data_start.year, data_start.month) != month or (data_end.year, data_end.month) != month:
+        raise PipelineError(
+            f"结果库按月份保存，但文件数据从 {data_start:%Y-%m-%d} 到 {data_end:%Y-%m-%d}，"
+            f"不分月的运行无法确定月份：请选择跨月的日期范围（分月处理）或不写入结果库")
+
+
+def prepare_outputs(outputs, monthly, start_date):
+    try:
+        for output in outputs:
+            output.prepare(monthly, start_date)
+    except ValueError as e:
+        raise PipelineError(str(e)) from e
+
+
+def abort_outputs(outputs):
+    """处理失败时关闭输出（增量更新的工作簿不保存）"""
+    for output in outputs:
+        try:
+            output.abort()
+        except Exception as e:
+            logger.warning("输出关闭失败: %s", e)
+
+
+def close_outputs(outputs):
+    for output in outputs:
+        output.close()
+
+
+def run_pipeline(file_path, save_path, start_date, end_date, report_path=None, run_stats_sheet=False,
+                 backend="pandas", workers=None, store=None, qty_history=None, cost_history=None,
+                 month_cache=None, update=False, formats=("xlsx",), results_db=None):
+    """完整处理流程：读取报告 → 加载成本表 → 汇总/分月处理 → 写入Excel
+
+    不依赖任何界面组件，出错时抛出异常，由调用方（GUI/CLI）决定如何提示。
+    各阶段统计保存为JSON运行报告（report_path 为空时保存到用户目录），
+    run_stats_sheet=True 时同时写入工作簿的 Run Stats 表。返回 RunReport。
+    backend 选择计算后端（pandas / polars，见 processor.backends）。
+    workers 为跨月处理和并行写入工作簿的进程数：None 自动（数据量大时按CPU核数），1 为顺序处理
+    （见 processor.parallel、processor.xlsx_writer）。
+    store 为 SettlementStore 时从本地数据仓库读取日期范围内的数据，不读取 file_path。
+    qty_history 为历史数量索引（store.qty_history()），本期数据中找不到的QTY从中补充。
+    cost_history 为成本快照（CostHistory），order_import 按订单posted-date当时的成本计算。
+    month_cache 为分月结果缓存（MonthCache），数据和查找表都没有变化的月份直接复用上次的结果。
+    update=True 且 save_path 已存在时增量更新工作簿：只重写Summary和数据有变化的月份（见 processor.workbook）。
+    formats 为输出格式（xlsx / parquet / csv，可多选）；列式输出写入 save_path 去掉扩展名的目录（见 processor.outputs）。
+    results_db 为SQLite结果库路径时，order_details/order_import/Summary 同时按月份写入结果库（见 processor.results_db）。
+    """
+    if (not file_path and store is None) or not save_path:
+        raise PipelineError("Please select source file and save path")
+    backend = get_backend(backend)
+    if update and month_cache is None:
+        month_cache = MonthCache(root=None)
+
+    report = start_run(
+        "run",
+        input=os.path.abspath(file_path) if store is None else f"store:{store.root}",
+        output=os.path.abspath(save_path),
+        start_date=str(start_date.date()),
+        end_date=str(end_date.date()),
+        backend=backend.name,
+        workers=workers,
+        qty_history=None if qty_history is None else len(qty_history),
+        dated_costs=cost_history is not None,
+        update=update,
+        formats=list(formats),
+        results_db=results_db
+    )
+    try:
+        _run(file_path, save_path, start_date, end_date, run_stats_sheet, backend, workers, store,
+             qty_history, cost_history, month_cache, update, formats, results_db)
+    finally:
+        finish_run(report, report_path)
+    return report
+
+
+def _run(file_path, save_path, start_date, end_date, run_stats_sheet, backend, workers, store,
+         qty_history, cost_history, month_cache, update, formats, results_db):
+    # 读取原始数据副本用于QTY填充
+    with stage("parse") as span:
+        if store is not None:
+            raw_source_df = store.load(start_date, end_date)
+            if raw_source_df.empty:
+                raise PipelineError("数据仓库中没有所选日期范围的数据")
+        else:
+            raw_source_df = read_settlement(file_path)
+        span.rows_out = len(raw_source_df)
+
+    # ========== 加载成本表 ==========
+    landed_cost_data, pdb_us_data = load_cost_tables()
+
+    raw_df = raw_source_df.copy()
+    raw_df = raw_df.dropna(subset=['posted-date'])
+    if raw_df.empty:
+        raise PipelineError("No valid date data found in file")
+
+    monthly = start_date.month != end_date.month or start_date.year != end_date.year
+    check_results_month(results_db, monthly, start_date, raw_df['posted-date'].min(), raw_df['posted-date'].max())
+    with stage("open_outputs"):
+        outputs = open_run_outputs(save_path, formats, update, results_db, workers)
+    try:
+        # 增量更新：Summary、Run Stats和Discrepancies总是重写
+        prepare_outputs(outputs, monthly, start_date)
+
+        # Generate summary tables（由按天聚合数据汇总，见 processor.cube）
+        cube = summary_cube(file_path, store, raw_source_df)
+        with stage("generate_summary", rows_in=len(raw_df) if cube is None else len(cube.cells)) as span:
+            if cube is None:
+                pivot_tables = backend.generate_summary(raw_df, start_date, end_date)
+            else:
+                pivot_tables = cube.summary(start_date, end_date)
+                current_run().metadata["total_amount"] = cube.total(start_date, end_date)
+            span.rows_out = sum(len(pivot) for _, pivot in pivot_tables or [])
+        if pivot_tables:
+            for output in outputs:
+                output.write_summary(pivot_tables)
+
+        # Monthly processing logic
+        if monthly:
+            with stage("split_data_by_month", rows_in=len(raw_df)) as span:
+                monthly_data = split_data_by_month(raw_df, start_date, end_date)
+                span.rows_out = sum(len(df) for df in monthly_data.values())
+            periods = []
+            for month_key, month_df in monthly_data.items():
+                month_start = month_df['posted-date'].min().to_pydatetime()
+                month_end = month_df['posted-date'].max().to_pydatetime()
+                periods.append((f"{month_key}_", month_df, month_start, month_end))
+
+            workers = resolve_workers(workers, len(periods), len(raw_df))
+        else:
+            # 处理非分月情况（与原逻辑一致：qty按日期过滤，order使用全部数据）
+            periods = [("", raw_df, start_date, end_date)]
+            workers = 1
+        current_run().metadata["workers"] = workers
+        if "xlsx" in formats:
+            _check_sheet_sizes(_period_order_rows(periods))
+
+        # 输出中记录的缓存键与本次相同的周期保持不变
+        unchanged = common_unchanged(outputs)
+        reconciliation = Reconciliation(cube)
+        order_ranges = {prefix: (period_df['posted-date'].min(), period_df['posted-date'].max())
+                        for prefix, period_df, _, _ in periods}
+        kept = []
+        for prefix, key, sheets in _period_results(backend, periods, raw_source_df, landed_cost_data, pdb_us_data,
+                                                   workers, qty_history, cost_history, month_cache, unchanged):
+            if sheets is None:
+                kept.append(prefix)
+            reconciliation.add_period(prefix, sheets, *order_ranges[prefix])
+            for output in outputs:
+                output.write_period(prefix, key, sheets)
+        if unchanged:
+            current_run().metadata["unchanged_periods"] = len(kept)
+            logger.info("增量更新：%d/%d 个周期未变化，保留原有的表", len(kept), len(periods))
+
+        # 数据仓库运行没有报告汇总行，只核对订单表
+        add_settlements = None if store is not None else (
+            lambda: reconciliation.add_settlements(settlement_totals(file_path), raw_source_df))
+        reconcile(reconciliation, outputs, len(raw_source_df), add_settlements, kept)
+
+        if run_stats_sheet:
+            write_run_stats(outputs)
+    except BaseException:
+        abort_outputs(outputs)
+        raise
+    close_outputs(outputs)
+
+
+def reconcile(reconciliation, outputs, rows_in, add_settlements=None, kept=()):
+    """核对结算汇总行与明细、订单表与Summary订单金额，有差异时写入 Discrepancies 表（见 processor.reconcile）
+
+    add_settlements 在对账阶段内调用，加入结算汇总行的检查（没有汇总行时为None）。
+    增量更新中未变化的周期（kept 中的前缀）不重新核对，沿用输出中原有的差异行。
+    """
+    with stage("reconcile", rows_in=rows_in) as span:
+        if add_settlements is not None:
+            add_settlements()
+        checks = reconciliation.result()
+        discrepancies = checks[checks['difference'] != 0]
+        previous = kept_discrepancies(outputs, kept)
+        if previous is not None:
+            discrepancies = pd.concat([discrepancies, previous])
+        discrepancies = discrepancies.reset_index(drop=True)
+        span.rows_out = len(discrepancies)
+    current_run().metadata["reconciliation"] = {"checks": len(checks), "discrepancies": len(discrepancies)}
+    if discrepancies.empty:
+        logger.info("对账完成：%d 项检查均一致", len(checks))
+        return
+    logger.warning("对账发现 %d 处差异，见 Discrepancies 表", len(discrepancies))
+    for output in outputs:
+        output.write_discrepancies(discrepancies)
+
+
+def _check_sheet_sizes(order_rows):
+    """计算前预估各周期 order/order_details 的行数，超过Excel上限时提前提示将拆分
+
+    order_rows 依次产出 (周期前缀, 订单键去重数)，只需给出可能超过上限的周期。
+    """
+    with stage("check_sheet_sizes"):
+        for prefix, rows in order_rows:
+            if rows >= EXCEL_MAX_ROWS:
+                logger.warning("%sorder_details 预计约 %d 行，超过Excel单表上限，将拆分为 %d 张表",
+                               prefix, rows, sheet_count(rows))
+
+
+def _period_order_rows(periods):
+    """各周期 Order 交易的订单键去重数；明细行数不超过上限的周期订单键数也不会超过，不计算"""
+    for prefix, period_df, _, _ in periods:
+        if len(period_df) < EXCEL_MAX_ROWS:
+            continue
+        orders = period_df.loc[period_df['transaction-type'] == 'Order', ORDER_KEYS]
+        yield prefix, len(orders.drop_duplicates())
+
+
+def _period_results(backend, periods, raw_source_df, landed_cost_data, pdb_us_data,
+                    workers, qty_history, cost_history, month_cache, unchanged=None):
+    """按顺序产出各周期的 (前缀, 缓存键, {表名: DataFrame})
+
+    缓存键与 unchanged 中记录的相同时表为None（工作簿中已有，不需计算）；
+    命中分月缓存的直接复用，其余顺序或在进程池中计算。
+    """
+    unchanged = unchanged or {}
+    cached = {}
+    if month_cache is not None and month_cache.prepare(backend.name, landed_cost_data, pdb_us_data,
+                                                       cost_history, qty_history):
+        for prefix, period_df, start, end in periods:
+            label = prefix.rstrip('_') or 'all'
+            with stage(f"month_cache:{label}", rows_in=len(period_df)) as span:
+                key = month_cache.key(prefix, period_df, start, end, raw_source_df)
+                if key is not None and unchanged.get(prefix) == key:
+                    cached[prefix] = (key, "unchanged")
+                else:
+                    cached[prefix] = (key, month_cache.get(key))
+                span.extra["hit"] = cached[prefix][1] is not None
+        current_run().metadata["month_cache"] = {"hits": month_cache.hits, "misses": month_cache.misses}
+        if month_cache.hits:
+            logger.info("分月缓存命中 %d/%d 个周期", month_cache.hits, len(periods))
+
+    pending = [period for period in periods if cached.get(period[0], (None, None))[1] is None]
+    lookups = shared_lookups(landed_cost_data, pdb_us_data) if workers > 1 and len(pending) > 1 else None
+    if lookups is not None:
+        # 各月在进程池中并行计算，按月份顺序写入
+        logger.info("分月处理使用 %d 个进程", min(workers, len(pending)))
+        computed = process_periods(backend.name, pending, raw_source_df, lookups,
+                                   min(workers, len(pending)), qty_history, cost_history)
+    else:
+        computed = _sequential_periods(backend, pending, raw_source_df, landed_cost_data, pdb_us_data,
+                                       qty_history, cost_history)
+
+    for prefix, *_ in periods:
+        key, hit = cached.get(prefix, (None, None))
+        if hit == "unchanged":
+            yield prefix, key, None
+            continue
+        if hit is not None:
+            for event in hit["events"]:
+                events.report(*event)
+            yield prefix, key, hit["sheets"]
+            continue
+        sheets, captured = next(computed)
+        if month_cache is not None:
+            month_cache.put(key, sheets, captured)
+        yield prefix, key, sheets
+
+
+def _sequential_periods(backend, periods, raw_source_df, landed_cost_data, pdb_us_data,
+                        qty_history, cost_history):
+    for prefix, period_df, start, end in periods:
+        with events.capture() as captured:
+            sheets = _build_period(
+                backend, prefix, period_df, start, end,
+                raw_source_df, landed_cost_data, pdb_us_data,
+                qty_history=qty_history, cost_history=cost_history
+            )
+        for event in captured:
+            events.report(*event)
+        yield sheets, captured
+
+
+def parse_date(value):
+    """解析YYYY-MM-DD格式日期"""
+    return datetime.strptime(value, "%Y-%m-%d")
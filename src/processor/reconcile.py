@@ -0,0 +1,92 @@
+"""自动对账：每次运行结束前核对结算报告与输出表的金额，差异写入 Discrepancies 表
+
+检查项（金额均换算为整数分比较，差额不为0即为差异）：
+    settlement     每个 settlement-id 汇总行的 total-amount 与明细行 amount 合计
+    order_details  各周期 Amazon.com 的 Order 交易中 ItemPrice/ItemWithheldTax/Promotion 金额
+                   （Summary 的同一口径，由按天聚合数据汇总）与 order_details 的 Total_amount + Total_shipping
+    order_import   同上，与 order_import 的 total amount 合计（含 Shipping 行）
+
+Summary 的 Grand Total 还包括佣金、FBA费用等不进入订单表的金额，因此订单表与其中订单部分比较。
+各检查项先收集为整数，最后在一个 DataFrame 上统一计算差额。
+"""
+import pandas as pd
+
+from .backends import ORDER_AMOUNT_TYPES, US_MARKETPLACE
+from .cube import _cents
+
+COLUMNS = ['check', 'scope', 'expected', 'actual', 'difference']
+
+
+def settlement_headers(df):
+    """结算报告中的汇总行（total-amount 不为空）→ DataFrame(settlement-id, total-amount)；没有该列时返回None"""
+    if 'settlement-id' not in df.columns or 'total-amount' not in df.columns:
+        return None
+    headers = df.loc[pd.to_numeric(df['total-amount'], errors='coerce').notna(), ['settlement-id', 'total-amount']]
+    return headers.reset_index(drop=True)
+
+
+def _sheet_cents(df, columns):
+    if df is None or any(col not in df.columns for col in columns):
+        return None
+    return int(_cents(df[columns].sum(axis=1)).sum())
+
+
+class Reconciliation:
+    """收集一次运行的对账检查项"""
+
+    def __init__(self, cube=None, order_cells=None):
+        """cube 为按天聚合数据（见 processor.cube）；没有cube时（SQL模式）可直接给出
+        订单表口径的按天金额 order_cells: DataFrame(posted-date, amount（分）)"""
+        self.cube = cube
+        self._order_cells = order_cells
+        self._checks = []  # (检查项, 范围, 应有金额（分）, 实际金额（分）)
+
+    def add_settlements(self, headers, raw_source_df):
+        """按 settlement-id 核对汇总行金额与明细合计"""
+        if headers is None or 'amount' not in raw_source_df.columns:
+            return
+        expected = _cents(headers['total-amount']).groupby(headers['settlement-id'].to_numpy()).sum()
+        actual = _cents(raw_source_df['amount']).groupby(raw_source_df['settlement-id'].to_numpy()).sum()
+        self.add_settlement_cents(expected, actual)
+
+    def add_settlement_cents(self, expected, actual):
+        """按 settlement-id 核对已换算为分的金额：expected/actual 为以 settlement-id 为索引的Series"""
+        both = pd.concat([expected.rename('expected'), actual.rename('actual')], axis=1).fillna(0).astype('int64')
+        self._checks.extend(
+            ('settlement', str(settlement_id), expected_cents, actual_cents)
+            for settlement_id, expected_cents, actual_cents in zip(both.index, both['expected'], both['actual'])
+        )
+
+    def _order_cents(self, start_date, end_date):
+        """按天聚合数据中订单表口径的金额合计（分）"""
+        if self._order_cells is None:
+            cells = self.cube.cells
+            self._order_cells = cells[
+                (cells['transaction-type'] == 'Order')
+                & cells['amount-type'].isin(ORDER_AMOUNT_TYPES)
+                & (cells['marketplace-name'] == US_MARKETPLACE)
+            ]
+        cells = self._order_cells
+        in_range = (cells['posted-date'] >= start_date) & (cells['posted-date'] <= end_date)
+        return int(cells.loc[in_range, 'amount'].sum())
+
+    def add_period(self, prefix, sheets, start_date, end_date):
+        """核对一个周期的订单表；start_date/end_date 为该周期订单表数据的posted-date范围"""
+        if (self.cube is None and self._order_cells is None) or sheets is None or pd.isna(start_date):
+            return
+        scope = prefix.rstrip('_') or 'all'
+        expected = self._order_cents(start_date, end_date)
+        details = _sheet_cents(sheets.get(f"{prefix}order_details"), ['Total_amount', 'Total_shipping'])
+        if details is not None:
+            self._checks.append(('order_details', scope, expected, details))
+        imported = _sheet_cents(sheets.get(f"{prefix}order_import"), ['total amount'])
+        if imported is not None:
+            self._checks.append(('order_import', scope, expected, imported))
+
+    def result(self):
+        """全部检查项：DataFrame（check, scope, expected, actual, difference），金额单位为元"""
+        checks = pd.DataFrame(self._checks, columns=['check', 'scope', 'expected', 'actual'])
+        checks['difference'] = checks['actual'] - checks['expected']
+        for col in ('expected', 'actual', 'difference'):
+            checks[col] = checks[col].astype('int64') / 100
+        return checks[COLUMNS]
@@ -0,0 +1,158 @@
+"""处理结果数据库（SQLite）：累积保存每次运行的 order_details、order_import 和 Summary
+
+与工作簿/列式输出并列的输出目标（见 processor.outputs）。按月份更新：重新处理某个月时
+先删除该月原有的行再写入，因此多次运行、不同日期范围的结果可以直接跨月查询：
+
+    SELECT month, master_sku, SUM("total QTY") FROM order_import GROUP BY 1, 2;
+
+表结构：
+    order_details / order_import  month + 工作簿中的同名列
+    summary                       month, amount-type, transaction-type, amount（透视表展开为长表）
+    periods                       month, prefix, period_key, updated_at（每个月最近一次写入的缓存键）
+在 month、master_sku、order-id、tax_rate 上建索引。写入在一个事务中完成，处理失败时回滚。
+"""
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+from utils.instrumentation import stage
+
+RESULTS_DB = os.path.join(os.path.expanduser("~"), ".amazon-processor", "results.sqlite")
+
+_INDEXES = {
+    "order_details": ["month", "order-id", "master_sku", "tax_rate"],
+    "order_import": ["month", "master_sku"],
+}
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class ResultsDatabase:
+    """按月份更新的SQLite结果库"""
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.con = sqlite3.connect(path)
+        self.con.execute(
+            'CREATE TABLE IF NOT EXISTS periods '
+            '(month TEXT PRIMARY KEY, prefix TEXT, period_key TEXT, updated_at TEXT)'
+        )
+        self.con.execute(
+            'CREATE TABLE IF NOT EXISTS summary '
+            '(month TEXT, "amount-type" TEXT, "transaction-type" TEXT, amount REAL)'
+        )
+        self.con.execute('CREATE INDEX IF NOT EXISTS idx_summary_month ON summary (month)')
+        self.con.commit()
+        self.start_date = None
+
+    # ========== 表结构 ==========
+    def _columns(self, table):
+        return [row[1] for row in self.con.execute(f'PRAGMA table_info({_quote(table)})')]
+
+    def _ensure_table(self, table, df):
+        """按DataFrame的列建表，已有的表补上新增的列，并建立索引"""
+        existing = self._columns(table)
+        if not existing:
+            columns = ', '.join(_quote(col) for col in ['month'] + list(df.columns))
+            self.con.execute(f'CREATE TABLE {_quote(table)} ({columns})')
+        else:
+            for col in df.columns:
+                if col not in existing:
+                    self.con.execute(f'ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)}')
+        columns = set(self._columns(table))
+        for col in _INDEXES.get(table, []):
+            if col in columns:
+                index = _quote(f"idx_{table}_{col}".replace('-', '_'))
+                self.con.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {_quote(table)} ({_quote(col)})')
+
+    def _insert(self, table, df):
+        # 不用 to_sql：pandas会在写入后自动提交，破坏整次运行的事务
+        columns = ', '.join(_quote(col) for col in df.columns)
+        placeholders = ', '.join('?' for _ in df.columns)
+        values = df.astype(object).where(df.notna(), None)
+        self.con.executemany(f'INSERT INTO {_quote(table)} ({columns}) VALUES ({placeholders})',
+                             values.itertuples(index=False, name=None))
+
+    def _replace_month(self, table, month, df):
+        if self._columns(table):
+            self.con.execute(f'DELETE FROM {_quote(table)} WHERE month = ?', [month])
+        if df is None or df.empty:
+            return
+        self._ensure_table(table, df)
+        rows = df.copy()
+        rows.insert(0, 'month', month)
+        self._insert(table, rows)
+
+    def _month(self, prefix):
+        """周期前缀 → 月份（202401_ → 2024-01；不分月的运行用开始日期所在月份，
+        其数据不超出该月由 pipeline.check_results_month 在运行前检查）"""
+        month = prefix.rstrip('_')
+        if month:
+            return f"{month[:4]}-{month[4:]}"
+        return self.start_date.strftime('%Y-%m')
+
+    # ========== 输出目标接口 ==========
+    def unchanged(self):
+        """已写入的分月结果的 {周期前缀: 缓存键}"""
+        return {
+            prefix: key
+            for prefix, key in self.con.execute(
+                "SELECT prefix, period_key FROM periods WHERE prefix != '' AND period_key IS NOT NULL")
+        }
+
+    def prepare(self, monthly, start_date=None):
+        self.start_date = start_date
+        self.con.execute('BEGIN')
+
+    def write_summary(self, pivot_tables):
+        with stage("results_db:summary"):
+            for month, pivot in pivot_tables:
+                long_df = pivot[pivot['amount-type'] != 'Grand Total'].melt(
+                    id_vars='amount-type', var_name='transaction-type', value_name='amount')
+                long_df = long_df[long_df['transaction-type'] != 'Grand Total']
+                self.con.execute('DELETE FROM summary WHERE month = ?', [str(month)])
+                self._insert('summary', long_df.assign(month=str(month))[
+                    ['month', 'amount-type', 'transaction-type', 'amount']])
+
+    def write_period(self, prefix, key, sheets):
+        if sheets is None:
+            return  # 该月结果未变化，保留已有的行
+        month = self._month(prefix)
+        with stage(f"results_db:{month}"):
+            for table in ("order_details", "order_import"):
+                self._replace_month(table, month, sheets.get(f"{prefix}{table}"))
+            self.con.execute(
+                'INSERT OR REPLACE INTO periods (month, prefix, period_key, updated_at) VALUES (?, ?, ?, ?)',
+                [month, prefix, key, datetime.now().isoformat(timespec='seconds')]
+            )
+
+    def write_run_stats(self, stats_df):
+        pass  # 运行统计只写入工作簿和JSON报告
+
+    def discrepancies(self):
+        return None  # 对账差异只写入工作簿
+
+    def write_discrepancies(self, discrepancies_df):
+        pass  # 对账差异只写入工作簿（JSON报告记录差异数）
+
+    def close(self):
+        with stage("results_db:commit"):
+            self.con.commit()
+            self.con.close()
+
+    def abort(self):
+        self.con.rollback()
+        self.con.close()
+
+
+def query(sql, params=None, path=RESULTS_DB):
+    """在结果库上执行查询，返回DataFrame"""
+    with closing(sqlite3.connect(path)) as con:
+        return pd.read_sql_query(sql, con, params=params)
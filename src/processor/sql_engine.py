@@ -0,0 +1,375 @@
+"""嵌入式SQL执行模式（DuckDB，可选依赖: pip install duckdb）
+
+把一个或多个结算报告注册为 DuckDB 表，汇总透视、订单 des-type 分桶聚合和
+QTY 连接/补充都以SQL执行；数据库文件放在临时目录，超出 memory_limit 时溢写磁盘，
+因此可以在内存有限的电脑上处理一整年的报告。只有聚合后的小表交回pandas，
+复用 data_processing 中的透视整形函数，输出列/类型与内存模式一致。
+
+用法:
+    with SettlementDatabase(["2024-01.txt", "2024-02.txt"], memory_limit="2GB") as db:
+        qty_df = db.process_qty_data(start, end)
+"""
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from .backends import ORDER_KEYS, ORDER_AMOUNT_TYPES, US_MARKETPLACE, _from_cents
+from .data_processing import iter_month_ranges, summary_pivot, pivot_order_amounts, finalize_order_pivot
+from .dates import DATE_FORMATS
+from .google_sheets import add_master_sku_from_gsheet
+from .pipeline import (
+    PipelineError, load_cost_tables, finish_run, write_run_stats, reconcile, check_results_month, _period_sheets, _check_sheet_sizes,
+    open_run_outputs, prepare_outputs, abort_outputs, close_outputs,
+)
+from .reconcile import Reconciliation
+from .workbook import EXCEL_MAX_ROWS
+from utils.instrumentation import start_run, stage
+
+
+_KEY_COLUMNS = ', '.join(f'"{col}"' for col in ORDER_KEYS)
+_KEYS_NOT_NULL = ' AND '.join(f'"{col}" IS NOT NULL' for col in ORDER_KEYS)
+
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class SettlementDatabase:
+    """结算报告的DuckDB表及各处理步骤的SQL实现"""
+
+    def __init__(self, file_paths, memory_limit=None, temp_directory=None, threads=None):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("SQL执行模式需要安装 duckdb: pip install duckdb") from e
+
+        self._workdir = tempfile.mkdtemp(prefix="amazon-processor-", dir=temp_directory)
+        self.con = duckdb.connect(os.path.join(self._workdir, "settlement.duckdb"))
+        self.con.execute(f"SET temp_directory = {_sql_literal(os.path.join(self._workdir, 'spill'))}")
+        if memory_limit:
+            self.con.execute(f"SET memory_limit = {_sql_literal(memory_limit)}")
+        if threads:
+            self.con.execute(f"SET threads = {int(threads)}")
+        self.file_paths = list(file_paths)
+        self.rows = self.register(self.file_paths)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def register(self, file_paths):
+        """把报告文件导入 settlement 表（只保留处理需要的列并转换类型），返回行数
+
+        每个文件的首行汇总行没有 transaction-type / posted-date，会被各查询的条件自然排除；
+        其 total-amount（total_cents）用于对账。
+        """
+        files = ', '.join(_sql_literal(os.path.abspath(path)) for path in file_paths)
+        posted_date = ', '.join(f"TRY_STRPTIME(\"posted-date\", '{fmt}')" for fmt in DATE_FORMATS)
+        self.con.execute(f"""
+            CREATE OR REPLACE TABLE settlement AS
+            SELECT
+                "settlement-id",
+                "transaction-type",
+                "order-id",
+                "shipment-id",
+                "sku",
+                "marketplace-name",
+                "amount-type",
+                "amount-description",
+                CAST(ROUND(TRY_CAST("amount" AS DOUBLE) * 100) AS BIGINT) AS amount_cents,
+                CAST(ROUND(TRY_CAST("total-amount" AS DOUBLE) * 100) AS BIGINT) AS total_cents,
+                TRY_CAST("quantity-purchased" AS BIGINT) AS quantity,
+                CAST(COALESCE({posted_date}) AS DATE) AS posted_date
+            FROM read_csv([{files}], delim='\t', header=true, all_varchar=true,
+                          union_by_name=true, quote='"')
+        """)
+        return self.con.execute("SELECT COUNT(*) FROM settlement").fetchone()[0]
+
+    def _query(self, sql, params=None):
+        return self.con.execute(sql, params or []).df()
+
+    def date_bounds(self):
+        """posted-date 的最小/最大日期，没有有效日期时返回 (None, None)"""
+        start, end = self.con.execute("SELECT MIN(posted_date), MAX(posted_date) FROM settlement").fetchone()
+        if start is None:
+            return None, None
+        return pd.Timestamp(start).to_pydatetime(), pd.Timestamp(end).to_pydatetime()
+
+    def generate_summary(self, start_date, end_date):
+        """与 generate_summary 相同的各月 amount-type × transaction-type 透视表"""
+        cells = self._query("""
+            SELECT strftime(posted_date, '%Y-%m') AS month, "amount-type", "transaction-type",
+                   SUM(amount_cents) AS amount, MIN(rowid) AS _first
+            FROM settlement
+            WHERE posted_date BETWEEN ?::DATE AND ?::DATE
+            GROUP BY ALL
+        """, [start_date, end_date])
+        if cells.empty:
+            return []
+        cells = _from_cents(cells, 'amount')
+
+        # 月份顺序与pandas路径一致（按首次出现顺序）
+        month_order = cells.groupby('month')['_first'].min().sort_values().index
+        return [
+            (pd.Period(month, freq='M'), summary_pivot(cells[cells['month'] == month]))
+            for month in month_order
+        ]
+
+    def process_qty_data(self, start_date, end_date):
+        """与 process_qty_data 相同的数量表（Principal:ItemPrice 行数量按订单键求和）"""
+        qty_df = self._query(f"""
+            SELECT {_KEY_COLUMNS}, COALESCE(SUM(quantity), 0) AS "quantity-purchased"
+            FROM settlement
+            WHERE posted_date BETWEEN ?::DATE AND ?::DATE
+              AND "transaction-type" = 'Order'
+              AND "marketplace-name" = ?
+              AND "amount-description" = 'Principal'
+              AND "amount-type" = 'ItemPrice'
+              AND {_KEYS_NOT_NULL}
+            GROUP BY ALL
+            ORDER BY {_KEY_COLUMNS}
+        """, [start_date, end_date, US_MARKETPLACE])
+        qty_df['quantity-purchased'] = qty_df['quantity-purchased'].astype('Int64')
+        return qty_df.sort_values("shipment-id")
+
+    def process_order_data(self, start_date=None, end_date=None):
+        """与 process_order_data 相同的订单表；不指定日期时使用全部有日期的行"""
+        date_filter = "posted_date IS NOT NULL"
+        params = [US_MARKETPLACE]
+        if start_date is not None:
+            date_filter = "posted_date BETWEEN ?::DATE AND ?::DATE"
+            params = [start_date, end_date] + params
+        amount_types = ', '.join(_sql_literal(t) for t in ORDER_AMOUNT_TYPES)
+        cells = self._query(f"""
+            SELECT {_KEY_COLUMNS}, "amount-description" || ':' || "amount-type" AS "des-type",
+                   SUM(amount_cents) AS amount
+            FROM settlement
+            WHERE {date_filter}
+              AND "transaction-type" = 'Order'
+              AND "amount-type" IN ({amount_types})
+              AND "marketplace-name" = ?
+              AND "amount-description" IS NOT NULL
+              AND {_KEYS_NOT_NULL}
+            GROUP BY ALL
+        """, params)
+        # 每个单元格只剩一行，透视整形交给pandas以保持完全一致的列/类型
+        return finalize_order_pivot(pivot_order_amounts(_from_cents(cells, 'amount')))
+
+    def order_line_dates(self, start_date=None, end_date=None):
+        """与 cost_history.order_line_dates 相同：订单行 Order 交易中最早的posted-date"""
+        date_filter = "posted_date IS NOT NULL"
+        params = []
+        if start_date is not None:
+            date_filter = "posted_date BETWEEN ?::DATE AND ?::DATE"
+            params = [start_date, end_date]
+        dates = self._query(f"""
+            SELECT {_KEY_COLUMNS}, MIN(posted_date) AS "posted-date"
+            FROM settlement
+            WHERE {date_filter}
+              AND "transaction-type" = 'Order'
+            GROUP BY ALL
+        """, params)
+        dates['posted-date'] = pd.to_datetime(dates['posted-date'])
+        return dates
+
+    def order_key_counts(self, periods):
+        """各周期 Order 交易的订单键去重数（order/order_details 的行数），periods 为 (前缀, 起始日, 结束日)，
+        日期为None时使用全部有日期的行；总行数不超过Excel上限时订单键数也不会超过，不查询"""
+        if self.rows < EXCEL_MAX_ROWS:
+            return
+        for prefix, start_date, end_date in periods:
+            date_filter = "posted_date IS NOT NULL"
+            params = []
+            if start_date is not None:
+                date_filter = "posted_date BETWEEN ?::DATE AND ?::DATE"
+                params = [start_date, end_date]
+            rows = self.con.execute(f"""
+                SELECT COUNT(*) FROM (
+                    SELECT DISTINCT {_KEY_COLUMNS}
+                    FROM settlement
+                    WHERE {date_filter}
+                      AND "transaction-type" = 'Order'
+                )
+            """, params).fetchone()[0]
+            yield prefix, rows
+
+    def order_cells(self):
+        """对账用：订单表口径（Amazon.com 的 Order 交易中 ItemPrice/ItemWithheldTax/Promotion）的按天金额（分）"""
+        amount_types = ', '.join(_sql_literal(t) for t in ORDER_AMOUNT_TYPES)
+        cells = self._query(f"""
+            SELECT posted_date AS "posted-date", SUM(amount_cents) AS amount
+            FROM settlement
+            WHERE posted_date IS NOT NULL
+              AND "transaction-type" = 'Order'
+              AND "amount-type" IN ({amount_types})
+              AND "marketplace-name" = ?
+            GROUP BY ALL
+        """, [US_MARKETPLACE])
+        cells['posted-date'] = pd.to_datetime(cells['posted-date'])
+        cells['amount'] = cells['amount'].fillna(0).astype('int64')
+        return cells
+
+    def settlement_cents(self):
+        """对账用：各 settlement-id 汇总行的 total-amount 与明细行 amount 合计（分），返回 (expected, actual)"""
+        totals = self._query("""
+            SELECT "settlement-id",
+                   SUM(total_cents) AS expected,
+                   SUM(amount_cents) FILTER (WHERE total_cents IS NULL) AS actual
+            FROM settlement
+            WHERE "settlement-id" IS NOT NULL
+            GROUP BY ALL
+        """).set_index('settlement-id')
+        return totals['expected'], totals['actual']
+
+    def merge_order_qty(self, order_df, qty_df, qty_history=None):
+        """与 merge_order_qty 相同：左连接数量表，缺失时用全部报告中 ItemWithheldTax 行的数量补充，
+        再查询 qty_history（已导入历史结算的数量索引）"""
+        order_keys = order_df[ORDER_KEYS].reset_index(drop=True)
+        order_keys['_row'] = range(len(order_keys))
+        self.con.register('order_keys', order_keys)
+        self.con.register('qty_keys', qty_df[ORDER_KEYS + ['quantity-purchased']])
+        try:
+            qty = self._query(f"""
+                WITH fill AS (
+                    SELECT {_KEY_COLUMNS}, SUM(quantity) AS fill_qty
+                    FROM settlement
+                    WHERE "amount-type" = 'ItemWithheldTax'
+                      AND "transaction-type" = 'Order'
+                      AND {_KEYS_NOT_NULL}
+                    GROUP BY ALL
+                )
+                SELECT COALESCE(q."quantity-purchased", f.fill_qty) AS QTY
+                FROM order_keys o
+                LEFT JOIN qty_keys q USING ({_KEY_COLUMNS})
+                LEFT JOIN fill f USING ({_KEY_COLUMNS})
+                ORDER BY o._row
+            """)
+        finally:
+            self.con.unregister('order_keys')
+            self.con.unregister('qty_keys')
+
+        # 与 pd.merge 的结果保持一致：新的RangeIndex、列索引无名称
+        merged_df = order_df.reset_index(drop=True)
+        merged_df.columns = merged_df.columns.rename(None)
+        merged_df['QTY'] = qty['QTY'].astype('Int64').to_numpy()
+        if qty_history is not None:
+            merged_df['QTY'] = qty_history.fill(merged_df, merged_df['QTY'])
+        merged_df['QTY'] = merged_df['QTY'].fillna(0)
+        merged_df = add_master_sku_from_gsheet(merged_df)
+
+        columns = [col for col in merged_df.columns if col != 'master_sku'] + ['master_sku']
+        return merged_df[columns]
+
+
+def run_sql_pipeline(file_paths, save_path, start_date=None, end_date=None, memory_limit=None,
+                     temp_directory=None, report_path=None, run_stats_sheet=False, qty_history=None,
+                     cost_history=None, formats=("xlsx",), results_db=None):
+    """SQL模式的完整处理流程，输出与 run_pipeline 相同结构的工作簿
+
+    可一次处理多个报告（例如全年的结算文件）；未指定日期时使用所有报告的日期范围。
+    与内存模式一致：跨月时逐月生成四张表，同月时qty按日期过滤、order使用全部数据。
+    qty_history 为历史数量索引（见 processor.store），报告中找不到的QTY从中补充。
+    cost_history 为成本快照（见 processor.cost_history），按订单posted-date取当时的成本。
+    formats 为输出格式（xlsx / parquet / csv，见 processor.outputs），results_db 为SQLite结果库路径（可选）。
+    """
+    if not file_paths or not save_path:
+        raise PipelineError("Please select source file and save path")
+
+    report = start_run(
+        "run",
+        input=[os.path.abspath(path) for path in file_paths],
+        output=os.path.abspath(save_path),
+        start_date=None if start_date is None else str(start_date.date()),
+        end_date=None if end_date is None else str(end_date.date()),
+        backend="duckdb",
+        memory_limit=memory_limit,
+        dated_costs=cost_history is not None,
+        formats=list(formats),
+        results_db=results_db
+    )
+    try:
+        with stage("parse") as span:
+            db = SettlementDatabase(file_paths, memory_limit=memory_limit, temp_directory=temp_directory)
+            span.rows_out = db.rows
+        with db:
+            _run_sql(db, save_path, start_date, end_date, run_stats_sheet, qty_history, cost_history, formats,
+                     results_db)
+    finally:
+        finish_run(report, report_path)
+    return report
+
+
+def _run_sql(db, save_path, start_date, end_date, run_stats_sheet, qty_history, cost_history, formats,
+             results_db):
+    if start_date is None or end_date is None:
+        min_date, max_date = db.date_bounds()
+        if min_date is None:
+            raise PipelineError("No valid date data found in file")
+        start_date = start_date or min_date
+        end_date = end_date or max_date
+
+    landed_cost_data, pdb_us_data = load_cost_tables()
+
+    monthly = start_date.month != end_date.month or start_date.year != end_date.year
+    check_results_month(results_db, monthly, start_date, *db.date_bounds())
+    with stage("open_outputs"):
+        outputs = open_run_outputs(save_path, formats, update=False, results_db=results_db)
+    try:
+        prepare_outputs(outputs, monthly, start_date)
+        with stage("generate_summary", rows_in=db.rows) as span:
+            pivot_tables = db.generate_summary(start_date, end_date)
+            span.rows_out = sum(len(pivot) for _, pivot in pivot_tables)
+        if pivot_tables:
+            for output in outputs:
+                output.write_summary(pivot_tables)
+
+        if monthly:
+            periods = [(f"{month_key}_", start, end, start, end)
+                       for month_key, start, end in iter_month_ranges(start_date, end_date)]
+        else:
+            periods = [("", start_date, end_date, None, None)]
+
+        if "xlsx" in formats:
+            _check_sheet_sizes(db.order_key_counts(
+                [(prefix, order_start, order_end) for prefix, _, _, order_start, order_end in periods]))
+
+        reconciliation = Reconciliation(order_cells=db.order_cells())
+        for prefix, start, end, order_start, order_end in periods:
+            label = prefix.rstrip('_') or 'all'
+            with stage(f"process_qty_data:{label}") as span:
+                qty_df = db.process_qty_data(start, end)
+                span.rows_out = len(qty_df)
+            with stage(f"process_order_data:{label}") as span:
+                order_df = db.process_order_data(order_start, order_end)
+                span.rows_out = len(order_df)
+            order_dates = db.order_line_dates(order_start, order_end) if cost_history is not None else None
+            sheets = _period_sheets(
+                prefix, qty_df, order_df,
+                lambda: db.merge_order_qty(order_df, qty_df, qty_history),
+                landed_cost_data, pdb_us_data, cost_history, order_dates
+            )
+            # 同月时order使用全部有日期的数据
+            reconciliation.add_period(prefix, sheets, *((order_start, order_end) if order_start is not None
+                                                       else db.date_bounds()))
+            for output in outputs:
+                output.write_period(prefix, None, sheets)
+
+        reconcile(reconciliation, outputs, db.rows,
+                  lambda: reconciliation.add_settlement_cents(*db.settlement_cents()))
+
+        if run_stats_sheet:
+            write_run_stats(outputs)
+    except BaseException:
+        abort_outputs(outputs)
+        raise
+    close_outputs(outputs)
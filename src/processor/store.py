@@ -0,0 +1,391 @@
+"""本地历史结算数据仓库（Parquet列存，可选依赖: pip install pyarrow）
+
+每个结算文件只导入一次，按 marketplace 和月份分区保存：
+
+    <root>/marketplace=Amazon.com/month=2024-01/part-<settlement-id>-<导入时间ns>.parquet
+    <root>/manifest.json    已导入的文件（内容哈希）和各settlement-id的汇总行/分区/行数
+    <root>/qty_index.parquet  全部历史订单行的 (order-id, shipment-id, sku) → 数量 索引
+    <root>/order_index.sqlite 订单号/货件号 → 明细行 查询索引（见 processor.order_index）
+
+- 同一文件再次导入：按内容哈希直接跳过
+- 导入先写暂存文件，清单保存后才改名发布，中途退出不会留下清单之外的分区数据
+- 与已导入数据重叠的文件（如同一settlement重新下载）：按行内容哈希+重复序号去重，只追加新行
+- 读取时只打开日期范围/marketplace 覆盖的分区（分区裁剪），返回与 read_settlement 相同结构的数据
+- 数量索引随导入增量更新，用于跨结算期补充QTY（价格行与税行落在不同结算期时）
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from .backends import ORDER_KEYS
+from .order_index import INDEX_FILE, open_index
+from .pipeline import read_settlement
+
+logger = logging.getLogger("amazon_processor")
+
+STORE_DIR = os.path.join(os.path.expanduser("~"), ".amazon-processor", "store")
+MANIFEST_FILE = "manifest.json"
+QTY_INDEX_FILE = "qty_index.parquet"
+NO_PARTITION = "_none"
+
+# 行去重键（不写入报告数据）
+_ROW_HASH = "_row_hash"
+_ROW_SEQ = "_row_seq"
+# 导入中的分区文件后缀：清单保存前不会被读取
+_STAGED = ".staged"
+
+_PARTITION_RE = re.compile(r"^marketplace=(?P<marketplace>.+)$")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("本地数据仓库需要安装 pyarrow: pip install pyarrow") from e
+
+
+def _file_sha1(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _partition_value(value):
+    """分区目录名：空值为 _none，去掉路径中不允许的字符"""
+    if value is None or pd.isna(value) or str(value).strip() == "":
+        return NO_PARTITION
+    return re.sub(r'[\\/:*?"<>|=]', '_', str(value).strip())
+
+
+def row_keys(df):
+    """行内容哈希与重复序号（完全相同的行依次编号0,1,2…）
+
+    数值列统一按float64、其余列按字符串计算哈希，不受各文件类型推断差异的影响。
+    """
+    canonical = pd.DataFrame(index=df.index)
+    for col in sorted(df.columns):
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            canonical[col] = series.dt.strftime('%Y-%m-%d').fillna('')
+        elif pd.api.types.is_numeric_dtype(series):
+            canonical[col] = series.astype('float64')
+        else:
+            canonical[col] = series.astype('object').where(series.notna(), '').astype(str)
+    hashes = pd.util.hash_pandas_object(canonical, index=False)
+    seq = hashes.groupby(hashes).cumcount()
+    return hashes.astype('uint64'), seq.astype('int64')
+
+
+def qty_contributions(df):
+    """订单行中可用于补充QTY的数量：Principal:ItemPrice 行与 ItemWithheldTax 行分别按订单键求和"""
+    orders = df[(df['transaction-type'] == 'Order') & df[ORDER_KEYS].notna().all(axis=1)]
+    principal = (orders['amount-type'] == 'ItemPrice') & (orders['amount-description'] == 'Principal')
+    withheld = orders['amount-type'] == 'ItemWithheldTax'
+    qty = pd.to_numeric(orders['quantity-purchased'], errors='coerce')
+    parts = orders[ORDER_KEYS].assign(
+        principal_qty=qty.where(principal),
+        withheld_qty=qty.where(withheld),
+    )[principal | withheld]
+    return _sum_qty(parts)
+
+
+def _sum_qty(parts):
+    return parts.groupby(ORDER_KEYS, as_index=False)[['principal_qty', 'withheld_qty']].sum(min_count=1)
+
+
+class QtyHistory:
+    """(order-id, shipment-id, sku) → 数量 的历史索引，按键哈希查找
+
+    优先使用 Principal:ItemPrice 行的数量，没有时使用 ItemWithheldTax 行的数量（与 fill_missing_qty 相同）。
+    """
+
+    def __init__(self, index_df):
+        qty = index_df['principal_qty'].fillna(index_df['withheld_qty'])
+        self._qty = pd.Series(qty.to_numpy(), index=pd.MultiIndex.from_frame(index_df[ORDER_KEYS].astype(object)))
+
+    def __len__(self):
+        return len(self._qty)
+
+    def lookup(self, keys_df):
+        """返回与 keys_df 行对齐的数量（找不到为NaN）"""
+        keys = pd.MultiIndex.from_frame(keys_df[ORDER_KEYS].astype(object))
+        return pd.Series(self._qty.reindex(keys).to_numpy(), index=keys_df.index)
+
+    def fill(self, df, qty):
+        """用历史数量填充 qty 中的缺失值，返回新的Series"""
+        missing = qty.isna()
+        if not missing.any():
+            return qty
+        found = self.lookup(df.loc[missing])
+        logger.info("从历史结算补充 %d/%d 行缺失数量", found.notna().sum(), missing.sum())
+        return qty.fillna(found)
+
+
+class SettlementStore:
+    """按 marketplace/月份 分区的结算数据仓库"""
+
+    def __init__(self, root=STORE_DIR):
+        _require_pyarrow()
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.manifest = self._load_manifest()
+        self._recover()
+
+    # ========== 清单 ==========
+    def _load_manifest(self):
+        path = os.path.join(self.root, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {"files": {}, "settlements": {}}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        """先写临时文件再替换，避免中途退出损坏"""
+        path = os.path.join(self.root, MANIFEST_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+    # ========== 导入 ==========
+    def ingest(self, file_path):
+        """导入一个结算文件，返回新增行数（文件已导入过时为0）"""
+        content_hash = _file_sha1(file_path)
+        if content_hash in self.manifest["files"]:
+            logger.info("已导入，跳过: %s", file_path)
+            return 0
+
+        header = pd.read_csv(file_path, delimiter='\t', nrows=1)
+        df = read_settlement(file_path).copy()
+        df[_ROW_HASH], df[_ROW_SEQ] = row_keys(df)
+
+        added, staged = [], []
+        try:
+            for settlement_id, settlement_df in df.groupby('settlement-id', sort=False, dropna=False):
+                sid = str(int(settlement_id)) if pd.notna(settlement_id) else NO_PARTITION
+                entry = self.manifest["settlements"].setdefault(sid, {"partitions": [], "rows": 0})
+                if entry["partitions"]:
+                    settlement_df = self._new_rows(sid, settlement_df, entry["partitions"])
+                written = self._write_partitions(sid, settlement_df, entry)
+                if written:
+                    staged.extend(written)
+                    added.append(settlement_df)
+                header_row = header[header['settlement-id'] == settlement_id]
+                if not header_row.empty:
+                    entry["header"] = {
+                        col: (None if pd.isna(value) else value.item() if hasattr(value, 'item') else value)
+                        for col, value in header_row.iloc[0].items()
+                        if col in ('settlement-start-date', 'settlement-end-date', 'deposit-date',
+                                   'total-amount', 'currency')
+                    }
+
+            rows_added = sum(len(part) for part in added)
+            self.manifest["files"][content_hash] = {
+                "path": os.path.abspath(file_path),
+                "ingested_at": datetime.now().isoformat(timespec="seconds"),
+                "rows_added": rows_added,
+            }
+            # 提交点：清单先记下暂存的分区文件再发布，之后中途退出由下次打开仓库时补完
+            self.manifest["pending"] = staged
+            self._save_manifest()
+        except BaseException:
+            for name in staged:
+                self._remove(name)
+            self.manifest = self._load_manifest()
+            raise
+
+        self._publish(staged)
+        if added:
+            new_rows = pd.concat(added)
+            self._update_qty_index(new_rows)
+            with open_index(self.root) as index:
+                index.add(new_rows)
+        del self.manifest["pending"]
+        self._save_manifest()
+        logger.info("%s: 新增 %d 行", file_path, rows_added)
+        return rows_added
+
+    def _new_rows(self, sid, settlement_df, partitions):
+        """去掉该settlement已导入过的行"""
+        frames = [pd.read_parquet(path, columns=[_ROW_HASH, _ROW_SEQ])
+                  for path in self._partition_files(partitions, sid)]
+        existing = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if existing.empty:
+            return settlement_df
+        known = pd.MultiIndex.from_frame(existing)
+        keys = pd.MultiIndex.from_frame(settlement_df[[_ROW_HASH, _ROW_SEQ]])
+        return settlement_df[~keys.isin(known)]
+
+    def _write_partitions(self, sid, df, entry):
+        """按分区写暂存文件（读取时不可见），返回暂存文件的相对路径"""
+        if df.empty:
+            return []
+        marketplace = df['marketplace-name'].map(_partition_value)
+        month = df['posted-date'].dt.strftime('%Y-%m').fillna(NO_PARTITION)
+        stamp = time.time_ns()
+        staged = []
+        for (market, month_key), part in df.groupby([marketplace, month], sort=True):
+            partition = f"marketplace={market}/month={month_key}"
+            directory = os.path.join(self.root, *partition.split('/'))
+            os.makedirs(directory, exist_ok=True)
+            name = f"{partition}/part-{sid}-{stamp}.parquet{_STAGED}"
+            part.to_parquet(self._path(name), index=False)
+            staged.append(name)
+            if partition not in entry["partitions"]:
+                entry["partitions"].append(partition)
+        entry["rows"] += len(df)
+        return staged
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def _remove(self, name):
+        if os.path.exists(self._path(name)):
+            os.remove(self._path(name))
+
+    def _publish(self, staged):
+        """暂存文件改名为正式分区文件（已发布的跳过）"""
+        for name in staged:
+            path = self._path(name)
+            if os.path.exists(path):
+                os.replace(path, path[:-len(_STAGED)])
+
+    def _recover(self):
+        """补完上次中途退出的导入
+
+        清单已提交的暂存文件发布后重建两个索引（不确定退出前更新到哪一步）；
+        清单未提交的暂存文件直接删除，该文件下次导入时重新写入。
+        """
+        pending = self.manifest.get("pending")
+        if pending is not None:
+            logger.warning("上次导入未完成，发布 %d 个分区文件并重建索引", len(pending))
+            self._publish(pending)
+            self.rebuild_qty_index()
+            self._rebuild_order_index().close()
+            del self.manifest["pending"]
+            self._save_manifest()
+        for partition in self.partitions():
+            directory = self._path(partition)
+            for name in os.listdir(directory):
+                if name.endswith(_STAGED):
+                    os.remove(os.path.join(directory, name))
+
+    # ========== 数量索引 ==========
+    def _qty_index_path(self):
+        return os.path.join(self.root, QTY_INDEX_FILE)
+
+    def _update_qty_index(self, new_rows):
+        """把新导入行的数量累加进索引（导入已去重，直接求和即可）"""
+        contributions = qty_contributions(new_rows)
+        path = self._qty_index_path()
+        if os.path.exists(path):
+            contributions = _sum_qty(pd.concat([pd.read_parquet(path), contributions], ignore_index=True))
+        contributions.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    def rebuild_qty_index(self):
+        """从全部分区重建数量索引（索引文件缺失时使用）"""
+        columns = ORDER_KEYS + ['transaction-type', 'amount-type', 'amount-description', 'quantity-purchased']
+        frames = [qty_contributions(pd.read_parquet(path, columns=columns))
+                  for path in self._partition_files(self.partitions())]
+        index_df = _sum_qty(pd.concat(frames, ignore_index=True)) if frames else qty_contributions(
+            pd.DataFrame(columns=columns))
+        index_df.to_parquet(self._qty_index_path(), index=False)
+        return index_df
+
+    def qty_history(self):
+        """加载历史数量索引"""
+        path = self._qty_index_path()
+        index_df = pd.read_parquet(path) if os.path.exists(path) else self.rebuild_qty_index()
+        return QtyHistory(index_df)
+
+    def order_index(self):
+        """打开订单查询索引；索引为空而仓库有数据时（旧版本仓库）先从全部分区重建"""
+        index = open_index(self.root)
+        if len(index) == 0 and self.manifest["settlements"]:
+            index.close()
+            index = self._rebuild_order_index()
+        return index
+
+    def _rebuild_order_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if os.path.exists(path):
+            os.remove(path)
+        index = open_index(self.root)
+        for path in self._partition_files(self.partitions()):
+            index.add(pd.read_parquet(path))
+        return index
+
+    # ========== 读取 ==========
+    def _partition_files(self, partitions, settlement_id=None):
+        prefix = "part-" if settlement_id is None else f"part-{settlement_id}-"
+        for partition in partitions:
+            directory = os.path.join(self.root, *partition.split('/'))
+            if os.path.isdir(directory):
+                for name in sorted(os.listdir(directory)):
+                    if name.startswith(prefix) and name.endswith('.parquet'):
+                        yield os.path.join(directory, name)
+
+    def partitions(self, start_date=None, end_date=None, marketplaces=None):
+        """日期范围/marketplace 覆盖的分区（不指定日期时包含没有posted-date的分区）"""
+        start_month = None if start_date is None else start_date.strftime('%Y-%m')
+        end_month = None if end_date is None else end_date.strftime('%Y-%m')
+        wanted = None if marketplaces is None else {_partition_value(m) for m in marketplaces}
+        selected = []
+        if not os.path.isdir(self.root):
+            return selected
+        for market_dir in sorted(os.listdir(self.root)):
+            match = _PARTITION_RE.match(market_dir)
+            if not match or (wanted is not None and match.group('marketplace') not in wanted):
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(self.root, market_dir))):
+                month = month_dir.split('=', 1)[-1]
+                if month == NO_PARTITION:
+                    if start_date is not None or end_date is not None:
+                        continue
+                elif (start_month and month < start_month) or (end_month and month > end_month):
+                    continue
+                selected.append(f"{market_dir}/{month_dir}")
+        return selected
+
+    def load(self, start_date=None, end_date=None, marketplaces=None):
+        """读取日期范围内的数据（按posted-date排序），结构与 read_settlement 的结果相同"""
+        frames = [pd.read_parquet(path) for path in
+                  self._partition_files(self.partitions(start_date, end_date, marketplaces))]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True).drop(columns=[_ROW_HASH, _ROW_SEQ])
+        df = df.sort_values('posted-date', kind='stable')
+        if start_date is not None:
+            df = df[df['posted-date'] >= start_date]
+        if end_date is not None:
+            df = df[df['posted-date'] <= end_date]
+        return df.reset_index(drop=True)
+
+    def date_bounds(self):
+        """仓库中posted-date的最小/最大日期（只读取首尾月份分区的日期列）"""
+        dated = [p for p in self.partitions() if not p.endswith(f"month={NO_PARTITION}")]
+        if not dated:
+            return None, None
+        months = sorted({p.split('month=', 1)[1] for p in dated})
+        edges = [p for p in dated if p.endswith(f"month={months[0]}") or p.endswith(f"month={months[-1]}")]
+        dates = pd.concat([pd.read_parquet(path, columns=['posted-date'])['posted-date']
+                           for path in self._partition_files(edges)]).dropna()
+        if dates.empty:
+            return None, None
+        return dates.min().to_pydatetime(), dates.max().to_pydatetime()
+
+    def info(self):
+        """各settlement的行数与分区"""
+        return {
+            sid: {"rows": entry["rows"], "partitions": entry["partitions"], **entry.get("header", {})}
+            for sid, entry in self.manifest["settlements"].items()
+        }
@@ -0,0 +1,129 @@
+"""监听文件夹模式：自动处理新下载/更新的结算报告
+
+轮询目录中的 .txt 结算文件，文件大小和修改时间在两次轮询间保持不变（同步完成）后
+处理一次，在源文件旁生成同名 .xlsx。已处理文件的签名记录在目录下的状态文件中，
+重启后不会重复处理。进程常驻期间复用已解析报告和Google Sheet查找表缓存。
+"""
+import json
+import logging
+import os
+import time
+
+from utils import events
+from .google_sheets import set_lookup_cache
+from .pipeline import run_pipeline, read_settlement
+
+logger = logging.getLogger("amazon_processor")
+
+STATE_FILE = ".amazon-processor-watch.json"
+DEFAULT_INTERVAL = 60           # 轮询间隔（秒）
+DEFAULT_LOOKUP_TTL = 30 * 60    # 查找表缓存有效期（秒）
+
+
+def load_state(directory):
+    """读取已处理文件记录"""
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("状态文件损坏，将重新处理全部文件: %s", e)
+        return {}
+
+
+def save_state(directory, state):
+    """保存已处理文件记录（先写临时文件再替换，避免中途退出损坏）"""
+    path = os.path.join(directory, STATE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def scan_directory(directory):
+    """返回目录下所有结算文件的签名 {文件名: [mtime_ns, size]}"""
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith('.txt'):
+                stat = entry.stat()
+                files[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    return files
+
+
+def output_path_for(source_path):
+    """输出工作簿与源文件同目录同名"""
+    return os.path.splitext(source_path)[0] + ".xlsx"
+
+
+def process_settlement_file(source_path, **run_options):
+    """按文件自身的日期范围处理单个结算文件，返回输出路径
+
+    run_options 为传给 run_pipeline 的其他参数（如 cost_history、month_cache）。
+    """
+    raw_df = read_settlement(source_path)
+    dates = raw_df['posted-date'].dropna()
+    if dates.empty:
+        raise ValueError("No valid date data found")
+
+    start_date = dates.min().to_pydatetime()
+    end_date = dates.max().to_pydatetime()
+    save_path = output_path_for(source_path)
+    run_pipeline(source_path, save_path, start_date, end_date, **run_options)
+    return save_path
+
+
+def watch_folder(directory, interval=DEFAULT_INTERVAL, once=False, lookup_ttl=DEFAULT_LOOKUP_TTL,
+                 should_stop=None, run_options=None):
+    """监听目录并处理新增或变化的结算文件
+
+    once=True 时只扫描处理一次当前文件后返回（不等待同步稳定）；
+    should_stop 为可选回调，返回True时退出循环。返回本次处理的文件数。
+    run_options 为可选回调，每个文件处理前调用，返回传给 run_pipeline 的其他参数
+    （成本快照、分月缓存等在两次处理之间可能变化，因此每个文件重新构建）。
+    """
+    if not os.path.isdir(directory):
+        raise NotADirectoryError(directory)
+
+    set_lookup_cache(lookup_ttl)
+    state = load_state(directory)
+    pending = {}  # 上一轮看到但尚未稳定的文件签名
+    processed = 0
+
+    logger.info("开始监听 %s（间隔 %ss）", directory, interval)
+    while True:
+        current = scan_directory(directory)
+        for name, signature in sorted(current.items()):
+            record = state.get(name)
+            if record and record.get('signature') == signature:
+                continue
+
+            # 文件仍在写入/同步时等待下一轮
+            if not once and pending.get(name) != signature:
+                pending[name] = signature
+                continue
+            pending.pop(name, None)
+
+            source_path = os.path.join(directory, name)
+            logger.info("处理 %s", name)
+            started = time.time()
+            try:
+                save_path = process_settlement_file(source_path, **(run_options() if run_options else {}))
+                state[name] = {
+                    'signature': signature,
+                    'output': os.path.basename(save_path),
+                    'processed_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                processed += 1
+                events.info("Watch", f"{name} → {os.path.basename(save_path)} ({time.time() - started:.1f}s)")
+            except Exception as e:
+                # 记录失败签名，文件再次变化时重试
+                state[name] = {'signature': signature, 'error': str(e)}
+                events.error("Watch", f"处理 {name} 失败: {str(e)}")
+            save_state(directory, state)
+
+        if once or (should_stop is not None and should_stop()):
+            return processed
+        time.sleep(interval)
@@ -0,0 +1,212 @@
+"""Excel工作簿输出：写表、行数上限拆分、增量更新和表顺序
+
+各表先收集，保存时才写文件。新建工作簿时数据量足够大则由多个进程并行序列化各表
+（见 processor.xlsx_writer），否则用 pandas 的 ExcelWriter 逐表写入。
+
+增量更新（update=True 且工作簿已存在）时只读取现有工作簿的表清单和自定义属性，
+只生成 Summary、Run Stats、Discrepancies 和数据有变化的月份的表，直接替换zip中对应的部件，
+其余月份的表不解析也不重新序列化。每个周期的缓存键（见 processor.memo）记录在工作簿的
+自定义文档属性中，下次更新时键相同且表仍在的月份不再计算也不再写入。
+"""
+import os
+import re
+
+import pandas as pd
+
+from utils.instrumentation import stage
+from .parallel import resolve_workers
+from .xlsx_writer import ExistingWorkbook, update_workbook, write_workbook
+
+# Excel单表最大行数（含表头）
+EXCEL_MAX_ROWS = 1_048_576
+
+# 自定义文档属性名前缀：amazon_processor:<周期前缀> → 缓存键
+_KEY_PROPERTY = "amazon_processor:"
+
+# 周期表名：<YYYYMM_>qty / order / order_details / order_import，超过行数上限拆分的续表加 _2、_3...
+_PERIOD_SHEET_RE = re.compile(r"^(\d{6}_)?(qty|order|order_details|order_import)(?:_(\d+))?$")
+_SUFFIX_ORDER = {"qty": 0, "order": 1, "order_details": 2, "order_import": 3}
+
+
+def sheet_parts(sheet_name, df, max_rows=EXCEL_MAX_ROWS):
+    """按Excel行数上限拆分：返回 [(表名, DataFrame), ...]，续表命名为 <表名>_2、<表名>_3 ..."""
+    rows_per_sheet = max_rows - 1
+    if len(df) <= rows_per_sheet:
+        return [(sheet_name, df)]
+    parts = []
+    for number, start in enumerate(range(0, len(df), rows_per_sheet), start=1):
+        name = sheet_name if number == 1 else f"{sheet_name}_{number}"
+        parts.append((name, df.iloc[start:start + rows_per_sheet]))
+    return parts
+
+
+def sheet_count(rows, max_rows=EXCEL_MAX_ROWS):
+    """rows 行数据需要的表数"""
+    return max(1, -(-rows // (max_rows - 1)))
+
+
+def _sheet_sort_key(name):
+    if name == 'Summary':
+        return (0, "", 0, 0)
+    match = _PERIOD_SHEET_RE.match(name)
+    if match:
+        return (1, match.group(1) or "", _SUFFIX_ORDER[match.group(2)], int(match.group(3) or 1))
+    return (2, "", 0, 0)
+
+
+class WorkbookOutput:
+    """输出到 .xlsx 工作簿"""
+
+    def __init__(self, save_path, update=False, workers=None):
+        self.save_path = save_path
+        self.update = update and os.path.exists(save_path)
+        self.workers = workers
+        # 各表先收集为 {表名: [(起始行, DataFrame, float_format), ...]}，保存时才写文件
+        self._sheets = {}
+        # 增量更新：现有工作簿的表清单和属性（见 xlsx_writer.ExistingWorkbook），以及要删除的表
+        self._existing = ExistingWorkbook(save_path) if self.update else None
+        self._removed = set()
+        self.writer = None
+        self.keys = {}
+
+    # ========== 现有工作簿 ==========
+    def _sheet_names(self):
+        return [name for name in self._existing.sheets if name not in self._removed]
+
+    def _period_sheet_names(self, prefix):
+        """现有工作簿中属于该周期的表名"""
+        names = []
+        for name in self._sheet_names():
+            match = _PERIOD_SHEET_RE.match(name)
+            if match and (match.group(1) or "") == prefix:
+                names.append(name)
+        return names
+
+    def _remove_sheets(self, names):
+        self._removed.update(names)
+
+    def unchanged(self):
+        """现有工作簿记录的 {周期前缀: 缓存键}（只含表仍在的周期；新建的工作簿返回空字典）"""
+        if not self.update:
+            return {}
+        keys = {}
+        for name, value in self._existing.properties.items():
+            prefix = name[len(_KEY_PROPERTY):]
+            if name.startswith(_KEY_PROPERTY) and self._period_sheet_names(prefix):
+                keys[prefix] = value
+        return keys
+
+    def discrepancies(self):
+        """现有工作簿的 Discrepancies 表（只在增量更新且有该表时读取；否则为None）"""
+        if not self.update or 'Discrepancies' not in self._existing.sheets:
+            return None
+        return pd.read_excel(self.save_path, sheet_name='Discrepancies', dtype={'check': str, 'scope': str})
+
+    def prepare(self, monthly, start_date=None):
+        """增量更新：分月方式需与工作簿一致（分月运行删除原有的整体表），Summary、Run Stats和Discrepancies总是重写"""
+        if not self.update:
+            return
+        prefixes = {match.group(1) or "" for match in map(_PERIOD_SHEET_RE.match, self._sheet_names()) if match}
+        if monthly:
+            self._remove_sheets(self._period_sheet_names(""))
+            self.keys[""] = None
+        elif prefixes - {""}:
+            raise ValueError("所选日期范围只有一个月，无法增量更新分月工作簿，请选择跨月的日期范围")
+        self._remove_sheets(['Summary', 'Run Stats', 'Discrepancies'])
+
+    # ========== 写入 ==========
+    def write_sheet(self, df, sheet_name):
+        # 前一步处理失败的表（None）不写入；超过Excel行数上限时拆分为 <表名>_2、_3 ... 续表
+        if df is None:
+            return
+        for part_name, part in sheet_parts(sheet_name, df):
+            self._sheets[part_name] = [(0, part, None)]
+
+    def write_summary(self, pivot_tables):
+        """各月汇总透视表依次写入Summary表（间隔3行）"""
+        blocks = []
+        start_row = 0
+        for month, pivot in pivot_tables:
+            blocks.append((start_row, pivot, "%.2f"))
+            start_row += len(pivot) + 3
+        self._sheets['Summary'] = blocks
+
+    def write_period(self, prefix, key, sheets):
+        """写入一个周期的表；sheets 为None表示该周期未变化，保留现有的表"""
+        self.keys[prefix] = key
+        if sheets is None:
+            return
+        if self.update:
+            self._remove_sheets(self._period_sheet_names(prefix))
+        for sheet_name, df in sheets.items():
+            self.write_sheet(df, sheet_name)
+
+    def write_discrepancies(self, discrepancies_df):
+        """对账差异（见 processor.reconcile）"""
+        self.write_sheet(discrepancies_df, 'Discrepancies')
+
+    def write_run_stats(self, stats_df):
+        self._sheets['Run Stats'] = [(0, stats_df, None)]
+
+    # ========== 保存 ==========
+    def _workers(self):
+        rows = sum(len(df) for blocks in self._sheets.values() for _, df, _ in blocks)
+        return rows, resolve_workers(self.workers, len(self._sheets), rows)
+
+    def _write_keys(self):
+        """把各周期的缓存键写入工作簿的自定义文档属性（键为None的周期删除记录）"""
+        if self.writer.engine == 'openpyxl':
+            from openpyxl.packaging.custom import StringProperty
+
+            props = self.writer.book.custom_doc_props
+            for prefix, key in self.keys.items():
+                name = _KEY_PROPERTY + prefix
+                if name in props.names:
+                    del props[name]
+                if key is not None:
+                    props.append(StringProperty(name=name, value=key))
+        elif self.writer.engine == 'xlsxwriter':
+            for prefix, key in self.keys.items():
+                if key is not None:
+                    self.writer.book.set_custom_property(_KEY_PROPERTY + prefix, key)
+
+    def _save_collected(self):
+        """保存收集的各表：行数足够多时多进程并行序列化，否则逐表写入"""
+        rows, workers = self._workers()
+        if workers > 1:
+            properties = {_KEY_PROPERTY + prefix: key for prefix, key in self.keys.items() if key is not None}
+            with stage("save_workbook", rows_in=rows) as span:
+                span.extra["workers"] = workers
+                write_workbook(self.save_path, self._sheets, workers, properties)
+            return
+        self.writer = pd.ExcelWriter(self.save_path)
+        for sheet_name, blocks in self._sheets.items():
+            with stage(f"to_excel:{sheet_name}", rows_in=sum(len(df) for _, df, _ in blocks)):
+                for start_row, df, float_format in blocks:
+                    df.to_excel(self.writer, sheet_name=sheet_name, index=False,
+                                startrow=start_row, float_format=float_format)
+        with stage("save_workbook"):
+            self._write_keys()
+            self.writer.close()
+
+    def _save_update(self):
+        """增量更新：只把重写的表和变化的属性写入现有工作簿，其余表的XML原样保留"""
+        rows, workers = self._workers()
+        kept = [name for name in self._sheet_names() if name not in self._sheets]
+        order = sorted(kept + list(self._sheets), key=_sheet_sort_key)
+        properties = {_KEY_PROPERTY + prefix: key for prefix, key in self.keys.items()}
+        with stage("save_workbook", rows_in=rows) as span:
+            span.extra["workers"] = workers
+            span.extra["sheets_written"] = len(self._sheets)
+            update_workbook(self._existing, self._sheets, order, properties, workers)
+
+    def close(self):
+        if self.update:
+            self._save_update()
+        else:
+            self._save_collected()
+
+    def abort(self):
+        """处理失败：增量更新时不保存（保留原工作簿），新建的工作簿保存已写入的部分"""
+        if not self.update:
+            self._save_collected()
@@ -0,0 +1,486 @@
+"""多进程并行写入xlsx：各表的XML在子进程中生成，主进程按原表顺序组装工作簿
+
+xlsx是一个zip包，每张表是独立的 xl/worksheets/sheetN.xml。openpyxl 逐表、逐单元格
+串行序列化，大的跨月工作簿写入时间是所有表之和。这里每张表交给一个子进程直接生成
+工作表XML（字符串用内联字符串 inlineStr，不需要全局共享字符串表），写入临时文件；
+主进程按表的原始顺序把各XML和 workbook.xml、styles.xml 等组装成工作簿，
+写入时间约等于最大一张表的序列化时间。
+
+单元格的值与 DataFrame.to_excel(index=False) 经openpyxl写入的相同（NaN为空单元格，inf写为字符串，
+float_format 只影响写入的值，数字按 %.16g 写入）；表头样式与所装pandas版本的默认一致
+（2.x 为粗体、细边框、居中，3.0 起不设样式）。
+"""
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time as dt_time
+from xml.sax.saxutils import escape, quoteattr, unescape
+
+import numpy as np
+import pandas as pd
+
+from utils.instrumentation import start_run, end_run, current_run, stage
+
+# 样式索引（见 _STYLES_XML 的 cellXfs）：(表头, 日期时间, 日期)；更新现有工作簿时换为并入其 styles.xml 后的索引
+_STYLES = (1, 2, 3)
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+# XML 1.0 不允许的控制字符
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_STYLES_XML = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="{_NS_MAIN}">
+<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/><numFmt numFmtId="165" formatCode="yyyy-mm-dd"/></numFmts>
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/><family val="2"/></font><font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border><border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="top"/></xf><xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/><xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+
+def column_letter(index):
+    """0起的列号 → Excel列名（0 → A，26 → AA）"""
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _excel_serial(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            raise ValueError("Excel does not support datetimes with timezones. "
+                             "Please ensure that datetimes are timezone unaware before writing to Excel.")
+        delta = value - _EXCEL_EPOCH
+    else:
+        delta = datetime.combine(value, dt_time()) - _EXCEL_EPOCH
+    return f"{delta.days + delta.seconds / 86400 + delta.microseconds / 86_400_000_000:.16g}"
+
+
+def _cell(ref, value, style=0, styles=_STYLES):
+    """单个单元格的XML；空值返回空字符串（不写单元格）"""
+    s = f' s="{style}"' if style else ""
+    if value is None or isinstance(value, str) and value == "":
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c r="{ref}"{s} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, np.integer)):
+        return f'<c r="{ref}"{s}><v>{int(value)}</v></c>'
+    if isinstance(value, (float, np.floating)):
+        return f'<c r="{ref}"{s}><v>{float(value):.16g}</v></c>'
+    if isinstance(value, datetime):
+        return f'<c r="{ref}" s="{style or styles[1]}"><v>{_excel_serial(value)}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="{style or styles[2]}"><v>{_excel_serial(value)}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub("", str(value)))
+    return f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _has_header_style():
+    from pandas.io.formats.excel import ExcelFormatter
+
+    return bool(getattr(ExcelFormatter(pd.DataFrame()), "header_style", None))
+
+
+def _format_column(series, float_format=None, na_rep="", inf_rep="inf"):
+    """按 to_excel 的规则转换一列的值（缺失值 → na_rep，±inf → 字符串，float_format 舍入）"""
+    values = series.to_numpy(dtype=object)
+    missing = pd.isna(series).to_numpy()
+    result = []
+    for value, is_missing in zip(values, missing):
+        if is_missing:
+            value = na_rep
+        elif isinstance(value, (float, np.floating)):
+            if value == np.inf:
+                value = inf_rep
+            elif value == -np.inf:
+                value = f"-{inf_rep}"
+            elif float_format is not None:
+                value = float(float_format % value)
+        result.append(value)
+    return result
+
+
+def _sheet_rows(blocks, styles=_STYLES):
+    """[(起始行, DataFrame, float_format), ...] → 逐行的 <row> XML"""
+    header_style = styles[0] if _has_header_style() else 0
+    for start_row, df, float_format in blocks:
+        letters = [column_letter(i) for i in range(len(df.columns))]
+        row_number = start_row + 1
+        header = "".join(_cell(f"{letter}{row_number}", label, header_style)
+                         for letter, label in zip(letters, df.columns))
+        yield f'<row r="{row_number}">{header}</row>'
+        columns = [_format_column(df.iloc[:, i], float_format) for i in range(len(df.columns))]
+        for row_values in zip(*columns):
+            row_number += 1
+            cells = "".join(_cell(f"{letter}{row_number}", value, 0, styles)
+                            for letter, value in zip(letters, row_values))
+            yield f'<row r="{row_number}">{cells}</row>'
+
+
+def _write_sheet_xml(path, blocks, styles=_STYLES):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<worksheet xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}"><sheetData>')
+        buffer = []
+        for row in _sheet_rows(blocks, styles):
+            buffer.append(row)
+            if len(buffer) >= 10_000:
+                f.write("".join(buffer))
+                buffer.clear()
+        f.write("".join(buffer))
+        f.write("</sheetData></worksheet>")
+
+
+def serialize_sheet(path, sheet_name, blocks, styles=_STYLES):
+    """把一张表写为工作表XML文件（在子进程中运行），返回阶段统计"""
+    report = start_run("worker")
+    try:
+        with stage(f"to_excel:{sheet_name}", rows_in=sum(len(df) for _, df, _ in blocks)):
+            _write_sheet_xml(path, blocks, styles)
+    finally:
+        end_run()
+    pid = os.getpid()
+    for span in report.spans:
+        span.extra["worker_pid"] = pid
+    return report.spans
+
+
+def _serialize_sheets(sheets, tmp_dir, workers, styles=_STYLES):
+    """各表写为临时XML文件，返回与 sheets 顺序相同的路径列表；workers > 1 时在进程池中并行"""
+    names = list(sheets)
+    paths = [os.path.join(tmp_dir, f"sheet{i}.xml") for i in range(1, len(names) + 1)]
+    if workers <= 1 or len(names) <= 1:
+        for path, name in zip(paths, names):
+            with stage(f"to_excel:{name}", rows_in=sum(len(df) for _, df, _ in sheets[name])):
+                _write_sheet_xml(path, sheets[name], styles)
+        return paths
+
+    # 大表先提交，避免最后才开始序列化最大的一张表
+    order = sorted(range(len(names)), key=lambda i: -sum(len(df) for _, df, _ in sheets[names[i]]))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {i: pool.submit(serialize_sheet, paths[i], names[i], sheets[names[i]], styles) for i in order}
+        spans = [futures[i].result() for i in range(len(names))]
+
+    report = current_run()
+    if report is not None:
+        for sheet_spans in spans:
+            for span in sheet_spans:
+                report.add(span)
+    return paths
+
+
+def _workbook_xml(sheet_names):
+    sheets = "".join(f'<sheet name={quoteattr(name)} sheetId="{i}" r:id="rId{i}"/>'
+                     for i, name in enumerate(sheet_names, start=1))
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}">'
+            f'<bookViews><workbookView activeTab="0"/></bookViews><sheets>{sheets}</sheets></workbook>')
+
+
+def _workbook_rels(n_sheets):
+    rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{_NS_REL}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, n_sheets + 1)
+    )
+    rels += f'<Relationship Id="rId{n_sheets + 1}" Type="{_NS_REL}/styles" Target="styles.xml"/>'
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{_NS_PKG_REL}">{rels}</Relationships>')
+
+
+def _root_rels(custom):
+    rels = f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+    if custom:
+        rels += f'<Relationship Id="rId2" Type="{_NS_REL}/custom-properties" Target="docProps/custom.xml"/>'
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{_NS_PKG_REL}">{rels}</Relationships>')
+
+
+def _content_types(n_sheets, custom):
+    sheet_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+    overrides = "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{sheet_type}"/>'
+                        for i in range(1, n_sheets + 1))
+    if custom:
+        overrides += ('<Override PartName="/docProps/custom.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.custom-properties+xml"/>')
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        f'{overrides}</Types>'
+    )
+
+
+def _custom_property(pid, name, value):
+    return (f'<property fmtid="{{D5CDD505-2E9C-101B-9397-08002B2CF9AE}}" pid="{pid}" name={quoteattr(name)}>'
+            f'<vt:lpwstr>{escape(value)}</vt:lpwstr></property>')
+
+
+def _custom_xml(properties, extra=()):
+    """自定义文档属性；extra 为原样保留的其他 <property> 元素（pid 依次重新编号）"""
+    tags = [re.sub(r'\bpid="\d+"', f'pid="{pid}"', tag) for pid, tag in enumerate(extra, start=2)]
+    tags += [_custom_property(pid, name, value)
+             for pid, (name, value) in enumerate(properties.items(), start=2 + len(tags))]
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/custom-properties" '
+            'xmlns:vt="http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes">'
+            f'{"".join(tags)}</Properties>')
+
+
+def write_workbook(save_path, sheets, workers, properties=None):
+    """并行写入工作簿
+
+    sheets 为按顺序排列的 {表名: [(起始行, DataFrame, float_format), ...]}，
+    properties 为写入自定义文档属性的 {名称: 字符串值}。
+    """
+    names = list(sheets)
+    properties = properties or {}
+    tmp_dir = tempfile.mkdtemp(prefix="amazon_processor_xlsx_")
+    try:
+        paths = _serialize_sheets(sheets, tmp_dir, workers)
+
+        with stage("assemble_workbook"):
+            with zipfile.ZipFile(save_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                zf.writestr("[Content_Types].xml", _content_types(len(names), bool(properties)))
+                zf.writestr("_rels/.rels", _root_rels(bool(properties)))
+                if properties:
+                    zf.writestr("docProps/custom.xml", _custom_xml(properties))
+                zf.writestr("xl/workbook.xml", _workbook_xml(names))
+                zf.writestr("xl/_rels/workbook.xml.rels", _workbook_rels(len(names)))
+                zf.writestr("xl/styles.xml", _STYLES_XML)
+                for i, path in enumerate(paths, start=1):
+                    zf.write(path, f"xl/worksheets/sheet{i}.xml")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# ========== 增量更新现有工作簿 ==========
+# 只改写变化的部分：新表的XML、workbook.xml 的表清单、关系和内容类型、styles.xml 与自定义属性；
+# 其余部件（未变化月份的表、sharedStrings、主题等）解压后原样写入新的zip，内容逐字节不变。
+_WORKBOOK = "xl/workbook.xml"
+_WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+_CONTENT_TYPES = "[Content_Types].xml"
+_ROOT_RELS = "_rels/.rels"
+_STYLES_PART = "xl/styles.xml"
+_CUSTOM = "docProps/custom.xml"
+_CALC_CHAIN = "xl/calcChain.xml"
+_SHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+_SHEET_TAG_RE = re.compile(r"<sheet\b[^>]*?/>")
+_RELATIONSHIP_RE = re.compile(r"<Relationship\b[^>]*?/>")
+_PROPERTY_RE = re.compile(r"<property\b.*?</property>", re.S)
+
+
+def _attr(tag, name):
+    """标签中属性的值（name 为 ":id" 时匹配任意前缀的 r:id）"""
+    pattern = rf'\s[\w.-]*{re.escape(name)}="([^"]*)"' if name.startswith(":") else rf'\s{re.escape(name)}="([^"]*)"'
+    match = re.search(pattern, tag)
+    return None if match is None else unescape(match.group(1), {"&quot;": '"', "&apos;": "'"})
+
+
+def _part_path(target, base="xl"):
+    """关系中的 Target → zip内路径（绝对路径去掉开头的 /，相对路径相对于 base）"""
+    if target.startswith("/"):
+        return target[1:]
+    return f"{base}/{target}"
+
+
+class ExistingWorkbook:
+    """现有工作簿的表清单和自定义属性（只读取 workbook.xml、关系和 custom.xml，不加载各表）"""
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as zf:
+            self.parts = zf.namelist()
+            self.workbook_xml = zf.read(_WORKBOOK).decode("utf-8")
+            self.rels_xml = zf.read(_WORKBOOK_RELS).decode("utf-8")
+            self.custom_xml = zf.read(_CUSTOM).decode("utf-8") if _CUSTOM in self.parts else None
+
+        targets = {_attr(tag, "Id"): _part_path(_attr(tag, "Target"))
+                   for tag in _RELATIONSHIP_RE.findall(self.rels_xml)}
+        # 表名 → (<sheet> 标签原文, 关系Id, 部件路径)
+        self.sheets = {}
+        for tag in _SHEET_TAG_RE.findall(self.workbook_xml):
+            rel_id = _attr(tag, ":id")
+            self.sheets[_attr(tag, "name")] = (tag, rel_id, targets.get(rel_id))
+
+        self.properties = {}
+        self._foreign_properties = []
+        for tag in _PROPERTY_RE.findall(self.custom_xml or ""):
+            value = re.search(r"<vt:lpwstr>(.*?)</vt:lpwstr>", tag, re.S)
+            if value is None:
+                self._foreign_properties.append(tag)
+            else:
+                self.properties[_attr(tag, "name")] = unescape(value.group(1))
+
+    def custom_xml_with(self, changes):
+        """按 changes（{名称: 值，None 表示删除}）更新后的 custom.xml"""
+        properties = {name: value for name, value in self.properties.items() if name not in changes}
+        properties.update({name: value for name, value in changes.items() if value is not None})
+        return _custom_xml(properties, self._foreign_properties)
+
+
+def _next_number(values, prefix="", minimum=0):
+    numbers = [int(v[len(prefix):]) for v in values if v and v.startswith(prefix) and v[len(prefix):].isdigit()]
+    return max(numbers + [minimum]) + 1
+
+
+def _set_section(xml, tag, item_pattern, item, before=None):
+    """在 <tag> 的子元素中查找与 item 相同的元素，没有时追加（并更新count）；返回 (xml, 索引)
+
+    <tag> 不存在时插入到 before 标签之前。
+    """
+    match = re.search(rf"<{tag}\b([^>]*?)(?:/>|>(.*?)</{tag}>)", xml, re.S)
+    items = re.findall(item_pattern, match.group(2) or "", re.S) if match else []
+    if item in items:
+        return xml, items.index(item)
+    items.append(item)
+    attrs = re.sub(r'\s*count="\d+"', "", match.group(1)).rstrip() if match else ""
+    section = f'<{tag}{attrs} count="{len(items)}">{"".join(items)}</{tag}>'
+    if match:
+        return xml[:match.start()] + section + xml[match.end():], len(items) - 1
+    position = re.search(rf"<{before}\b", xml).start()
+    return xml[:position] + section + xml[position:], len(items) - 1
+
+
+def _merge_styles(styles_xml):
+    """把本模块用到的样式并入现有的 styles.xml，返回 (styles.xml, (表头, 日期时间, 日期) 样式索引)
+
+    已有完全相同的条目时复用，多次更新不会重复追加。
+    """
+    formats = {}
+    for code in ("yyyy-mm-dd h:mm:ss", "yyyy-mm-dd"):
+        match = re.search(rf'<numFmt\b[^>]*\bformatCode="{re.escape(code)}"[^>]*/>', styles_xml)
+        if match:
+            formats[code] = int(_attr(match.group(0), "numFmtId"))
+            continue
+        ids = re.findall(r'<numFmt\b[^>]*\bnumFmtId="(\d+)"', styles_xml)
+        formats[code] = max([int(i) for i in ids] + [163]) + 1
+        styles_xml, _ = _set_section(styles_xml, "numFmts", r"<numFmt\b[^>]*?/>",
+                                     f'<numFmt numFmtId="{formats[code]}" formatCode="{code}"/>', before="fonts")
+
+    font_pattern, border_pattern, xf_pattern = (rf"<{t}\b[^>]*?(?:/>|>.*?</{t}>)" for t in ("font", "border", "xf"))
+    styles_xml, bold = _set_section(
+        styles_xml, "fonts", font_pattern,
+        '<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font>')
+    styles_xml, thin = _set_section(
+        styles_xml, "borders", border_pattern,
+        '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>')
+    xfs = [
+        f'<xf numFmtId="0" fontId="{bold}" fillId="0" borderId="{thin}" xfId="0" applyFont="1" applyBorder="1" '
+        f'applyAlignment="1"><alignment horizontal="center" vertical="top"/></xf>',
+        f'<xf numFmtId="{formats["yyyy-mm-dd h:mm:ss"]}" fontId="0" fillId="0" borderId="0" xfId="0" '
+        f'applyNumberFormat="1"/>',
+        f'<xf numFmtId="{formats["yyyy-mm-dd"]}" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>',
+    ]
+    styles = []
+    for xf in xfs:
+        styles_xml, index = _set_section(styles_xml, "cellXfs", xf_pattern, xf)
+        styles.append(index)
+    return styles_xml, tuple(styles)
+
+
+def update_workbook(existing, sheets, order, properties, workers):
+    """增量更新现有工作簿（existing 为 ExistingWorkbook）
+
+    sheets 为需要写入的 {表名: [(起始行, DataFrame, float_format), ...]}（同名的现有表被替换），
+    order 为更新后全部表的顺序（其中不在 sheets 里的表保留原内容，未列出的现有表删除），
+    properties 为自定义文档属性的修改 {名称: 值，None 表示删除}。先写临时文件再替换，失败时原文件不变。
+    """
+    kept = [name for name in order if name not in sheets]
+    dropped = [name for name in existing.sheets if name not in kept]
+    dropped_parts = {existing.sheets[name][2] for name in dropped}
+    dropped_parts |= {f"{os.path.dirname(p)}/_rels/{os.path.basename(p)}.rels" for p in set(dropped_parts)}
+    dropped_parts.add(_CALC_CHAIN)  # 计算链中可能有已删除表的单元格，Excel打开时会重建
+    dropped_ids = {existing.sheets[name][1] for name in dropped}
+
+    with zipfile.ZipFile(existing.path) as source:
+        styles_xml, styles = _merge_styles(source.read(_STYLES_PART).decode("utf-8"))
+        content_types = source.read(_CONTENT_TYPES).decode("utf-8")
+        root_rels = source.read(_ROOT_RELS).decode("utf-8")
+
+    # 新表的部件名、关系Id和sheetId接在现有编号之后
+    next_part = _next_number([os.path.splitext(os.path.basename(p))[0] for p in existing.parts
+                              if p.startswith("xl/worksheets/")], "sheet")
+    rel_ids = [_attr(tag, "Id") for tag in _RELATIONSHIP_RE.findall(existing.rels_xml)]
+    next_rel = _next_number(rel_ids, "rId")
+    next_sheet_id = _next_number([_attr(tag, "sheetId") for tag, _, _ in existing.sheets.values()])
+    new_parts = {}
+    sheet_tags = {name: existing.sheets[name][0] for name in kept}
+    new_rels = []
+    for offset, name in enumerate(sheets):
+        part = f"xl/worksheets/sheet{next_part + offset}.xml"
+        rel_id = f"rId{next_rel + offset}"
+        new_parts[name] = part
+        sheet_tags[name] = f'<sheet name={quoteattr(name)} sheetId="{next_sheet_id + offset}" r:id="{rel_id}"/>'
+        new_rels.append(f'<Relationship Id="{rel_id}" Type="{_NS_REL}/worksheet" Target="/{part}"/>')
+
+    workbook_xml = re.sub(r"<sheets>.*?</sheets>|<sheets\s*/>",
+                          lambda _: f'<sheets>{"".join(sheet_tags[name] for name in order)}</sheets>',
+                          existing.workbook_xml, count=1, flags=re.S)
+    workbook_xml = re.sub(r'\bactiveTab="\d+"', 'activeTab="0"', workbook_xml)
+
+    rels_xml = _RELATIONSHIP_RE.sub(
+        lambda m: "" if _attr(m.group(0), "Id") in dropped_ids
+        or _part_path(_attr(m.group(0), "Target")) == _CALC_CHAIN else m.group(0), existing.rels_xml)
+    rels_xml = rels_xml.replace("</Relationships>", "".join(new_rels) + "</Relationships>")
+
+    content_types = re.sub(r"<Override\b[^>]*?/>",
+                           lambda m: "" if _attr(m.group(0), "PartName")[1:] in dropped_parts else m.group(0),
+                           content_types)
+    overrides = "".join(f'<Override PartName="/{part}" ContentType="{_SHEET_CONTENT_TYPE}"/>'
+                        for part in new_parts.values())
+    replaced = {
+        _WORKBOOK: workbook_xml,
+        _WORKBOOK_RELS: rels_xml,
+        _STYLES_PART: styles_xml,
+    }
+    if properties or existing.custom_xml is not None:
+        replaced[_CUSTOM] = existing.custom_xml_with(properties)
+        if existing.custom_xml is None:
+            overrides += ('<Override PartName="/docProps/custom.xml" '
+                          'ContentType="application/vnd.openxmlformats-officedocument.custom-properties+xml"/>')
+            rel_id = f"rId{_next_number([_attr(t, 'Id') for t in _RELATIONSHIP_RE.findall(root_rels)], 'rId')}"
+            replaced[_ROOT_RELS] = root_rels.replace(
+                "</Relationships>",
+                f'<Relationship Id="{rel_id}" Type="{_NS_REL}/custom-properties" Target="docProps/custom.xml"/>'
+                "</Relationships>")
+    replaced[_CONTENT_TYPES] = content_types.replace("</Types>", overrides + "</Types>")
+
+    tmp_dir = tempfile.mkdtemp(prefix="amazon_processor_xlsx_")
+    tmp_path = f"{existing.path}.tmp"
+    try:
+        paths = _serialize_sheets(sheets, tmp_dir, workers, styles)
+        with stage("assemble_workbook"):
+            with zipfile.ZipFile(existing.path) as source, \
+                    zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                for info in source.infolist():
+                    if info.filename in dropped_parts or info.filename in replaced:
+                        continue
+                    with source.open(info) as src, zf.open(info.filename, "w") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+                for name, content in replaced.items():
+                    zf.writestr(name, content)
+                for path, part in zip(paths, new_parts.values()):
+                    zf.write(path, part)
+        os.replace(tmp_path, existing.path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
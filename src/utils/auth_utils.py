@@ -1,12 +1,20 @@
+import logging
 import os
 import sys
 import pickle
 import webbrowser
-from tkinter import messagebox
 from dotenv import load_dotenv
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
+
+from utils import events
+
+logger = logging.getLogger("amazon_processor")
+
+
+def import_google_auth():
+    """导入Google认证库（导入较慢，首次获取凭据时才导入）"""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    return InstalledAppFlow, Request
 
 def load_environment():
     """安全加载环境配置"""
@@ -23,10 +31,11 @@ def load_environment():
                 if os.path.exists(env_path):
                     load_dotenv(dotenv_path=env_path)
     except Exception as e:
-        print(f"[环境加载警告] {str(e)}")
+        logger.warning("环境配置加载失败: %s", e)
 
 def get_google_creds():
     """安全获取Google API凭据（优化存储路径版）"""
+    InstalledAppFlow, Request = import_google_auth()
     SCOPES = [
         'https://www.googleapis.com/auth/spreadsheets',
         'https://www.googleapis.com/auth/drive.readonly'
@@ -63,7 +72,7 @@ def get_google_creds():
                 with open(token_file, 'rb') as token:
                     creds = pickle.load(token)
             except (EOFError, pickle.UnpicklingError) as e:
-                print(f"[警告] 凭证文件损坏，将重新授权: {str(e)}")
+                logger.warning("凭证文件损坏，将重新授权: %s", e)
                 os.remove(token_file)
 
         # 凭据管理流程
@@ -72,7 +81,7 @@ def get_google_creds():
                 try:
                     creds.refresh(Request())
                 except Exception as refresh_error:
-                    print(f"[认证刷新失败] {str(refresh_error)}")
+                    logger.warning("凭证刷新失败，将重新授权: %s", refresh_error)
                     creds = None
 
             if not creds:
@@ -84,12 +93,12 @@ def get_google_creds():
             # 保存新凭据
             with open(token_file, 'wb') as token:
                 pickle.dump(creds, token)
-                print(f"[凭证存储] 已保存到: {token_file}")
+                logger.info("凭证已保存到: %s", token_file)
 
         return creds
 
     except Exception as e:
         error_msg = f"认证失败: {str(e)}\n建议操作:\n"
         error_msg += "1. 检查网络连接\n2. 确认客户端ID/密钥正确\n3. 重新尝试授权"
-        messagebox.showerror("认证错误", error_msg)
+        events.error("认证错误", error_msg)
         raise  # 向上传递异常以中断流程
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""处理层的错误/事件上报接口
+
+处理函数只调用 error()/warning()/info() 上报事件，不直接依赖任何界面库；
+GUI 通过 subscribe() 注册为订阅者（弹窗显示），CLI/后台进程没有订阅者时写入日志。
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("amazon_processor")
+
+ERROR = "error"
+WARNING = "warning"
+INFO = "info"
+
+_LOG_LEVELS = {
+    ERROR: logging.ERROR,
+    WARNING: logging.WARNING,
+    INFO: logging.INFO,
+}
+
+_subscribers = []
+# capture() 只作用于调用它的线程
+_local = threading.local()
+
+
+def subscribe(handler):
+    """注册订阅者，handler(level, title, message)"""
+    if handler not in _subscribers:
+        _subscribers.append(handler)
+    return handler
+
+
+def unsubscribe(handler):
+    """取消订阅"""
+    if handler in _subscribers:
+        _subscribers.remove(handler)
+
+
+def report(level, title, message):
+    """上报事件：总是写入日志，并通知所有订阅者（capture() 期间只收集不分发）"""
+    captured = getattr(_local, "captured", None)
+    if captured is not None:
+        captured.append((level, title, message))
+        return
+    logger.log(_LOG_LEVELS.get(level, logging.INFO), "%s: %s", title, message)
+    for handler in list(_subscribers):
+        try:
+            handler(level, title, message)
+        except Exception as e:
+            logger.warning("事件订阅者处理失败: %s", e)
+
+
+@contextmanager
+def capture():
+    """在with块内收集事件而不分发，返回 (level, title, message) 列表
+
+    用于进程池子进程：事件随结果交回主进程，再由主进程 report() 给订阅者；
+    也用于后台线程的预加载（只收集本线程的事件）。
+    """
+    previous = getattr(_local, "captured", None)
+    _local.captured = []
+    try:
+        yield _local.captured
+    finally:
+        _local.captured = previous
+
+
+def error(title, message):
+    report(ERROR, title, message)
+
+
+def warning(title, message):
+    report(WARNING, title, message)
+
+
+def info(title, message):
+    report(INFO, title, message)
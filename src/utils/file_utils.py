@@ -1,6 +1,10 @@
+import logging
 import os
 import sys
 
+logger = logging.getLogger("amazon_processor")
+
+
 def get_resource_path(relative_path):
     """智能资源路径定位（修复开发模式路径）"""
     if getattr(sys, 'frozen', False):
@@ -10,5 +14,5 @@ def get_resource_path(relative_path):
         base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     
     full_path = os.path.join(base_path, relative_path)
-    print(f"[路径追踪] 资源解析：{full_path}")
+    logger.debug("资源路径：%s", full_path)
     return full_path
\ No newline at end of file
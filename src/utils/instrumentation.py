@@ -0,0 +1,187 @@
+"""轻量级运行统计：按处理阶段记录耗时、CPU时间、行数和内存峰值
+
+用法:
+    report = start_run("run")
+    with stage("parse") as span:
+        df = ...
+        span.rows_out = len(df)
+    report.finish()
+    report.save_json(path)
+
+没有进行中的运行时 stage() 仍可使用（只是不被记录），开销仅为几次系统计时调用。
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger("amazon_processor")
+
+RUNS_DIR = os.path.join(os.path.expanduser("~"), ".amazon-processor", "runs")
+KEEP_RUN_REPORTS = 50
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """当前进程的内存峰值（MB），无法获取时返回None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为KB，macOS 为字节
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+class Span:
+    """单个阶段的统计记录"""
+
+    __slots__ = ("name", "rows_in", "rows_out", "wall_s", "cpu_s", "peak_rss_mb", "extra")
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.peak_rss_mb = None
+        self.extra = {}
+
+    def to_dict(self):
+        data = {
+            "stage": self.name,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "peak_rss_mb": self.peak_rss_mb,
+        }
+        data.update(self.extra)
+        return data
+
+
+class RunReport:
+    """一次运行的全部阶段统计"""
+
+    def __init__(self, name, **metadata):
+        self.name = name
+        self.metadata = metadata
+        self.started_at = datetime.now()
+        self.spans = []
+        self.wall_s = None
+        self.cpu_s = None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.wall_s = round(time.perf_counter() - self._wall_start, 4)
+        self.cpu_s = round(time.process_time() - self._cpu_start, 4)
+        return self
+
+    def to_dict(self):
+        return {
+            "run": self.name,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "peak_rss_mb": peak_rss_mb(),
+            "metadata": self.metadata,
+            "stages": [span.to_dict() for span in self.spans],
+        }
+
+    def to_frame(self):
+        """转换为DataFrame，用于写入Run Stats工作表"""
+        import pandas as pd
+        rows = [span.to_dict() for span in self.spans]
+        rows.append({"stage": "TOTAL", "wall_s": self.wall_s, "cpu_s": self.cpu_s,
+                     "peak_rss_mb": peak_rss_mb()})
+        return pd.DataFrame(rows)
+
+    def save_json(self, path=None):
+        """保存JSON运行报告；未指定路径时保存到用户目录并只保留最近若干份"""
+        if path is None:
+            os.makedirs(RUNS_DIR, exist_ok=True)
+            path = os.path.join(RUNS_DIR, f"{self.name}-{self.started_at:%Y%m%d-%H%M%S}.json")
+            _prune_runs_dir()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+        return path
+
+    def log_summary(self):
+        """在日志中输出各阶段耗时"""
+        for span in self.spans:
+            logger.info(
+                "[Stage] %-28s wall=%7.3fs cpu=%7.3fs rows_in=%s rows_out=%s",
+                span.name, span.wall_s or 0, span.cpu_s or 0, span.rows_in, span.rows_out
+            )
+        logger.info("[Stage] %-28s wall=%7.3fs cpu=%7.3fs peak_rss=%sMB",
+                    "TOTAL", self.wall_s or 0, self.cpu_s or 0, peak_rss_mb())
+
+
+def _prune_runs_dir():
+    try:
+        files = sorted(
+            (os.path.join(RUNS_DIR, name) for name in os.listdir(RUNS_DIR) if name.endswith(".json")),
+            key=os.path.getmtime
+        )
+        for path in files[:-KEEP_RUN_REPORTS]:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+_current_report = None
+
+
+def start_run(name="run", **metadata):
+    """开始记录一次运行，之后的 stage() 都记入该报告"""
+    global _current_report
+    _current_report = RunReport(name, **metadata)
+    return _current_report
+
+
+def end_run():
+    """结束当前运行并返回报告"""
+    global _current_report
+    report, _current_report = _current_report, None
+    if report is not None:
+        report.finish()
+    return report
+
+
+def current_run():
+    return _current_report
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """记录一个处理阶段；在with块内设置 span.rows_out"""
+    span = Span(name, rows_in)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield span
+    finally:
+        span.wall_s = round(time.perf_counter() - wall_start, 4)
+        span.cpu_s = round(time.process_time() - cpu_start, 4)
+        span.peak_rss_mb = peak_rss_mb()
+        report = _current_report
+        if report is not None:
+            report.add(span)
+        logger.debug("[Stage] %s %.3fs", name, span.wall_s)
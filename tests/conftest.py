@@ -0,0 +1,38 @@
+"""测试公共设置：src/ 与 benchmarks/ 加入导入路径，用合成报告生成器造数据"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# 运行报告、缓存和成本快照默认写入 ~/.amazon-processor，测试时改到临时目录
+os.environ["HOME"] = os.environ["USERPROFILE"] = tempfile.mkdtemp(prefix="amazon-processor-tests-")
+
+from generate_settlement import generate_settlement, build_offline_lookups  # noqa: E402
+from processor.google_sheets import use_offline_lookups  # noqa: E402
+
+N_SKUS = 40
+
+
+@pytest.fixture
+def lookups():
+    """与合成SKU对应的离线查找表（代替Google Sheet）"""
+    tables = build_offline_lookups(N_SKUS)
+    use_offline_lookups(tables)
+    yield tables
+    use_offline_lookups(None)
+
+
+@pytest.fixture
+def make_settlement(tmp_path):
+    """生成合成结算报告，返回文件路径：make_settlement("us.txt", rows=5000, marketplace="US")"""
+    def make(name="settlement.txt", rows=5000, **options):
+        options.setdefault("n_skus", N_SKUS)
+        path = tmp_path / name
+        generate_settlement(str(path), rows=rows, **options)
+        return str(path)
+    return make
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+import pytest
+
+from processor.backends import compare_backends
+from processor.pipeline import read_settlement
+
+
+def test_polars_matches_pandas_cell_for_cell(make_settlement, lookups):
+    pytest.importorskip("polars")
+    # 订单数少于订单行数：同一单元格由多行金额累加，浮点累加顺序不同就会有尾差
+    path = make_settlement("us.txt", rows=20000, n_orders=600)
+    raw_source_df = read_settlement(path)
+
+    mismatches = compare_backends(raw_source_df, datetime(2024, 1, 1), datetime(2024, 2, 29), "polars")
+
+    assert mismatches == []
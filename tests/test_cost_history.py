@@ -0,0 +1,19 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from processor.cost_history import CostHistory
+
+
+def test_earlier_pdb_us_cost_beats_later_landed_cost(tmp_path):
+    history = CostHistory(str(tmp_path))
+    history.record("pdb_us", {"A": 5.0, "B": 6.0}, datetime(2024, 1, 1))
+    history.record("landed_cost", {"A": 7.0}, datetime(2024, 3, 1))
+
+    skus = pd.Series(["A", "A", "B", "C", "Shipping"])
+    dates = pd.Series(pd.to_datetime(["2024-02-01", "2024-03-15", "2023-12-01", "2024-02-01", "2024-02-01"]))
+    cost = history.cost_asof(skus, dates)
+
+    # 2月的A：landed_cost 3月才生效，使用当时生效的 pdb_us；B 早于全部快照，才使用最早的快照
+    np.testing.assert_array_equal(cost, [5.0, 7.0, 6.0, np.nan, 0.0])
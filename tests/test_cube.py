@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from processor.backends import get_backend
+from processor.cube import DailyCube
+from processor.pipeline import daily_cube, read_settlement, run_pipeline
+
+# 从月中开始、跨到下月中的日期范围，按天筛选的结果应与逐行筛选相同
+START, END = datetime(2024, 1, 10), datetime(2024, 2, 15)
+
+
+@pytest.fixture
+def raw(make_settlement):
+    return read_settlement(make_settlement("us.txt", rows=3000))
+
+
+def test_preview_matches_row_level_totals(raw):
+    preview = DailyCube.build(raw).preview(START, END, top=2)
+
+    rows = raw[(raw["posted-date"] >= START) & (raw["posted-date"] <= END)]
+    month = rows["posted-date"].dt.to_period("M")
+    amount = pd.to_numeric(rows["amount"])
+    orders = rows[rows["transaction-type"] == "Order"]
+    order_month = orders["posted-date"].dt.to_period("M")
+    assert preview["month"].tolist() == sorted(month.unique())
+    assert preview["rows"].tolist() == month.value_counts().sort_index().tolist()
+    assert preview["amount"].tolist() == pytest.approx(amount.groupby(month).sum().tolist())
+    assert preview["orders"].tolist() == orders.groupby(order_month)["order-id"].nunique().tolist()
+
+    sku_amounts = pd.to_numeric(orders["amount"]).groupby([order_month, orders["sku"]]).sum()
+    for period, top_skus in zip(preview["month"], preview["top_skus"]):
+        best = sku_amounts[period].nlargest(2)
+        assert [sku for sku, _ in top_skus] == best.index.tolist()
+        assert [value for _, value in top_skus] == pytest.approx(best.tolist())
+
+
+def test_preview_of_empty_range(raw):
+    preview = DailyCube.build(raw).preview(datetime(2030, 1, 1), datetime(2030, 1, 31))
+    assert preview.empty
+    assert list(preview.columns) == ["month", "rows", "amount", "orders", "top_skus"]
+
+
+def test_daily_cube_is_cached_per_file_version(make_settlement):
+    # 预览在后台加载所选文件的按天聚合数据：同一文件复用，文件变化后重新构建
+    path = make_settlement("us.txt", rows=500)
+    cube = daily_cube(path)
+    assert daily_cube(path) is cube
+
+    make_settlement("us.txt", rows=800, seed=1)
+    rebuilt = daily_cube(path)
+    assert rebuilt is not cube
+    assert rebuilt.cells["rows"].sum() == len(read_settlement(path)) > cube.cells["rows"].sum()
+
+
+def test_summary_and_total_match_row_level_pivots(raw):
+    cube = DailyCube.build(raw)
+    expected = get_backend("pandas").generate_summary(raw, START, END)
+    actual = cube.summary(START, END)
+    assert [str(month) for month, _ in actual] == [str(month) for month, _ in expected]
+    for (_, pivot), (_, expected_pivot) in zip(actual, expected):
+        pd.testing.assert_frame_equal(pivot, expected_pivot, check_dtype=False)
+
+    rows = raw[(raw["posted-date"] >= START) & (raw["posted-date"] <= END)]
+    assert cube.total(START, END) == pytest.approx(pd.to_numeric(rows["amount"]).sum())
+    assert cube.total() == pytest.approx(pd.to_numeric(raw["amount"]).sum())
+
+
+def test_run_records_cube_stages(make_settlement, lookups, tmp_path):
+    # 运行报告记录按天聚合的构建和汇总阶段，total_amount 与 Summary 中各月 Grand Total 之和相同
+    path = make_settlement("us.txt", rows=2000)
+    report = run_pipeline(path, str(tmp_path / "out.xlsx"), START, END)
+    spans = {span.name: span for span in report.spans}
+    cube = daily_cube(path)
+    assert spans["build_cube"].rows_in == len(read_settlement(path))
+    assert spans["generate_summary"].rows_in == len(cube.cells)
+
+    summary = pd.read_excel(tmp_path / "out.xlsx", sheet_name="Summary").set_index("amount-type")
+    grand_totals = summary.loc["Grand Total", "Grand Total"]
+    assert report.metadata["total_amount"] == pytest.approx(grand_totals.sum())
+    assert report.metadata["total_amount"] == pytest.approx(cube.total(START, END))
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from processor.dates import detect_date_format, parse_dates
+from processor.pipeline import read_settlement
+
+
+def test_ca_dates_parse_day_first(make_settlement):
+    path = make_settlement("ca.txt", rows=3000, marketplace="CA", days=60)
+    text = pd.read_csv(path, sep="\t", usecols=["posted-date"], dtype=str)["posted-date"].iloc[1:]
+    assert detect_date_format(text) == "%d.%m.%Y"
+
+    dates = read_settlement(path)["posted-date"]
+    expected = pd.to_datetime(text, format="%d.%m.%Y")
+    assert dates.notna().all()
+    assert (dates.to_numpy() == expected.to_numpy()).all()
+    # 日大于12的日期不会被当作月份解析失败，整个范围都在
+    assert dates.min() == pd.Timestamp("2024-01-01") and dates.dt.day.max() > 12
+    assert dates.dt.month.tolist() == expected.dt.month.tolist()
+
+
+def test_us_dates_and_fallback():
+    values = pd.Series(["2024-01-15", "2024-01-15", None, "2024-02-29", "15.03.2024", "garbage"])
+    parsed = parse_dates(values)
+    assert parsed.tolist()[:4] == [pd.Timestamp("2024-01-15")] * 2 + [pd.NaT, pd.Timestamp("2024-02-29")]
+    # 检测到的格式解析不了的值再尝试其他格式
+    assert parsed[4] == pd.Timestamp("2024-03-15") and pd.isna(parsed[5])
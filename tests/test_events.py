@@ -0,0 +1,53 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from processor.google_sheets import load_gsheet_data
+from processor.parallel import process_periods, shared_lookups
+from processor.pipeline import read_settlement
+from utils import events
+
+
+@pytest.fixture
+def received():
+    """订阅者收到的事件"""
+    seen = []
+    handler = events.subscribe(lambda *event: seen.append(event))
+    yield seen
+    events.unsubscribe(handler)
+
+
+def test_capture_collects_only_its_own_thread(received):
+    captured = []
+
+    def worker():
+        with events.capture() as worker_events:
+            events.error("处理错误", "captured")
+        captured.extend(worker_events)
+        events.warning("提示", "dispatched")
+
+    # 主线程的 capture() 不影响后台线程：线程内收集的事件不分发，capture() 之外的照常分发
+    with events.capture() as main_events:
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    assert main_events == []
+    assert received == [("warning", "提示", "dispatched")]
+
+    for event in captured:
+        events.report(*event)
+    assert received[1:] == [("error", "处理错误", "captured")]
+
+
+def test_worker_process_errors_reach_subscribers(make_settlement, lookups, received):
+    # 子进程中上报的错误随结果交回，由主进程分发给订阅者（只分发一次）
+    raw = read_settlement(make_settlement("us.txt", rows=1000))
+    period = ("202401_", raw.drop(columns=["quantity-purchased"]), datetime(2024, 1, 1), datetime(2024, 1, 31))
+    shared = shared_lookups(load_gsheet_data("landed_cost"), load_gsheet_data("pdb_us"))
+
+    [(sheets, captured)] = process_periods("pandas", [period], raw, shared, workers=1)
+    assert sheets["202401_qty"] is None
+    assert [event[:2] for event in captured] == [("error", "处理错误")]
+    assert "quantity-purchased" in captured[0][2]
+    assert received == captured
@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def test_processing_modules_do_not_import_google_auth():
+    # 命令行、进程池子进程和GUI首次运行都导入这些模块，Google认证库在首次在线加载时才导入
+    code = (
+        "import sys, cli, processor.pipeline, processor.sql_engine, processor.parallel\n"
+        "print(' '.join(m for m in ('gspread', 'google_auth_oauthlib', 'google.oauth2') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
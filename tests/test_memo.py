@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pandas as pd
+
+from processor import memo
+from processor.memo import MonthCache
+from processor.pipeline import run_pipeline
+
+START, END = datetime(2024, 1, 1), datetime(2024, 2, 29)
+
+
+def test_month_cache_hits_until_code_changes(make_settlement, lookups, tmp_path, monkeypatch):
+    path = make_settlement("us.txt", rows=3000, days=60)
+    root = str(tmp_path / "month_cache")
+
+    def run(name):
+        cache = MonthCache(root=root)
+        run_pipeline(path, str(tmp_path / name), START, END, month_cache=cache)
+        return cache
+
+    first = run("first.xlsx")
+    assert (first.hits, first.misses) == (0, 2)
+    second = run("second.xlsx")
+    assert (second.hits, second.misses) == (2, 0)
+    expected = pd.read_excel(tmp_path / "first.xlsx", sheet_name=None)
+    actual = pd.read_excel(tmp_path / "second.xlsx", sheet_name=None)
+    assert list(actual) == list(expected)
+    for name in expected:
+        pd.testing.assert_frame_equal(actual[name], expected[name])
+
+    # 处理代码变化（code_version 不同）时全部重新计算
+    monkeypatch.setattr(memo, "_code_version", "changed")
+    third = run("third.xlsx")
+    assert (third.hits, third.misses) == (0, 2)
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from processor.data_processing import process_qty_data, process_order_data, merge_order_qty
+from processor.pipeline import read_settlement
+
+pytest.importorskip("pyarrow")
+from cli import main  # noqa: E402
+from processor.order_index import order_details  # noqa: E402
+from processor.store import SettlementStore  # noqa: E402
+
+
+@pytest.fixture
+def store(make_settlement, tmp_path):
+    path = make_settlement("us.txt", rows=3000)
+    store = SettlementStore(str(tmp_path / "store"))
+    store.ingest(path)
+    return store, read_settlement(path)
+
+
+def _an_order(raw):
+    orders = raw[raw["transaction-type"] == "Order"]
+    return orders["order-id"].value_counts().index[0]
+
+
+def test_lookup_returns_all_rows_of_the_order(store):
+    store, raw = store
+    order_id = _an_order(raw)
+    expected = raw[raw["order-id"] == order_id]
+    with store.order_index() as index:
+        rows = index.lookup(order_id)
+        shipment_id = rows["shipment-id"].dropna().iloc[0]
+        by_shipment = index.lookup(shipment_id=shipment_id)
+
+    assert len(rows) == len(expected)
+    assert rows["amount"].sum() == pytest.approx(expected["amount"].astype(float).sum())
+    assert sorted(rows["posted-date"]) == sorted(expected["posted-date"])
+    assert (by_shipment["shipment-id"] == shipment_id).all()
+    assert len(by_shipment) == (raw["shipment-id"] == shipment_id).sum()
+    with store.order_index() as index:
+        assert index.lookup("no-such-order").empty
+
+
+def test_order_details_matches_the_pipeline_record(store, lookups):
+    store, raw = store
+    order_id = _an_order(raw)
+    with store.order_index() as index:
+        rows = index.lookup(order_id)
+    details = order_details(rows, store.qty_history())
+
+    # 同一订单在整份报告的 order_details 中的记录
+    dated = raw.dropna(subset=["posted-date"])
+    qty_df, _, _ = process_qty_data(dated, dated["posted-date"].min(), dated["posted-date"].max())
+    full = merge_order_qty(process_order_data(dated), qty_df, raw)
+    expected = full[full["order-id"] == order_id].reset_index(drop=True)
+    pd.testing.assert_frame_equal(details[expected.columns].reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_cli_order_lookup_runs_offline(store, monkeypatch, capsys):
+    store, raw = store
+    order_id = _an_order(raw)
+
+    def no_network():
+        raise AssertionError("SKU映射表不应被加载")
+
+    monkeypatch.setattr("processor.google_sheets.load_sku_mapping", no_network)
+    assert main(["order", order_id, "--store", store.root]) == 0
+    out = capsys.readouterr().out
+    assert order_id in out and "order_details:" in out
+
+    assert main(["order", "no-such-order", "--store", store.root]) == 1
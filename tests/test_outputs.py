@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from processor.outputs import ColumnarOutput
+
+pytest.importorskip("pyarrow")
+
+
+def _order(month, amount):
+    return pd.DataFrame({
+        "order-id": [f"{month}-A", f"{month}-B"],
+        "posted-date": pd.to_datetime([f"{month[:4]}-{month[4:]}-03", f"{month[:4]}-{month[4:]}-20"]),
+        "Product Amount": [amount, 2.25],
+    })
+
+
+def _write(directory, fmt, amounts, update=False):
+    """按月写 order 表（amounts: {月份: 金额}），缓存键为金额；返回写入前记录的未变化周期"""
+    output = ColumnarOutput(str(directory), fmt, update=update)
+    output.prepare(monthly=True)
+    previous = output.unchanged()
+    output.write_summary([("2024-01", pd.DataFrame({"amount-type": ["ItemPrice"], "Order": [3.75]}))])
+    for month, amount in amounts.items():
+        prefix = f"{month}_"
+        key = str(amount)
+        qty = pd.DataFrame({"order-id": [f"{month}-A"], "quantity-purchased": [1]})
+        sheets = None if previous.get(prefix) == key else {f"{prefix}qty": qty, f"{prefix}order": _order(month, amount)}
+        output.write_period(prefix, key, sheets)
+    output.close()
+    return previous
+
+
+def test_parquet_round_trip_and_update(tmp_path):
+    _write(tmp_path, "parquet", {"202401": 1.5, "202402": 1.5})
+    january = tmp_path / "order" / "month=2024-01" / "order.parquet"
+    pd.testing.assert_frame_equal(pd.read_parquet(january), _order("202401", 1.5))
+
+    # 增量更新：键相同的1月不重写，2月替换为新数据
+    mtime = january.stat().st_mtime_ns
+    previous = _write(tmp_path, "parquet", {"202401": 1.5, "202402": 9.0}, update=True)
+    assert previous == {"202401_": "1.5", "202402_": "1.5"}
+    assert january.stat().st_mtime_ns == mtime
+    february = pd.read_parquet(tmp_path / "order" / "month=2024-02" / "order.parquet")
+    pd.testing.assert_frame_equal(february, _order("202402", 9.0))
+    assert ColumnarOutput(str(tmp_path), "parquet", update=True).unchanged() == {"202401_": "1.5", "202402_": "9.0"}
+
+
+def test_csv_round_trip(tmp_path):
+    _write(tmp_path, "csv", {"202401": 1.5})
+    order = pd.read_csv(tmp_path / "order" / "month=2024-01" / "order.csv", parse_dates=["posted-date"])
+    pd.testing.assert_frame_equal(order, _order("202401", 1.5), check_dtype=False)
+    summary = pd.read_csv(tmp_path / "Summary" / "month=2024-01" / "Summary.csv")
+    assert summary.to_dict("records") == [{"amount-type": "ItemPrice", "Order": 3.75}]
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from processor.pipeline import run_pipeline
+
+START, END = datetime(2024, 1, 1), datetime(2024, 3, 31)
+
+
+@pytest.mark.parametrize("workers", [2, None])
+def test_pool_matches_sequential(make_settlement, lookups, tmp_path, monkeypatch, workers):
+    # 调低并行阈值，自动模式（None）按2核计算也走进程池；各表与顺序处理的结果相同
+    monkeypatch.setattr("processor.parallel.PARALLEL_MIN_ROWS", 100)
+    monkeypatch.setattr("processor.parallel.os.cpu_count", lambda: 2)
+    path = make_settlement("us.txt", rows=3000, days=90)
+    sequential = run_pipeline(path, str(tmp_path / "sequential.xlsx"), START, END, workers=1)
+    pooled = run_pipeline(path, str(tmp_path / "pooled.xlsx"), START, END, workers=workers)
+    assert sequential.metadata["workers"] == 1
+    assert pooled.metadata["workers"] == 2
+    assert any("worker_pid" in span.extra for span in pooled.spans)
+
+    expected = pd.read_excel(tmp_path / "sequential.xlsx", sheet_name=None)
+    actual = pd.read_excel(tmp_path / "pooled.xlsx", sheet_name=None)
+    assert list(actual) == list(expected)
+    assert len(expected) == 1 + 3 * 4
+    for name in expected:
+        pd.testing.assert_frame_equal(actual[name], expected[name])
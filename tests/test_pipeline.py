@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from processor.backends import ORDER_KEYS
+from processor.pipeline import PipelineError, read_settlement, run_pipeline
+
+START, END = datetime(2024, 1, 1), datetime(2024, 2, 29)
+
+
+def _rewrite(path, edit):
+    """按行修改报告文件：edit(各行按制表符拆分的列表) 返回新的行列表"""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.split("\t") for line in f.read().split("\n") if line]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join("\t".join(cells) for cells in edit(lines)) + "\n")
+
+
+def test_run_pipeline_writes_monthly_sheets(make_settlement, lookups, tmp_path):
+    path = make_settlement("us.txt", rows=3000)
+    save_path = str(tmp_path / "out.xlsx")
+    report = run_pipeline(path, save_path, START, END, run_stats_sheet=True)
+
+    sheets = pd.read_excel(save_path, sheet_name=None)
+    periods = [f"{month}_{table}" for month in ("202401", "202402")
+               for table in ("qty", "order", "order_details", "order_import")]
+    assert list(sheets) == ["Summary", *periods, "Run Stats"]
+    assert "parse" in sheets["Run Stats"]["stage"].tolist()
+    assert report.metadata["reconciliation"]["discrepancies"] == 0
+
+    # 1月汇总块的 Grand Total 等于1月明细金额合计；订单表每个订单键一行
+    raw = read_settlement(path)
+    january = raw[raw["posted-date"].dt.month == 1]
+    summary = sheets["Summary"].set_index("amount-type")
+    assert summary.loc["Grand Total", "Grand Total"].iloc[0] == pytest.approx(pd.to_numeric(january["amount"]).sum())
+    orders = january.loc[january["transaction-type"] == "Order", ORDER_KEYS].drop_duplicates()
+    assert len(sheets["202401_order"]) == len(orders)
+
+
+def test_run_pipeline_errors(make_settlement, lookups, tmp_path):
+    path = make_settlement("us.txt", rows=500)
+    save_path = str(tmp_path / "out.xlsx")
+    with pytest.raises(PipelineError, match="save path"):
+        run_pipeline(path, "", START, END)
+
+    missing = make_settlement("missing.txt", rows=500)
+    _rewrite(missing, lambda lines: [cells[:lines[0].index("amount")] + cells[lines[0].index("amount") + 1:]
+                                     for cells in lines])
+    with pytest.raises(PipelineError, match="amount"):
+        run_pipeline(missing, save_path, START, END)
+
+    # 只有表头和汇总行的报告
+    empty = make_settlement("empty.txt", rows=500)
+    _rewrite(empty, lambda lines: lines[:2])
+    with pytest.raises(PipelineError, match="No valid date"):
+        run_pipeline(empty, save_path, START, END)
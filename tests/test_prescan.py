@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from processor import prescan
+from processor.pipeline import read_settlement
+from processor.prescan import prescan_settlement
+
+
+def _without_arrow(file_path, columns):
+    raise ImportError
+
+
+@pytest.fixture(params=["arrow", "pandas"])
+def scanner(request, monkeypatch):
+    """pyarrow 读取器和 pandas 分块读取两种路径"""
+    if request.param == "arrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(prescan, "_scan_arrow", _without_arrow)
+        monkeypatch.setattr(prescan, "_CHUNK_ROWS", 700)
+    return request.param
+
+
+@pytest.mark.parametrize("marketplace", ["US", "CA"])
+def test_prescan_matches_full_parse(make_settlement, scanner, marketplace):
+    path = make_settlement("settlement.txt", rows=2000, marketplace=marketplace)
+    raw = read_settlement(path)
+    scan = prescan_settlement(path)
+
+    assert scan["rows"] == len(raw)
+    assert scan["total"] == pytest.approx(pd.to_numeric(raw["amount"]).sum())
+    assert scan["min_date"] == raw["posted-date"].min().to_pydatetime()
+    assert scan["max_date"] == raw["posted-date"].max().to_pydatetime()
+    assert scan["marketplaces"] == raw["marketplace-name"].value_counts().to_dict()
+
+
+def test_prescan_without_optional_columns(make_settlement, scanner, tmp_path):
+    # 缺少的列不读取：没有 amount 时总金额为None，没有 marketplace-name 时站点为空
+    raw = pd.read_csv(make_settlement("settlement.txt", rows=500), delimiter="\t", dtype=str)
+    path = tmp_path / "partial.txt"
+    raw.drop(columns=["amount", "marketplace-name"]).to_csv(path, sep="\t", index=False)
+
+    scan = prescan_settlement(str(path))
+    assert scan["rows"] == len(raw) - 1
+    assert scan["total"] is None
+    assert scan["marketplaces"] == {}
+    assert scan["min_date"] is not None
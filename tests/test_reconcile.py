@@ -0,0 +1,58 @@
+import pandas as pd
+
+from processor.pipeline import reconcile
+from processor.reconcile import Reconciliation
+from processor.workbook import WorkbookOutput
+from utils.instrumentation import start_run
+
+
+def _reconciliation(details_cents):
+    """1月订单表口径金额为 100.00；order_details 合计为 details_cents 分"""
+    cells = pd.DataFrame({"posted-date": pd.to_datetime(["2024-01-05", "2024-01-20", "2024-02-03"]),
+                          "amount": [6000, 4000, 2500]})
+    reconciliation = Reconciliation(order_cells=cells)
+    details = pd.DataFrame({"Total_amount": [details_cents / 100 - 5.0], "Total_shipping": [5.0]})
+    reconciliation.add_period("202401_", {"202401_order_details": details},
+                              pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-31"))
+    return reconciliation
+
+
+def test_cent_mismatches_are_reported():
+    reconciliation = _reconciliation(10001)
+    reconciliation.add_settlement_cents(pd.Series({"123": 12500, "456": 300}), pd.Series({"123": 12500}))
+
+    checks = reconciliation.result()
+    assert checks.to_dict("records") == [
+        {"check": "order_details", "scope": "202401", "expected": 100.0, "actual": 100.01, "difference": 0.01},
+        {"check": "settlement", "scope": "123", "expected": 125.0, "actual": 125.0, "difference": 0.0},
+        {"check": "settlement", "scope": "456", "expected": 3.0, "actual": 0.0, "difference": -3.0},
+    ]
+
+
+def _run(path, reconciliation, update=False, kept=()):
+    start_run("test")
+    output = WorkbookOutput(path, update=update)
+    output.prepare(monthly=True)
+    output.write_summary([("2024-01", pd.DataFrame({"Total": [125.0]}))])
+    for prefix in ("202401_", "202402_"):
+        sheets = None if prefix in kept else {f"{prefix}order": pd.DataFrame({"order-id": ["A"]})}
+        output.write_period(prefix, prefix, sheets)
+    reconcile(reconciliation, [output], 3, kept=kept)
+    output.close()
+    return pd.read_excel(path, sheet_name=None)
+
+
+def test_update_keeps_discrepancies_of_unchanged_periods(tmp_path):
+    path = str(tmp_path / "out.xlsx")
+    first = _run(path, _reconciliation(10001))
+    assert first["Discrepancies"]["scope"].astype(str).tolist() == ["202401"]
+
+    # 1月未变化、只重算2月：1月的差异沿用，结算汇总行的差异按本次结果
+    reconciliation = Reconciliation(order_cells=pd.DataFrame({"posted-date": [], "amount": []}))
+    reconciliation.add_settlement_cents(pd.Series({"456": 300}), pd.Series(dtype="int64"))
+    sheets = _run(path, reconciliation, update=True, kept=["202401_"])
+    discrepancies = sheets["Discrepancies"].astype({"scope": str})
+    assert discrepancies[["check", "scope", "difference"]].to_dict("records") == [
+        {"check": "settlement", "scope": "456", "difference": -3.0},
+        {"check": "order_details", "scope": "202401", "difference": 0.01},
+    ]
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+
+from processor.pipeline import PipelineError, read_settlement, run_pipeline
+from processor.results_db import query
+
+START, END = datetime(2024, 1, 1), datetime(2024, 2, 29)
+
+
+def _rows_per_month(db):
+    counts = query('SELECT month, COUNT(*) AS n FROM order_details GROUP BY month ORDER BY month', path=db)
+    return dict(zip(counts["month"], counts["n"]))
+
+
+def test_rerun_replaces_only_the_reprocessed_months(make_settlement, lookups, tmp_path):
+    db = str(tmp_path / "results.sqlite")
+    path = make_settlement("us.txt", rows=3000, days=60)
+    run_pipeline(path, str(tmp_path / "first.xlsx"), START, END, results_db=db)
+    first = _rows_per_month(db)
+    assert set(first) == {"2024-01", "2024-02"}
+
+    # 同一范围重跑：每个月先删除再写入，不重复
+    run_pipeline(path, str(tmp_path / "again.xlsx"), START, END, results_db=db)
+    assert _rows_per_month(db) == first
+
+    # 2月的数据变少后重跑只有2月变化
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    columns = lines[0].split("\t")
+    date_col, type_col = columns.index("posted-date"), columns.index("transaction-type")
+    cells = [line.split("\t") for line in lines[2:] if line]
+    kept = ["\t".join(c) for c in cells if not (c[type_col] == "Order" and c[date_col] >= "2024-02-15")]
+    trimmed = tmp_path / "trimmed.txt"
+    trimmed.write_text("\n".join(lines[:2] + kept), encoding="utf-8")
+    run_pipeline(str(trimmed), str(tmp_path / "trimmed.xlsx"), START, END, results_db=db)
+    rows = _rows_per_month(db)
+    assert rows["2024-01"] == first["2024-01"]
+    assert 0 < rows["2024-02"] < first["2024-02"]
+    stored = query('SELECT COUNT(*) AS n FROM order_details', path=db)["n"][0]
+    assert stored == rows["2024-01"] + rows["2024-02"]
+
+
+def test_single_month_run_needs_data_within_the_month(make_settlement, lookups, tmp_path):
+    db = str(tmp_path / "results.sqlite")
+    spanning = make_settlement("spanning.txt", rows=2000, days=60)
+    with pytest.raises(PipelineError):
+        run_pipeline(spanning, str(tmp_path / "jan.xlsx"), datetime(2024, 1, 1), datetime(2024, 1, 31),
+                     results_db=db)
+
+    january = make_settlement("january.txt", rows=2000, days=31)
+    assert read_settlement(january)["posted-date"].dt.month.unique().tolist() == [1]
+    run_pipeline(january, str(tmp_path / "jan.xlsx"), datetime(2024, 1, 1), datetime(2024, 1, 31), results_db=db)
+    assert list(_rows_per_month(db)) == ["2024-01"]
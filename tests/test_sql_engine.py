@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from processor.pipeline import run_pipeline
+
+pytest.importorskip("duckdb")
+from processor.sql_engine import run_sql_pipeline  # noqa: E402
+
+START, END = datetime(2024, 1, 1), datetime(2024, 2, 29)
+
+
+def _shift_total_amount(path, delta):
+    """修改报告汇总行的 total-amount，模拟汇总与明细不一致"""
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    columns = lines[0].split("\t")
+    header = lines[1].split("\t")
+    index = columns.index("total-amount")
+    header[index] = f"{float(header[index]) + delta:.2f}"
+    lines[1] = "\t".join(header)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def test_sql_engine_reconciles_like_memory_mode(make_settlement, lookups, tmp_path):
+    path = make_settlement("us.txt", rows=3000)
+    _shift_total_amount(path, 1.25)
+    run_pipeline(path, str(tmp_path / "memory.xlsx"), START, END)
+    run_sql_pipeline([path], str(tmp_path / "sql.xlsx"), START, END)
+
+    expected = pd.read_excel(tmp_path / "memory.xlsx", sheet_name="Discrepancies")
+    actual = pd.read_excel(tmp_path / "sql.xlsx", sheet_name="Discrepancies")
+    assert expected["check"].tolist() == ["settlement"]
+    assert expected["difference"].tolist() == [-1.25]
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_sql_engine_warns_about_oversized_sheets(make_settlement, lookups, tmp_path, monkeypatch, caplog):
+    # 把Excel行数上限调小，两种模式应对同样的周期提前给出拆分提示
+    monkeypatch.setattr("processor.pipeline.EXCEL_MAX_ROWS", 200)
+    monkeypatch.setattr("processor.sql_engine.EXCEL_MAX_ROWS", 200)
+    path = make_settlement("us.txt", rows=3000)
+
+    def warnings():
+        messages = [r.getMessage() for r in caplog.records if "超过Excel单表上限" in r.getMessage()]
+        caplog.clear()
+        return messages
+
+    run_pipeline(path, str(tmp_path / "memory.xlsx"), START, END)
+    expected = warnings()
+    run_sql_pipeline([path], str(tmp_path / "sql.xlsx"), START, END)
+    assert [m.split(" ")[0] for m in expected] == ["202401_order_details", "202402_order_details"]
+    assert warnings() == expected
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processor.backends import ORDER_KEYS
+from processor.data_processing import fill_missing_qty
+from processor.pipeline import read_settlement
+
+pytest.importorskip("pyarrow")
+from processor.store import SettlementStore  # noqa: E402
+
+
+def test_reingest_adds_only_new_rows(make_settlement, tmp_path):
+    first = make_settlement("first.txt", rows=3000, settlement_id="123", seed=1)
+    later = make_settlement("later.txt", rows=500, settlement_id="123", seed=2)
+    store = SettlementStore(str(tmp_path / "store"))
+
+    rows = len(read_settlement(first))
+    assert store.ingest(first) == rows
+    assert store.ingest(first) == 0
+
+    # 同一settlement重新下载：内容哈希不同，已导入的行不重复追加
+    with open(first, encoding="utf-8") as f:
+        text = f.read()
+    redownload = tmp_path / "redownload.txt"
+    redownload.write_text(text + "\n", encoding="utf-8")
+    assert store.ingest(str(redownload)) == 0
+
+    # 追加了新明细行的版本只导入新增的行
+    with open(later, encoding="utf-8") as f:
+        extra = f.read().split("\n", 2)[2]
+    grown = tmp_path / "grown.txt"
+    grown.write_text(text + extra, encoding="utf-8")
+    new_rows = len(read_settlement(later))
+    assert store.ingest(str(grown)) == new_rows
+
+    loaded = SettlementStore(str(tmp_path / "store")).load()
+    expected = read_settlement(str(grown))
+    assert len(loaded) == rows + new_rows == len(expected)
+    assert loaded["amount"].sum() == pytest.approx(pd.to_numeric(expected["amount"]).sum())
+
+
+def test_qty_history_fills_quantities_from_other_settlements(make_settlement, tmp_path):
+    # 本期数据中没有数量的订单行，按 (order-id, shipment-id, sku) 从已导入的结算中补充；都找不到时为0
+    path = make_settlement("history.txt", rows=2000, settlement_id="123")
+    store = SettlementStore(str(tmp_path / "store"))
+    store.ingest(path)
+
+    raw = read_settlement(path)
+    principal = raw[(raw["transaction-type"] == "Order") & (raw["amount-type"] == "ItemPrice")
+                    & (raw["amount-description"] == "Principal")]
+    orders = principal.groupby(ORDER_KEYS, as_index=False)["quantity-purchased"].sum()
+    unknown = pd.DataFrame({"order-id": ["X"], "shipment-id": ["Y"], "sku": ["Z"]})
+    merged = pd.concat([orders[ORDER_KEYS], unknown], ignore_index=True).assign(QTY=np.nan)
+
+    filled = fill_missing_qty(merged, raw.iloc[:0], store.qty_history())
+    assert filled["QTY"].tolist() == orders["quantity-purchased"].tolist() + [0]
+
+
+class _Crash(Exception):
+    pass
+
+
+def _crash(*args, **kwargs):
+    raise _Crash
+
+
+@pytest.mark.parametrize("step", ["_save_manifest", "_update_qty_index"])
+def test_interrupted_ingest_leaves_no_duplicates(make_settlement, tmp_path, monkeypatch, step):
+    # 清单提交前退出（暂存文件残留）或提交后退出（索引未更新），重新打开并导入后数据与索引都不重复
+    path = make_settlement("settlement.txt", rows=2000, settlement_id="123")
+    root = str(tmp_path / "store")
+    with monkeypatch.context() as patch:
+        patch.setattr(SettlementStore, step, _crash)
+        patch.setattr(SettlementStore, "_remove", lambda self, name: None)
+        with pytest.raises(_Crash):
+            SettlementStore(root).ingest(path)
+
+    store = SettlementStore(root)
+    store.ingest(path)
+    expected = read_settlement(path)
+    assert len(store.load()) == len(expected)
+    assert len(store.order_index()) == expected["order-id"].notna().sum()
+    index_df = pd.read_parquet(tmp_path / "store" / "qty_index.parquet")
+    pd.testing.assert_frame_equal(index_df, store.rebuild_qty_index())
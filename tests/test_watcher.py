@@ -0,0 +1,21 @@
+import os
+
+from processor.memo import MonthCache
+from processor.watcher import watch_folder
+
+
+def test_watch_passes_run_options_per_file(make_settlement, lookups, tmp_path):
+    make_settlement("a.txt", rows=2000, days=60, seed=1)
+    make_settlement("b.txt", rows=2000, days=60, seed=2)
+    caches = []
+
+    def run_options():
+        caches.append(MonthCache(root=str(tmp_path / "month_cache")))
+        return {"month_cache": caches[-1]}
+
+    assert watch_folder(str(tmp_path), once=True, run_options=run_options) == 2
+    assert os.path.exists(tmp_path / "a.xlsx") and os.path.exists(tmp_path / "b.xlsx")
+    # 每个文件各自构建参数，分月结果写入缓存
+    assert len(caches) == 2
+    assert all(cache.misses == 2 for cache in caches)
+    assert len([name for name in os.listdir(tmp_path / "month_cache") if name.endswith(".pkl")]) == 4
@@ -0,0 +1,92 @@
+import zipfile
+
+import pandas as pd
+import pytest
+
+from processor.workbook import WorkbookOutput, sheet_count, sheet_parts
+
+
+@pytest.mark.parametrize("workers", [None, 1])
+def test_failed_tables_are_skipped(tmp_path, workers):
+    # _period_sheets 在某一步失败时返回 None 的表，保存时应跳过而不是报错
+    path = str(tmp_path / "out.xlsx")
+    output = WorkbookOutput(path, workers=workers)
+    output.prepare(monthly=True)
+    order = pd.DataFrame({"order-id": ["A"], "Product Amount": [1.5]})
+    output.write_period("202401_", "key", {"202401_qty": None, "202401_order": order})
+    output.close()
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == ["202401_order"]
+    pd.testing.assert_frame_equal(sheets["202401_order"], order)
+
+
+def test_sheet_parts_split_at_row_limit():
+    # 每张表含表头最多 max_rows 行：7行数据按每表3行拆成 order、order_2、order_3
+    df = pd.DataFrame({"order-id": list("ABCDEFG")})
+    parts = sheet_parts("202401_order", df, max_rows=4)
+    assert [name for name, _ in parts] == ["202401_order", "202401_order_2", "202401_order_3"]
+    assert [part["order-id"].tolist() for _, part in parts] == [["A", "B", "C"], ["D", "E", "F"], ["G"]]
+    assert sheet_count(len(df), max_rows=4) == 3
+
+    assert sheet_parts("202401_order", df.iloc[:3], max_rows=4)[0][0] == "202401_order"
+    assert sheet_count(3, max_rows=4) == sheet_count(0, max_rows=4) == 1
+
+
+def _zip_parts(path):
+    with zipfile.ZipFile(path) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def _write(path, keys, update=False, workers=None, changed=()):
+    """写两个月的订单表；changed 中的月份金额加1，模拟该月数据变化"""
+    output = WorkbookOutput(path, update=update, workers=workers)
+    output.prepare(monthly=True)
+    previous = output.unchanged()
+    output.write_summary([("2024-01", pd.DataFrame({"Total": [3.75]}))])
+    for month in ("202401", "202402"):
+        prefix = f"{month}_"
+        if previous.get(prefix) == keys[prefix]:
+            output.write_period(prefix, keys[prefix], None)
+            continue
+        order = pd.DataFrame({
+            "order-id": [f"{month}-A", f"{month}-B"],
+            "posted-date": pd.to_datetime([f"{month[:4]}-{month[4:]}-03", f"{month[:4]}-{month[4:]}-20"]),
+            "Product Amount": [1.5 + (month in changed), 2.25],
+        })
+        output.write_period(prefix, keys[prefix], {f"{prefix}order": order})
+    output.close()
+    return previous
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_update_keeps_unchanged_sheets(tmp_path, workers):
+    # 原工作簿由openpyxl（workers=1）或并行写出（workers=2）生成，增量更新只替换变化的表
+    path = str(tmp_path / "out.xlsx")
+    keys = {"202401_": "k1", "202402_": "k2"}
+    _write(path, keys, workers=workers)
+    before = _zip_parts(path)
+    expected = pd.read_excel(path, sheet_name=None)
+
+    assert _write(path, keys, update=True) == keys
+    after = _zip_parts(path)
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == list(expected)
+    for name in expected:
+        pd.testing.assert_frame_equal(sheets[name], expected[name])
+    for name in before:
+        if name.startswith("xl/worksheets/") and name in after:
+            assert after[name] == before[name]
+
+    # 2月变化：只重写2月的表，日期列沿用日期格式；重复更新不增加样式
+    changed = dict(keys, **{"202402_": "k2b"})
+    _write(path, changed, update=True, changed=("202402",))
+    styles = _zip_parts(path)["xl/styles.xml"]
+    _write(path, dict(changed, **{"202402_": "k2c"}), update=True, changed=("202402",))
+    assert _zip_parts(path)["xl/styles.xml"] == styles
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    pd.testing.assert_frame_equal(sheets["202401_order"], expected["202401_order"])
+    assert sheets["202402_order"]["Product Amount"].tolist() == [2.5, 2.25]
+    assert sheets["202402_order"]["posted-date"].tolist() == expected["202402_order"]["posted-date"].tolist()
+    assert WorkbookOutput(path, update=True).unchanged() == {"202401_": "k1", "202402_": "k2c"}
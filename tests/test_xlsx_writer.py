@@ -0,0 +1,46 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from processor.xlsx_writer import write_workbook
+
+
+def test_parallel_writer_reads_back_equal(tmp_path):
+    path = str(tmp_path / "out.xlsx")
+    order = pd.DataFrame({
+        "order-id": ["113-1", "113-2 <&> \"x\"", "", "113-4"],
+        "posted-date": pd.to_datetime(["2024-01-03", "2024-01-15", None, "2024-01-31"]),
+        "QTY": pd.array([1, 2, None, 4], dtype="Int64"),
+        "Total_amount": [12.5, -3.25, np.nan, 1e6 + 0.01],
+        "master_sku": ["M-1", None, "M-3", "SKU 中文"],
+    })
+    qty = pd.DataFrame({"sku": ["A", "B"], "quantity-purchased": [3, 7]})
+    first = pd.DataFrame({"amount-type": ["ItemPrice", "Grand Total"], "Order": [10.0, 10.0]})
+    second = pd.DataFrame({"amount-type": ["ItemFees", "Grand Total"], "Order": [-1.255, -1.255]})
+    sheets = {
+        "Summary": [(0, first, "%.2f"), (len(first) + 3, second, "%.2f")],
+        "202401_qty": [(0, qty, None)],
+        "202401_order": [(0, order, None)],
+    }
+    write_workbook(path, sheets, workers=2, properties={"amazon_processor_key_202401_": "abc"})
+
+    book = pd.read_excel(path, sheet_name=None, keep_default_na=False, na_values=[""])
+    assert list(book) == list(sheets)
+    pd.testing.assert_frame_equal(book["202401_qty"], qty)
+
+    actual = book["202401_order"]
+    assert actual["order-id"].fillna("").tolist() == order["order-id"].tolist()
+    assert actual["posted-date"].tolist() == order["posted-date"].tolist()
+    assert actual["QTY"].tolist()[:2] == [1, 2] and pd.isna(actual["QTY"][2])
+    np.testing.assert_array_equal(actual["Total_amount"], order["Total_amount"])
+    assert actual["master_sku"].tolist()[2:] == ["M-3", "SKU 中文"]
+
+    # Summary 的两个透视表间隔3行，float_format 按两位小数写出
+    summary = pd.read_excel(path, sheet_name="Summary", header=None)
+    assert summary.iloc[0].tolist() == ["amount-type", "Order"]
+    assert summary.iloc[1].tolist() == ["ItemPrice", 10.0]
+    assert summary.iloc[5].tolist() == ["amount-type", "Order"]
+    assert summary.iloc[6].tolist() == ["ItemFees", -1.25]
+
+    props = openpyxl.load_workbook(path).custom_doc_props
+    assert {prop.name: prop.value for prop in props} == {"amazon_processor_key_202401_": "abc"}